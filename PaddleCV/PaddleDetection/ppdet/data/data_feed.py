@@ -27,13 +27,14 @@ from ppdet.data.reader import Reader
 from ppdet.data.transform.operators import (
     DecodeImage, MixupImage, NormalizeBox, NormalizeImage, RandomDistort,
     RandomFlipImage, RandomInterpImage, ResizeImage, ExpandImage, CropImage,
-    Permute, MultiscaleTestResize)
+    Permute, MultiscaleTestResize, DecodeResizeNormalize)
 from ppdet.data.transform.arrange_sample import (
     ArrangeRCNN, ArrangeEvalRCNN, ArrangeTestRCNN, ArrangeSSD, ArrangeEvalSSD,
     ArrangeTestSSD, ArrangeYOLO, ArrangeEvalYOLO, ArrangeTestYOLO)
 
 __all__ = [
-    'PadBatch', 'MultiScale', 'RandomShape', 'PadMSTest', 'DataSet',
+    'PadBatch', 'MultiScale', 'RandomShape', 'PadMSTest', 'NormalizePadBatch',
+    'DataSet',
     'CocoDataSet', 'DataFeed', 'TrainFeed', 'EvalFeed', 'FasterRCNNTrainFeed',
     'MaskRCNNTrainFeed', 'FasterRCNNEvalFeed', 'MaskRCNNEvalFeed',
     'FasterRCNNTestFeed', 'MaskRCNNTestFeed', 'SSDTrainFeed', 'SSDEvalFeed',
@@ -97,12 +98,16 @@ def create_reader(feed, max_iter=0, args_path=None, my_source=None):
     bufsize = getattr(feed, 'bufsize', 10)
     use_process = getattr(feed, 'use_process', False)
     memsize = getattr(feed, 'memsize', '3G')
+    zero_copy = getattr(feed, 'zero_copy', False)
     transform_config = {
         'WORKER_CONF': {
             'bufsize': bufsize,
             'worker_num': feed.num_workers,
             'use_process': use_process,
-            'memsize': memsize
+            'memsize': memsize,
+            'zero_copy': zero_copy,
+            'ordered': getattr(feed, 'ordered', False),
+            'seed': getattr(feed, 'seed', None)
         },
         'BATCH_SIZE': feed.batch_size,
         'DROP_LAST': feed.drop_last,
@@ -114,6 +119,9 @@ def create_reader(feed, max_iter=0, args_path=None, my_source=None):
     rand_shape = [t for t in batch_transforms if isinstance(t, RandomShape)]
     multi_scale = [t for t in batch_transforms if isinstance(t, MultiScale)]
     pad_ms_test = [t for t in batch_transforms if isinstance(t, PadMSTest)]
+    norm_pad = [
+        t for t in batch_transforms if isinstance(t, NormalizePadBatch)
+    ]
 
     if any(pad):
         transform_config['IS_PADDING'] = True
@@ -127,6 +135,11 @@ def create_reader(feed, max_iter=0, args_path=None, my_source=None):
         transform_config['ENABLE_MULTISCALE_TEST'] = True
         transform_config['NUM_SCALE'] = feed.num_scale
         transform_config['COARSEST_STRIDE'] = pad_ms_test[0].pad_to_stride
+    if any(norm_pad):
+        transform_config['IS_PADDING'] = True
+        if norm_pad[0].pad_to_stride != 0:
+            transform_config['COARSEST_STRIDE'] = norm_pad[0].pad_to_stride
+        transform_config['NORMALIZE_BATCH'] = norm_pad[0].__dict__.copy()
 
     if hasattr(inspect, 'getfullargspec'):
         argspec = inspect.getfullargspec
@@ -205,6 +218,53 @@ class PadMSTest(object):
         self.pad_to_stride = pad_to_stride
 
 
+@serializable
+class NormalizePadBatch(object):
+    """
+    Distort, normalize and pad a batch of uint8 HWC RGB images at once
+    with numpy, used in place of the sample transforms 'RandomDistort',
+    'NormalizeImage' and 'Permute' followed by 'PadBatch'
+
+    Args:
+        pad_to_stride (int): pad to multiple of strides, e.g., 32
+        mean (list): the pixel mean
+        std (list): the pixel variance
+        is_scale (bool): whether to scale the image to [0,1]
+        to_bgr (bool): whether to convert RGB to BGR
+        distort (bool): whether to randomly distort the images
+        brightness (list): lower and upper bound of brightness factor
+        contrast (list): lower and upper bound of contrast factor
+        saturation (list): lower and upper bound of saturation factor
+        hue (list): lower and upper bound of hue delta
+        distort_prob (float): the probability of each distortion
+    """
+
+    def __init__(self,
+                 pad_to_stride=0,
+                 mean=[0.485, 0.456, 0.406],
+                 std=[1, 1, 1],
+                 is_scale=True,
+                 to_bgr=False,
+                 distort=False,
+                 brightness=[0.5, 1.5],
+                 contrast=[0.5, 1.5],
+                 saturation=[0.5, 1.5],
+                 hue=[-18, 18],
+                 distort_prob=0.5):
+        super(NormalizePadBatch, self).__init__()
+        self.pad_to_stride = pad_to_stride
+        self.mean = mean
+        self.std = std
+        self.is_scale = is_scale
+        self.to_bgr = to_bgr
+        self.distort = distort
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+        self.distort_prob = distort_prob
+
+
 @serializable
 class DataSet(object):
     """
@@ -305,6 +365,12 @@ class DataFeed(object):
         use_process (bool): use process or thread as workers
         memsize (str): size of shared memory used in result queue
                         when 'use_process' is True, default to '3G'
+        zero_copy (bool): pass ndarray fields of samples by shared memory
+                        without pickling when 'use_process' is True
+        ordered (bool): return samples of workers in source order
+        seed (int): seed to make shuffling and sample transforms
+                        deterministic when 'ordered' is True, needs
+                        'use_process'
     """
     __category__ = 'data'
 
@@ -324,7 +390,10 @@ class DataFeed(object):
                  use_process=False,
                  memsize=None,
                  use_padded_im_info=False,
-                 class_aware_sampling=False):
+                 class_aware_sampling=False,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         super(DataFeed, self).__init__()
         self.fields = fields
         self.image_shape = image_shape
@@ -339,6 +408,9 @@ class DataFeed(object):
         self.bufsize = bufsize
         self.use_process = use_process
         self.memsize = memsize
+        self.zero_copy = zero_copy
+        self.ordered = ordered
+        self.seed = seed
         self.dataset = dataset
         self.use_padded_im_info = use_padded_im_info
         self.class_aware_sampling = class_aware_sampling
@@ -365,7 +437,10 @@ class TrainFeed(DataFeed):
                  num_workers=2,
                  bufsize=10,
                  use_process=True,
-                 memsize=None):
+                 memsize=None,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         super(TrainFeed, self).__init__(
             dataset,
             fields,
@@ -380,7 +455,10 @@ class TrainFeed(DataFeed):
             num_workers=num_workers,
             bufsize=bufsize,
             use_process=use_process,
-            memsize=memsize)
+            memsize=memsize,
+            zero_copy=zero_copy,
+            ordered=ordered,
+            seed=seed)
 
 
 @register
@@ -472,7 +550,10 @@ class FasterRCNNTrainFeed(DataFeed):
                  num_workers=2,
                  use_process=False,
                  memsize=None,
-                 class_aware_sampling=False):
+                 class_aware_sampling=False,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         # XXX this should be handled by the data loader, since `fields` is
         # given, just collect them
         sample_transforms.append(ArrangeRCNN())
@@ -490,7 +571,10 @@ class FasterRCNNTrainFeed(DataFeed):
             num_workers=num_workers,
             use_process=use_process,
             memsize=memsize,
-            class_aware_sampling=class_aware_sampling)
+            class_aware_sampling=class_aware_sampling,
+            zero_copy=zero_copy,
+            ordered=ordered,
+            seed=seed)
         # XXX these modes should be unified
         self.mode = 'TRAIN'
 
@@ -619,7 +703,10 @@ class MaskRCNNTrainFeed(DataFeed):
                  drop_last=False,
                  num_workers=2,
                  use_process=False,
-                 use_padded_im_info=False):
+                 use_padded_im_info=False,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         sample_transforms.append(ArrangeRCNN(is_mask=True))
         super(MaskRCNNTrainFeed, self).__init__(
             dataset,
@@ -632,7 +719,10 @@ class MaskRCNNTrainFeed(DataFeed):
             samples=samples,
             drop_last=drop_last,
             num_workers=num_workers,
-            use_process=use_process)
+            use_process=use_process,
+            zero_copy=zero_copy,
+            ordered=ordered,
+            seed=seed)
         self.mode = 'TRAIN'
 
 
@@ -771,7 +861,10 @@ class SSDTrainFeed(DataFeed):
                  num_workers=8,
                  bufsize=10,
                  use_process=True,
-                 memsize=None):
+                 memsize=None,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         sample_transforms.append(ArrangeSSD())
         super(SSDTrainFeed, self).__init__(
             dataset,
@@ -786,7 +879,10 @@ class SSDTrainFeed(DataFeed):
             num_workers=num_workers,
             bufsize=bufsize,
             use_process=use_process,
-            memsize=None)
+            memsize=None,
+            zero_copy=zero_copy,
+            ordered=ordered,
+            seed=seed)
         self.mode = 'TRAIN'
 
 
@@ -930,7 +1026,10 @@ class YoloTrainFeed(DataFeed):
                  memsize=None,
                  num_max_boxes=50,
                  mixup_epoch=250,
-                 class_aware_sampling=False):
+                 class_aware_sampling=False,
+                 zero_copy=False,
+                 ordered=False,
+                 seed=None):
         sample_transforms.append(ArrangeYOLO())
         super(YoloTrainFeed, self).__init__(
             dataset,
@@ -947,7 +1046,10 @@ class YoloTrainFeed(DataFeed):
             bufsize=bufsize,
             use_process=use_process,
             memsize=memsize,
-            class_aware_sampling=class_aware_sampling)
+            class_aware_sampling=class_aware_sampling,
+            zero_copy=zero_copy,
+            ordered=ordered,
+            seed=seed)
         self.num_max_boxes = num_max_boxes
         self.mixup_epoch = mixup_epoch
         self.mode = 'TRAIN'
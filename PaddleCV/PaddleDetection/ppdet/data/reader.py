@@ -80,6 +80,7 @@ class Reader(object):
             'use_padded_im_info',
             'enable_multiscale_test',
             'num_scale',
+            'normalize_batch',
         }
         bm_config = {
             key: value
@@ -29,6 +29,7 @@ import collections
 import pickle as pkl
 import numpy as np
 from .roidb_source import RoiDbSource
+from .mmap_roidb import MmapRoiDb
 
 
 class ClassAwareSamplingRoiDbSource(RoiDbSource):
@@ -81,9 +82,9 @@ class ClassAwareSamplingRoiDbSource(RoiDbSource):
         if self._epoch < 0:
             self.reset()
 
-        _pos = np.random.choice(
+        _pos = self._np_rand.choice(
             self._samples, 1, replace=False, p=self._img_weights)[0]
-        sample = copy.deepcopy(self._roidb[_pos])
+        sample = self._get_record(_pos)
 
         if self._load_img:
             sample['image'] = self._load_image(sample['im_file'])
@@ -92,27 +93,33 @@ class ClassAwareSamplingRoiDbSource(RoiDbSource):
 
         return sample
 
+    def _class_table(self):
+        """ image index and class id of every ground truth box
+        """
+        num_imgs = len(self._roidb)
+        if isinstance(self._roidb, MmapRoiDb):
+            box_offset = np.asarray(self._roidb.array('box_offset'))
+            num_boxes = np.diff(box_offset[:num_imgs + 1])
+            classes = self._roidb.array('gt_class')[:box_offset[num_imgs]]
+        else:
+            gt_classes = [np.reshape(r['gt_class'], -1) for r in self._roidb]
+            num_boxes = [len(c) for c in gt_classes]
+            classes = np.concatenate(gt_classes) if num_imgs > 0 else []
+        img_idx = np.repeat(np.arange(num_imgs), num_boxes)
+        return img_idx, np.asarray(classes, dtype=np.int64).reshape(-1)
+
     def _calc_img_weights(self):
         """ calculate the probabilities of each sample
         """
-        imgs_cls = []
-        num_per_cls = {}
-        img_weights = []
-        for i, roidb in enumerate(self._roidb):
-            img_cls = set(
-                [k for cls in self._roidb[i]['gt_class'] for k in cls])
-            imgs_cls.append(img_cls)
-            for c in img_cls:
-                if c not in num_per_cls:
-                    num_per_cls[c] = 1
-                else:
-                    num_per_cls[c] += 1
-
-        for i in range(len(self._roidb)):
-            weights = 0
-            for c in imgs_cls[i]:
-                weights += 1 / num_per_cls[c]
-            img_weights.append(weights)
+        num_imgs = len(self._roidb)
+        img_idx, classes = self._class_table()
+        # each class of an image is counted once
+        num_cls = classes.max() + 1 if len(classes) > 0 else 1
+        img_cls = np.unique(img_idx * num_cls + classes)
+        img_idx, classes = img_cls // num_cls, img_cls % num_cls
+        num_per_cls = np.bincount(classes, minlength=num_cls)
+        img_weights = np.bincount(
+            img_idx, weights=1. / num_per_cls[classes], minlength=num_imgs)
         # Probabilities sum to 1
         img_weights = img_weights / np.sum(img_weights)
         return img_weights
@@ -92,7 +92,8 @@ def load(fname,
 
     Args:
         fnames (str): file name for data record, eg:
-            instances_val2017.json or COCO17_val2017.roidb
+            instances_val2017.json, COCO17_val2017.roidb or
+            COCO17_val2017.mroidb
         samples (int): number of samples to load, default to all
         with_background (bool): whether load background as a class.
                                 default True.
@@ -115,7 +116,12 @@ def load(fname,
 
     """
 
-    if fname.endswith('.roidb'):
+    if fname.rstrip('/').endswith('.mroidb'):
+        # fields of memory mapped records are checked when saved
+        from . import mmap_roidb
+        records, cname2cid = mmap_roidb.load_mmap_roidb(fname, samples)
+        return (records, cname2cid) if with_cat2id else records
+    elif fname.endswith('.roidb'):
         records, cname2cid = load_roidb(fname, samples)
     elif fname.endswith('.json'):
         from . import coco_loader
@@ -0,0 +1,228 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# function:
+#   columnar on-disk roidb which is memory mapped instead of unpickled,
+#   records are built lazily on indexing and the pages of the mapped
+#   files are shared by all processes reading the same roidb
+#
+# layout of a 'xxx.mroidb' directory:
+#   meta.pkl            pickled dict of version, cname2cid and fields
+#   im_id.npy           int64, [N]
+#   h.npy, w.npy        float64, [N]
+#   im_file.npy         uint8, utf-8 encoded file names of all images
+#   im_file_offset.npy  int64, [N + 1], offsets into 'im_file.npy'
+#   box_offset.npy      int64, [N + 1], offsets into the box arrays
+#   gt_bbox.npy         float32, [M, 4]
+#   gt_class.npy        int32, [M, 1]
+#   is_crowd.npy        int32, [M, 1]
+#   gt_score.npy        float32, [M, 1], optional
+#   difficult.npy       int32, [M, 1], optional
+#   gt_poly.npy         uint8, pickled 'gt_poly' of all images
+#   gt_poly_offset.npy  int64, [N + 1], offsets into 'gt_poly.npy'
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import logging
+import pickle as pkl
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['MmapRoiDb', 'save_mmap_roidb', 'load_mmap_roidb']
+
+MMAP_ROIDB_VERSION = 1
+MMAP_ROIDB_SUFFIX = '.mroidb'
+
+# per box fields with their dtype, the last two are optional
+BOX_FIELDS = [('gt_bbox', np.float32), ('gt_class', np.int32),
+              ('is_crowd', np.int32), ('gt_score', np.float32),
+              ('difficult', np.int32)]
+OPTIONAL_BOX_FIELDS = ['gt_score', 'difficult']
+
+
+def _offsets(lengths):
+    offsets = np.zeros((len(lengths) + 1, ), dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _im_id(im_id):
+    if isinstance(im_id, int):
+        return im_id
+    return int(np.asarray(im_id).ravel()[0])
+
+
+def save_mmap_roidb(records, cname2cid, path):
+    """ save 'records' as a columnar roidb in directory 'path'
+
+    Args:
+        records (list of dict): records returned by 'loader.load'
+        cname2cid (dict): the mapping of category name to id
+        path (str): directory to save to, should end with '.mroidb'
+
+    Returns:
+        number of saved records
+    """
+    assert path.endswith(MMAP_ROIDB_SUFFIX), \
+        'mmap roidb path should end with {}'.format(MMAP_ROIDB_SUFFIX)
+    assert len(records) > 0, 'no records to save'
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    fields = [f for f, _ in BOX_FIELDS if f not in OPTIONAL_BOX_FIELDS or
+              all(f in rec for rec in records)]
+
+    def _save(name, arr):
+        np.save(os.path.join(path, name + '.npy'), arr)
+
+    _save('im_id', np.array([_im_id(r['im_id']) for r in records], np.int64))
+    _save('h', np.array([r['h'] for r in records], np.float64))
+    _save('w', np.array([r['w'] for r in records], np.float64))
+
+    names = [r['im_file'].encode('utf-8') for r in records]
+    _save('im_file', np.frombuffer(b''.join(names), dtype=np.uint8))
+    _save('im_file_offset', _offsets([len(n) for n in names]))
+
+    num_boxes = [len(r['gt_bbox']) for r in records]
+    _save('box_offset', _offsets(num_boxes))
+    for field, dtype in BOX_FIELDS:
+        if field not in fields:
+            continue
+        width = 4 if field == 'gt_bbox' else 1
+        arr = np.zeros((sum(num_boxes), width), dtype=dtype)
+        start = 0
+        for rec, num in zip(records, num_boxes):
+            if num > 0:
+                arr[start:start + num] = np.reshape(rec[field], (num, width))
+            start += num
+        _save(field, arr)
+
+    polys = [pkl.dumps(r['gt_poly'], protocol=2) for r in records]
+    _save('gt_poly', np.frombuffer(b''.join(polys), dtype=np.uint8))
+    _save('gt_poly_offset', _offsets([len(p) for p in polys]))
+
+    meta = {
+        'version': MMAP_ROIDB_VERSION,
+        'cname2cid': cname2cid,
+        'fields': fields
+    }
+    with open(os.path.join(path, 'meta.pkl'), 'wb') as f:
+        pkl.dump(meta, f, protocol=2)
+    logger.info('saved {} records with {} boxes to {}'.format(
+        len(records), sum(num_boxes), path))
+    return len(records)
+
+
+class MmapRoiDb(object):
+    """ read only list like view of a columnar roidb saved by
+        'save_mmap_roidb', each indexing builds a new record dict
+        whose arrays are copied out of the memory mapped files
+
+    Args:
+        path (str): directory of the mmap roidb
+        sample_num (int): number of records to use, -1 means all
+    """
+
+    def __init__(self, path, sample_num=-1):
+        self.path = path
+        with open(os.path.join(path, 'meta.pkl'), 'rb') as f:
+            meta = pkl.load(f)
+        assert meta['version'] == MMAP_ROIDB_VERSION, \
+            'unsupported mmap roidb version {}'.format(meta['version'])
+        self.cname2cid = meta['cname2cid']
+        self.fields = meta['fields']
+        self._arrays = None
+        size = len(self._load('im_id'))
+        if sample_num > 0 and sample_num < size:
+            size = sample_num
+        self._size = size
+
+    def _load(self, name):
+        return np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+
+    def _open(self):
+        names = ['im_id', 'h', 'w', 'im_file', 'im_file_offset', 'box_offset',
+                 'gt_poly', 'gt_poly_offset'] + self.fields
+        self._arrays = {name: self._load(name) for name in names}
+
+    def array(self, name):
+        """ memory mapped array 'name' of the layout, eg: 'gt_class'
+        """
+        if self._arrays is None:
+            self._open()
+        return self._arrays[name]
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for i in range(self._size):
+            yield self[i]
+
+    def __getstate__(self):
+        # memory maps are reopened lazily after unpickling
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def im_id(self, idx):
+        return int(self.array('im_id')[idx])
+
+    def im_file(self, idx):
+        offset = self.array('im_file_offset')
+        data = self.array('im_file')[offset[idx]:offset[idx + 1]]
+        return data.tobytes().decode('utf-8')
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._size
+        if idx < 0 or idx >= self._size:
+            raise IndexError('record index {} out of range'.format(idx))
+
+        offset = self.array('gt_poly_offset')
+        poly = self.array('gt_poly')[offset[idx]:offset[idx + 1]]
+        rec = {
+            'im_file': self.im_file(idx),
+            'im_id': np.array([self.im_id(idx)]),
+            'h': float(self.array('h')[idx]),
+            'w': float(self.array('w')[idx]),
+            'gt_poly': pkl.loads(poly.tobytes()),
+        }
+        offset = self.array('box_offset')
+        start, end = offset[idx], offset[idx + 1]
+        for field in self.fields:
+            rec[field] = np.array(self.array(field)[start:end])
+        return rec
+
+
+def load_mmap_roidb(path, sample_num=-1):
+    """ open a columnar roidb saved by 'save_mmap_roidb'
+
+    Args:
+        path (str): directory of the mmap roidb
+        sample_num (int): number of samples to load, -1 means all
+
+    Returns:
+        (records, cname2cid), 'records' is a 'MmapRoiDb'
+    """
+    assert path.rstrip('/').endswith(MMAP_ROIDB_SUFFIX), \
+        'invalid mmap roidb [%s]' % (path)
+    records = MmapRoiDb(path.rstrip('/'), sample_num)
+    return records, records.cname2cid
@@ -26,7 +26,9 @@ import random
 
 import copy
 import pickle as pkl
+import numpy as np
 from ..dataset import Dataset
+from .mmap_roidb import MmapRoiDb
 
 
 class RoiDbSource(Dataset):
@@ -67,6 +69,7 @@ class RoiDbSource(Dataset):
             assert os.path.isdir(image_dir), \
                     'image_dir {} is not a directory'.format(image_dir)
         self._roidb = None
+        self._indexes = None
         self._pos = -1
         self._drained = False
         self._samples = samples
@@ -77,6 +80,10 @@ class RoiDbSource(Dataset):
         self._with_background = with_background
         self.cname2cid = cname2cid
         self._imid2path = None
+        # random states of shuffling and sampling, the global ones unless
+        # replaced by set_random_state
+        self._rand = random
+        self._np_rand = np.random
 
     def __str__(self):
         return 'RoiDbSource(fname:%s,epoch:%d,size:%d,pos:%d)' \
@@ -90,16 +97,16 @@ class RoiDbSource(Dataset):
         if self._pos >= self._samples:
             self._drained = True
             raise StopIteration('%s no more data' % (str(self)))
-        sample = copy.deepcopy(self._roidb[self._pos])
+        sample = self._get_record(self._indexes[self._pos])
         if self._load_img:
             sample['image'] = self._load_image(sample['im_file'])
         else:
             sample['im_file'] = os.path.join(self._image_dir, sample['im_file'])
 
         if self._epoch < self._mixup_epoch:
-            mix_idx = random.randint(1, self._samples - 1)
+            mix_idx = self._rand.randint(1, self._samples - 1)
             mix_pos = (mix_idx + self._pos) % self._samples
-            sample['mixup'] = copy.deepcopy(self._roidb[mix_pos])
+            sample['mixup'] = self._get_record(self._indexes[mix_pos])
             if self._load_img:
                 sample['mixup']['image'] = \
                         self._load_image(sample['mixup']['im_file'])
@@ -109,6 +116,21 @@ class RoiDbSource(Dataset):
         self._pos += 1
         return sample
 
+    def set_random_state(self, rand, np_rand):
+        """ use 'rand' (random.Random) and 'np_rand' (np.random.RandomState)
+        instead of the global random states for shuffling and sampling
+        """
+        self._rand = rand
+        self._np_rand = np_rand
+
+    def _get_record(self, idx):
+        """ get a copy of record 'idx' which is safe to modify
+        """
+        if isinstance(self._roidb, MmapRoiDb):
+            # records of mmap roidb are built on every indexing
+            return self._roidb[idx]
+        return copy.deepcopy(self._roidb[idx])
+
     def _load(self):
         """ load data from file
         """
@@ -131,8 +153,12 @@ class RoiDbSource(Dataset):
             self._roidb = self._load()
 
         self._samples = len(self._roidb)
+        if self._indexes is None:
+            self._indexes = list(range(self._samples))
         if self._is_shuffle:
-            random.shuffle(self._roidb)
+            # shuffle indexes instead of records, so that the lazily
+            # indexed mmap roidb is supported
+            self._rand.shuffle(self._indexes)
 
         if self._epoch < 0:
             self._epoch = 0
@@ -162,6 +188,12 @@ class RoiDbSource(Dataset):
         """return image id to image path map"""
         if self._imid2path is None:
             self._imid2path = {}
+            if isinstance(self._roidb, MmapRoiDb):
+                for i in range(len(self._roidb)):
+                    im_path = os.path.join(self._image_dir,
+                                           self._roidb.im_file(i))
+                    self._imid2path[self._roidb.im_id(i)] = im_path
+                return self._imid2path
             for record in self._roidb:
                 im_id = record['im_id']
                 im_id = im_id if isinstance(im_id, int) else im_id[0]
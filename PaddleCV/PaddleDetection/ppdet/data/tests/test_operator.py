@@ -151,6 +151,33 @@ class TestBase(unittest.TestCase):
         self.assertGreater(result['gt_bbox'].shape[0], 0)
         #self.assertGreater(result['gt_score'].shape[0], 0)
 
+    def test_ops_fused(self):
+        """test DecodeResizeNormalize is the same as the separate operators
+        """
+        norm = {
+            'mean': [0.485, 0.456, 0.406],
+            'std': [0.229, 0.224, 0.225],
+            'is_scale': True
+        }
+        ops_conf = [{
+            'op': 'DecodeImage'
+        }, {
+            'op': 'ResizeImage',
+            'target_size': 800,
+            'max_size': 1333
+        }, dict(
+            norm, op='NormalizeImage', is_channel_first=False), {
+                'op': 'Permute'
+            }]
+        result0 = tf.build_mapper(ops_conf)(self.sample.copy())
+        ops_conf = [
+            dict(
+                norm, op='DecodeResizeNormalize', target_size=800, max_size=1333)
+        ]
+        result1 = tf.build_mapper(ops_conf)(self.sample.copy())
+        self.assertTrue(np.array_equal(result0['image'], result1['image']))
+        self.assertTrue(np.array_equal(result0['im_info'], result1['im_info']))
+
 
 if __name__ == '__main__':
     unittest.main()
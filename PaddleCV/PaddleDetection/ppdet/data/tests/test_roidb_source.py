@@ -15,10 +15,17 @@ import os
 import time
 import unittest
 import sys
+import shutil
 import logging
+import random
+import tempfile
+
+import numpy as np
 
 import set_env
 from ppdet.data.source import build_source
+from ppdet.data.source import loader
+from ppdet.data.source.mmap_roidb import save_mmap_roidb
 
 
 class TestRoiDbSource(unittest.TestCase):
@@ -69,6 +76,49 @@ class TestRoiDbSource(unittest.TestCase):
         self.assertEqual(roi_source.epoch_id(), 1)
         self.assertTrue(roi_source.next() is not None)
 
+    def test_random_state(self):
+        """ test shuffling by the random state given by 'set_random_state'
+        """
+        orders = []
+        for _ in range(2):
+            roi_source = build_source(self.config)
+            roi_source.set_random_state(
+                random.Random(1), np.random.RandomState(1))
+            state = random.getstate()
+            orders.append([int(sample['im_id'][0]) for sample in roi_source])
+            self.assertEqual(random.getstate(), state)
+        self.assertEqual(orders[0], orders[1])
+
+    def test_mmap_roidb(self):
+        """ test records of mmap roidb are the same as pickled roidb
+        """
+        anno_path = self.config['data_cf']['anno_file']
+        records, cname2cid = loader.load(anno_path, 100, with_cat2id=True)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            mmap_path = os.path.join(tmp_dir, 'train2017.mroidb')
+            save_mmap_roidb(records, cname2cid, mmap_path)
+            mmap_records, mmap_cname2cid = loader.load(
+                mmap_path, with_cat2id=True)
+            self.assertEqual(cname2cid, mmap_cname2cid)
+            self.assertEqual(len(records), len(mmap_records))
+            for rec, mmap_rec in zip(records, mmap_records):
+                self.assertEqual(rec['im_file'], mmap_rec['im_file'])
+                self.assertEqual(rec['gt_poly'], mmap_rec['gt_poly'])
+                for k in ['im_id', 'gt_bbox', 'gt_class', 'is_crowd']:
+                    self.assertTrue(np.array_equal(rec[k], mmap_rec[k]))
+
+            config = {
+                'data_cf': dict(self.config['data_cf'], anno_file=mmap_path),
+                'cname2cid': None
+            }
+            roi_source = build_source(config)
+            for i, sample in enumerate(roi_source):
+                self.assertGreater(len(sample['image']), 0)
+            self.assertEqual(i + 1, len(records))
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
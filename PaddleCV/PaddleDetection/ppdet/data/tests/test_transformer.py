@@ -100,6 +100,58 @@ class TestTransformer(unittest.TestCase):
 
         self.assertEqual(ct, mapped_ds.size())
 
+    def test_parallel_map_zero_copy(self):
+        """ test transformer.map with samples passed by shared memory
+        """
+        mapper = tf.build_mapper(self.ops)
+        ds = build_source(self.sc_config)
+        worker_conf = {'WORKER_NUM': 2, 'use_process': True,
+            'zero_copy': True}
+        mapped_ds = tf.map(ds, mapper, worker_conf)
+
+        ct = 0
+        for sample in mapped_ds:
+            self.assertTrue(type(sample[0]) is np.ndarray)
+            self.assertEqual(sample[0].ndim, 3)
+            ct += 1
+
+        self.assertTrue(mapped_ds.drained())
+        self.assertEqual(ct, mapped_ds.size())
+
+    def test_parallel_map_ordered(self):
+        """ test transformer.map returning samples in source order
+        """
+        epochs = []
+        for worker_num in [1, 3]:
+            mapper = tf.build_mapper(self.ops)
+            ds = build_source(self.sc_config)
+            worker_conf = {'WORKER_NUM': worker_num, 'use_process': True,
+                'ordered': True, 'seed': 1}
+            mapped_ds = tf.map(ds, mapper, worker_conf)
+
+            im_ids = []
+            for _ in range(2):
+                im_ids.append([int(sample[2][0]) for sample in mapped_ds])
+                self.assertTrue(mapped_ds.drained())
+                self.assertEqual(len(im_ids[-1]), mapped_ds.size())
+                stats = mapped_ds.stats()
+                self.assertEqual(
+                    sum(stats['worker_samples'].values()), mapped_ds.size())
+                mapped_ds.reset()
+            mapped_ds.stop()
+            epochs.append(im_ids)
+
+        self.assertEqual(epochs[0], epochs[1])
+
+    def test_parallel_map_seed_needs_process(self):
+        """ test 'seed' is refused with worker threads
+        """
+        mapper = tf.build_mapper(self.ops)
+        ds = build_source(self.sc_config)
+        worker_conf = {'WORKER_NUM': 2, 'ordered': True, 'seed': 1}
+        with self.assertRaises(AssertionError):
+            tf.map(ds, mapper, worker_conf)
+
     def test_batch(self):
         """ test batched dataset
         """
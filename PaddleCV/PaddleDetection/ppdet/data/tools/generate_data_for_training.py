@@ -21,6 +21,9 @@
 #   used by 'PPdetection' to train.
 #   This tool just convert data to a unified schema,
 #   and it's useful when debuging with small dataset.
+#   With '--format=mroidb' the samples are saved as a columnar
+#   roidb which is memory mapped when loaded, it starts fast and
+#   costs little memory for large datasets.
 
 from __future__ import absolute_import
 from __future__ import division
@@ -39,6 +42,7 @@ if path not in sys.path:
     sys.path.insert(0, path)
 
 from data.source import loader
+from data.source import mmap_roidb
 
 
 def parse_args():
@@ -51,7 +55,8 @@ def parse_args():
         '--type',
         type=str,
         default='json',
-        help='file format of label file, eg: json for COCO and xml for VOC')
+        help='file format of label file, eg: json for COCO, xml for VOC '
+        'and roidb for pickled samples')
     parser.add_argument(
         '--annotation',
         type=str,
@@ -67,11 +72,43 @@ def parse_args():
         type=int,
         default=-1,
         help='number of samples to dump, default to all')
+    parser.add_argument(
+        '--format',
+        type=str,
+        default='roidb',
+        help='format of dumped file, roidb for pickled samples and '
+        'mroidb for memory mapped columnar samples')
 
     args = parser.parse_args()
     return args
 
 
+def dump_roidb(roidb, cat2id, save_dir, dsname, fmt):
+    """ save samples in format 'fmt' and return the saved file name
+    """
+    roidb_fname = save_dir + "/%s.%s" % (dsname, fmt)
+    if fmt == 'mroidb':
+        mmap_roidb.save_mmap_roidb(roidb, cat2id, roidb_fname)
+    else:
+        with open(roidb_fname, "wb") as fout:
+            pkl.dump((roidb, cat2id), fout)
+    return roidb_fname
+
+
+def dump_roidb_as_mmap(args):
+    """ Load pickled samples, and then save them as memory
+        mapped columnar samples.
+    """
+    save_dir = args.save_dir
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+    anno_path = os.path.expanduser(args.annotation)
+    roidb, cat2id = loader.load(anno_path, args.samples, with_cat2id=True)
+    dsname = os.path.splitext(os.path.basename(anno_path))[0]
+    roidb_fname = dump_roidb(roidb, cat2id, save_dir, dsname, 'mroidb')
+    logging.info('dumped %d samples to file[%s]' % (len(roidb), roidb_fname))
+
+
 def dump_coco_as_pickle(args):
     """ Load COCO data, and then save it as pickled file.
 
@@ -87,9 +124,7 @@ def dump_coco_as_pickle(args):
     roidb, cat2id = loader.load(anno_path, samples, with_cat2id=True)
     samples = len(roidb)
     dsname = os.path.basename(anno_path).rstrip('.json')
-    roidb_fname = save_dir + "/%s.roidb" % (dsname)
-    with open(roidb_fname, "wb") as fout:
-        pkl.dump((roidb, cat2id), fout)
+    roidb_fname = dump_roidb(roidb, cat2id, save_dir, dsname, args.format)
 
     #for rec in roidb:
     #    sys.stderr.write('%s\n' % (rec['im_file']))
@@ -115,9 +150,7 @@ def dump_voc_as_pickle(args):
     samples = len(roidb)
     part = anno_path.split('/')
     dsname = part[-4]
-    roidb_fname = save_dir + "/%s.roidb" % (dsname)
-    with open(roidb_fname, "wb") as fout:
-        pkl.dump((roidb, cat2id), fout)
+    roidb_fname = dump_roidb(roidb, cat2id, save_dir, dsname, args.format)
     anno_path = os.path.join(anno_path.split('/train.txt')[0], 'label_list.txt')
     with open(anno_path, 'w') as fw:
         for key in cat2id.keys():
@@ -133,6 +166,10 @@ if __name__ == "__main__":
         python generate_data_for_training.py --type=json
             --annotation=./annotations/instances_val2017.json
             --save-dir=./roidb --samples=100
+
+        python generate_data_for_training.py --type=roidb
+            --annotation=./roidb/instances_val2017.roidb
+            --save-dir=./roidb
     """
     args = parse_args()
 
@@ -142,6 +179,9 @@ if __name__ == "__main__":
     # COCO data are organized in json file
     elif args.type == 'json':
         dump_coco_as_pickle(args)
+    # pickled samples dumped by this tool
+    elif args.type == 'roidb':
+        dump_roidb_as_mmap(args)
     else:
         TypeError('Can\'t deal with {} type. '\
-            'Only xml or json file format supported'.format(args.type))
+            'Only xml, json or roidb file format supported'.format(args.type))
@@ -901,6 +901,79 @@ class Permute(BaseOperator):
         return sample
 
 
+@register_op
+class DecodeResizeNormalize(BaseOperator):
+    def __init__(self,
+                 to_rgb=True,
+                 target_size=0,
+                 max_size=0,
+                 interp=cv2.INTER_LINEAR,
+                 mean=[0.485, 0.456, 0.406],
+                 std=[1, 1, 1],
+                 is_scale=True,
+                 to_bgr=True):
+        """
+        Fused 'DecodeImage', 'ResizeImage', 'NormalizeImage' and 'Permute'.
+        The image is resized while still in uint8, then normalized and
+        transposed to CHW in a single float32 output buffer, so no
+        intermediate float image is made. Note that the original configs
+        normalize before resizing, the results differ from them only by
+        the rounding of the uint8 resize.
+
+        Args:
+            to_rgb (bool): whether to convert BGR to RGB
+            target_size (int|list): the target size of image's short side,
+                multi-scale training is adopted when type is list.
+            max_size (int): the max size of image
+            interp (int): the interpolation method
+            mean (list): the pixel mean
+            std (list): the pixel variance
+            is_scale (bool): whether to scale the image to [0,1]
+            to_bgr (bool): confirm whether to convert RGB to BGR
+        """
+        super(DecodeResizeNormalize, self).__init__()
+        self.to_rgb = to_rgb
+        self.target_size = target_size
+        self.max_size = max_size
+        self.interp = interp
+        self.mean = mean
+        self.std = std
+        self.is_scale = is_scale
+        self.to_bgr = to_bgr
+        if not (isinstance(self.to_rgb, bool) and
+                isinstance(self.to_bgr, bool)):
+            raise TypeError("{}: input type is invalid.".format(self))
+        # decode in BGR mode, the channels are reordered when normalizing
+        self.decoder = DecodeImage(to_rgb=False)
+        self.resizer = ResizeImage(target_size, max_size, interp)
+        if not (isinstance(self.mean, list) and isinstance(self.std, list)):
+            raise TypeError("{}: input type is invalid.".format(self))
+        if 0 in self.std:
+            raise ValueError('{}: std is invalid!'.format(self))
+        # normalized channel 'i' is taken from decoded channel 'order[i]'
+        # and normalized with 'mean[stat[i]]' and 'std[stat[i]]'
+        stat = [2, 1, 0] if self.to_bgr else [0, 1, 2]
+        self.order = [2 - i if self.to_rgb else i for i in stat]
+        self.stat = stat
+
+    def __call__(self, sample, context=None):
+        sample = self.decoder(sample, context)
+        sample = self.resizer(sample, context)
+        im = sample['image']
+        h, w = im.shape[:2]
+        out = np.empty((3, h, w), dtype=np.float32)
+        mean = np.array(self.mean)[self.stat, np.newaxis, np.newaxis]
+        std = np.array(self.std)[self.stat, np.newaxis, np.newaxis]
+        for i, c in enumerate(self.order):
+            out[i] = im[:, :, c]
+        if self.is_scale:
+            out /= 255.0
+        out -= mean
+        out /= std
+        sample['image'] = out
+        return sample
+
+
 @register_op
 class MixupImage(BaseOperator):
     def __init__(self, alpha=1.5, beta=1.5):
@@ -21,10 +21,13 @@ from __future__ import print_function
 
 import sys
 import six
+import time
 import uuid
+import random
 import logging
 import signal
 import threading
+import numpy as np
 from .transformer import ProxiedDataset
 
 logger = logging.getLogger(__name__)
@@ -36,6 +39,16 @@ class EndSignal(object):
         self.errmsg = errmsg
 
 
+class EpochEndSignal(object):
+    """ sent by producer in ordered mode when all 'size' samples of
+        'epoch' have been fed to workers
+    """
+
+    def __init__(self, epoch, size):
+        self.epoch = epoch
+        self.size = size
+
+
 class ParallelMappedDataset(ProxiedDataset):
     """
     Transform samples to mapped samples which is similar to 'basic.MappedDataset',
@@ -43,6 +56,21 @@ class ParallelMappedDataset(ProxiedDataset):
 
     Notes:
         this class is not thread-safe
+
+        with 'use_process' and 'zero_copy' both set, ndarray fields of mapped
+        samples are written to shared memory by workers and returned as views
+        on it without pickling, the memory is reused after the samples are
+        released, so 'memsize' should hold about 'bufsize' plus the samples
+        kept by following batching
+
+        with 'ordered' set, samples are returned in the order of 'source'
+        through a reorder buffer holding at most 'bufsize' samples in
+        flight, each epoch ends exactly after all its samples are returned,
+        and with 'seed' set, the random state of 'source' (private ones
+        given by its 'set_random_state') and 'mapper' are reseeded per
+        epoch and per sample, so the output is deterministic no matter
+        which worker maps a sample, this needs 'use_process' for worker
+        threads share the same random state
     """
 
     def __init__(self, source, mapper, worker_args):
@@ -50,7 +78,8 @@ class ParallelMappedDataset(ProxiedDataset):
         worker_args = {k.lower(): v for k, v in worker_args.items()}
 
         args = {'bufsize': 100, 'worker_num': 8,
-            'use_process': False, 'memsize': '3G'}
+            'use_process': False, 'memsize': '3G', 'zero_copy': False,
+            'ordered': False, 'seed': None}
         args.update(worker_args)
         if args['use_process'] and type(args['memsize']) is str:
             assert args['memsize'][-1].lower() == 'g', \
@@ -59,6 +88,18 @@ class ParallelMappedDataset(ProxiedDataset):
             args['memsize'] = int(gb) * 1024 ** 3
 
         self._worker_args = args
+        self._ordered = args['ordered']
+        self._seed = args['seed']
+        if self._seed is not None:
+            assert args['use_process'], "'seed' needs 'use_process', " \
+                "worker threads would reseed the random state of this process"
+            self._seed = int(self._seed)
+            # the producer runs in this process, so the source is reseeded
+            # through private random states instead of the global ones
+            self._rand = random.Random()
+            self._np_rand = np.random.RandomState()
+            if hasattr(source, 'set_random_state'):
+                source.set_random_state(self._rand, self._np_rand)
         self._started = False
         self._source = source
         self._mapper = mapper
@@ -72,6 +113,7 @@ class ParallelMappedDataset(ProxiedDataset):
             logger.info("Use multi-thread reader instead of "
                         "multi-process reader on Windows.")
             use_process = False
+        self._use_process = use_process
 
         bufsize = self._worker_args['bufsize']
         if use_process:
@@ -80,7 +122,10 @@ class ParallelMappedDataset(ProxiedDataset):
             from multiprocessing import Event
             memsize = self._worker_args['memsize']
             self._inq = Queue(bufsize, memsize=memsize)
-            self._outq = Queue(bufsize, memsize=memsize)
+            self._outq = Queue(
+                bufsize,
+                memsize=memsize,
+                zero_copy=self._worker_args['zero_copy'])
         else:
             if six.PY3:
                 from queue import Queue
@@ -93,15 +138,18 @@ class ParallelMappedDataset(ProxiedDataset):
 
         consumer_num = self._worker_args['worker_num']
         id = str(uuid.uuid4())[-3:]
+        if self._ordered:
+            produce, consume = self._produce_ordered, self._consume_ordered
+        else:
+            produce, consume = self._produce, self._consume
         self._producer = threading.Thread(
-            target=self._produce,
-            args=('producer-' + id, self._source, self._inq))
+            target=produce, args=('producer-' + id, self._source, self._inq))
         self._producer.daemon = True
 
         self._consumers = []
         for i in range(consumer_num):
             p = Worker(
-                target=self._consume,
+                target=consume,
                 args=('consumer-' + id + '_' + str(i), self._inq, self._outq,
                       self._mapper))
             self._consumers.append(p)
@@ -113,6 +161,13 @@ class ParallelMappedDataset(ProxiedDataset):
         self._consumed = 0  # consumed sample in self.next
         self._stopped_consumers = 0
 
+        # states of ordered mode, only accessed in the main process
+        self._window = threading.Semaphore(bufsize)
+        self._source_lock = threading.Lock()
+        self._reorder_buf = {}
+        self._epoch_size = None
+        self._reset_stats()
+
     def _produce(self, id, source, inq):
         """Fetch data from source and feed it to 'inq' queue"""
         while True:
@@ -152,8 +207,160 @@ class ParallelMappedDataset(ProxiedDataset):
                 outq.put(EndSignal(-1, msg))
                 break
 
+    def _sample_seed(self, epoch, idx):
+        # mixed as integers, which unlike hash() doesn't depend on the
+        # python version or PYTHONHASHSEED
+        return ((self._seed * 1000003 + epoch) * 1000003 + idx) & 0xffffffff
+
+    def _reseed_source(self, seed):
+        self._rand.seed(seed)
+        self._np_rand.seed(seed)
+
+    def _produce_ordered(self, id, source, inq):
+        """Feed samples tagged with (epoch, index) to 'inq', at most
+        'bufsize' samples are in flight ahead of the one expected by next"""
+        idx = 0
+        epoch = None
+        while True:
+            self._feeding_ev.wait()
+            if self._exit:
+                break
+            self._window.acquire()
+            try:
+                # the epoch is read after the window is acquired, as a reset
+                # may happen while waiting for it, and the lock keeps reset
+                # from changing the epoch and the source meanwhile
+                with self._source_lock:
+                    if epoch != self._epoch:
+                        epoch = self._epoch
+                        idx = 0
+                    if self._seed is not None:
+                        self._reseed_source(self._sample_seed(epoch, idx))
+                    sample = source.next()
+                inq.put((epoch, idx, sample))
+                idx += 1
+            except StopIteration:
+                self._window.release()
+                # cleared before the signal, or the set() of a reset called
+                # on receiving it could be lost
+                self._feeding_ev.clear()
+                self._outq.put(EpochEndSignal(epoch, idx))
+                self._feeding_ev.wait()  # wait other guy to wake up me
+                logger.debug("producer[{}] starts new epoch".format(id))
+            except Exception as e:
+                msg = "producer[{}] failed with error: {}".format(id, str(e))
+                inq.put(EndSignal(-1, msg))
+                break
+
+        logger.debug("producer[{}] exits".format(id))
+
+    def _consume_ordered(self, id, inq, outq, mapper):
+        """Map samples from 'inq' and put (epoch, index, worker, result)
+        to 'outq', reseed random state per sample if 'seed' is set, which
+        is skipped in worker threads as they share the state of this process"""
+        while True:
+            sample = inq.get()
+            if isinstance(sample, EndSignal):
+                sample.errmsg += "[consumer[{}] exits]".format(id)
+                outq.put(sample)
+                logger.debug("end signal received, " +
+                             "consumer[{}] exits".format(id))
+                break
+
+            epoch, idx, sample = sample
+            try:
+                if self._seed is not None and self._use_process:
+                    seed = self._sample_seed(epoch, idx)
+                    random.seed(seed)
+                    np.random.seed(seed)
+                result = mapper(sample)
+                outq.put((epoch, idx, id, result))
+            except Exception as e:
+                msg = 'failed to map consumer[{}], error: {}'.format(id, str(e))
+                outq.put(EndSignal(-1, msg))
+                break
+
+    def _next_ordered(self):
+        """Return the next sample in source order from reorder buffer"""
+        while self._consumed not in self._reorder_buf:
+            if self._epoch_size is not None and \
+                    self._consumed >= self._epoch_size:
+                raise StopIteration()
+
+            # waiting while later samples are ready is a reorder stall
+            stalled = len(self._reorder_buf) > 0
+            start = time.time()
+            sample = self._outq.get()
+            if stalled:
+                self._stats['reorder_stalls'] += 1
+                self._stats['reorder_stall_time'] += time.time() - start
+
+            if isinstance(sample, EndSignal):
+                self._on_end_signal(sample)
+            elif isinstance(sample, EpochEndSignal):
+                if sample.epoch == self._epoch:
+                    self._epoch_size = sample.size
+            else:
+                epoch, idx, worker, result = sample
+                if epoch != self._epoch:
+                    # stale sample of an unfinished epoch
+                    self._window.release()
+                    continue
+                self._reorder_buf[idx] = result
+                worker_samples = self._stats['worker_samples']
+                worker_samples[worker] = worker_samples.get(worker, 0) + 1
+                self._stats['max_reorder_size'] = max(
+                    self._stats['max_reorder_size'], len(self._reorder_buf))
+
+        sample = self._reorder_buf.pop(self._consumed)
+        self._consumed += 1
+        self._window.release()
+        return sample
+
+    def _on_end_signal(self, sample):
+        self._stopped_consumers += 1
+        if sample.errno != 0:
+            logger.warn("consumer failed with error: {}".format(
+                sample.errmsg))
+
+        if self._stopped_consumers < len(self._consumers):
+            self._inq.put(sample)
+        else:
+            raise ValueError("all consumers exited, no more samples")
+
+    def _reset_stats(self):
+        self._stats = {
+            'start_time': time.time(),
+            'worker_samples': {},
+            'reorder_stalls': 0,
+            'reorder_stall_time': 0.,
+            'max_reorder_size': 0,
+        }
+
+    def stats(self):
+        """ statistics of current epoch in ordered mode, used to size
+            'bufsize' and 'worker_num'
+
+        Returns:
+            dict with per worker sample number 'worker_samples' and
+            throughput 'worker_throughput' in samples/s, 'reorder_stalls'
+            and 'reorder_stall_time' in seconds of waiting for the next
+            sample while later ones were ready, and 'max_reorder_size'
+        """
+        stats = dict(self._stats)
+        cost = max(time.time() - stats.pop('start_time'), 1e-6)
+        stats['worker_samples'] = dict(stats['worker_samples'])
+        stats['worker_throughput'] = {
+            k: v / cost
+            for k, v in stats['worker_samples'].items()
+        }
+        return stats
+
     def drained(self):
         assert self._epoch >= 0, "first epoch has not started yet"
+        if self._ordered:
+            return self._epoch_size is not None and \
+                self._consumed >= self._epoch_size
         return self._source.drained() and self._produced == self._consumed
 
     def stop(self):
@@ -173,18 +380,13 @@ class ParallelMappedDataset(ProxiedDataset):
         if self.drained():
             raise StopIteration()
 
+        if self._ordered:
+            return self._next_ordered()
+
         while True:
             sample = self._outq.get()
             if isinstance(sample, EndSignal):
-                self._stopped_consumers += 1
-                if sample.errno != 0:
-                    logger.warn("consumer failed with error: {}".format(
-                        sample.errmsg))
-
-                if self._stopped_consumers < len(self._consumers):
-                    self._inq.put(sample)
-                else:
-                    raise ValueError("all consumers exited, no more samples")
+                self._on_end_signal(sample)
             else:
                 self._consumed += 1
                 return sample
@@ -192,26 +394,38 @@ class ParallelMappedDataset(ProxiedDataset):
     def reset(self):
         """ reset for a new epoch of samples
         """
-        if self._epoch < 0:
-            self._epoch = 0
-            for p in self._consumers:
-                p.start()
-            self._producer.start()
-        else:
-            if not self.drained():
-                logger.warn("do not reset before epoch[%d] finishes".format(
-                    self._epoch))
-                self._produced = self._produced - self._consumed
+        # the ordered producer reads the epoch and the source under the lock
+        with self._source_lock:
+            if self._epoch < 0:
+                self._epoch = 0
+                for p in self._consumers:
+                    p.start()
+                self._producer.start()
             else:
-                self._produced = 0
-
-            self._epoch += 1
-
-        assert self._stopped_consumers == 0, "some consumers already exited," \
-            + " cannot start another epoch"
-
-        self._source.reset()
-        self._consumed = 0
+                if not self.drained():
+                    logger.warn("do not reset before epoch[%d] finishes".format(
+                        self._epoch))
+                    self._produced = self._produced - self._consumed
+                else:
+                    self._produced = 0
+
+                self._epoch += 1
+
+            assert self._stopped_consumers == 0, "some consumers already exited," \
+                + " cannot start another epoch"
+
+            if self._ordered:
+                # drop samples of unfinished epoch, in flight ones are
+                # dropped when received in next
+                for _ in range(len(self._reorder_buf)):
+                    self._window.release()
+                self._reorder_buf = {}
+                self._epoch_size = None
+                self._reset_stats()
+            if self._seed is not None:
+                self._reseed_source(self._sample_seed(self._epoch, -1))
+            self._source.reset()
+            self._consumed = 0
         self._feeding_ev.set()
 
 
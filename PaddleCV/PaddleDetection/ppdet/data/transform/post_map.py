@@ -22,6 +22,80 @@ import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# weights of RGB channels to gray, the same as PIL
+GRAY_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _random_factors(num, bounds, prob):
+    """ random factors of a batch, 1 means no change
+    """
+    factors = np.random.uniform(bounds[0], bounds[1], num)
+    factors[np.random.uniform(0, 1, num) >= prob] = 1.
+    return factors.astype(np.float32).reshape((num, 1, 1, 1))
+
+
+def _hue_matrices(degrees):
+    """ matrices rotating the hue of RGB pixels in YIQ space
+    """
+    rgb2yiq = np.array(
+        [[0.299, 0.587, 0.114], [0.596, -0.274, -0.322],
+         [0.211, -0.523, 0.312]],
+        dtype=np.float64)
+    yiq2rgb = np.linalg.inv(rgb2yiq)
+    mats = []
+    for theta in np.deg2rad(degrees):
+        rot = np.array([[1, 0, 0], [0, np.cos(theta), -np.sin(theta)],
+                        [0, np.sin(theta), np.cos(theta)]])
+        # applied to row vectors of pixels
+        mats.append(np.dot(yiq2rgb, np.dot(rot, rgb2yiq)).T)
+    return np.array(mats, dtype=np.float32)
+
+
+def distort_batch(ims, im_sizes, config):
+    """
+    Randomly distort brightness, contrast, saturation and hue of
+    a batch of padded RGB images in place, each image has its own
+    random factors like 'RandomDistort', while the order of the
+    distortions is shared by the batch.
+
+    Args:
+        ims (np.ndarray): float32 images in NHWC, padded with zeros
+        im_sizes (np.ndarray): height and width of the images, [N, 2]
+        config (dict): ranges and probability of the distortions
+    """
+    num = ims.shape[0]
+    prob = config['distort_prob']
+
+    def brightness():
+        ims[...] *= _random_factors(num, config['brightness'], prob)
+
+    def contrast():
+        factors = _random_factors(num, config['contrast'], prob)
+        # padded pixels are zeros, so they are not in the sums
+        means = np.dot(ims, GRAY_WEIGHTS).sum(axis=(1, 2))
+        means /= np.prod(im_sizes, axis=1)
+        ims[...] *= factors
+        ims[...] += (1. - factors) * means.reshape((num, 1, 1, 1))
+
+    def saturation():
+        factors = _random_factors(num, config['saturation'], prob)
+        gray = np.dot(ims, GRAY_WEIGHTS)[..., np.newaxis]
+        ims[...] *= factors
+        ims[...] += (1. - factors) * gray
+
+    def hue():
+        deltas = np.random.uniform(config['hue'][0], config['hue'][1], num)
+        deltas[np.random.uniform(0, 1, num) >= prob] = 0.
+        # hue of PIL is in [0, 256)
+        mats = _hue_matrices(deltas * 360. / 256.)
+        ims[...] = np.einsum('nhwc,ncd->nhwd', ims, mats)
+
+    ops = [brightness, contrast, saturation, hue]
+    for i in np.random.permutation(len(ops)):
+        ops[i]()
+        np.clip(ims, 0., 255., out=ims)
+    return ims
+
 
 def build_post_map(coarsest_stride=1,
                    is_padding=False,
@@ -29,7 +103,8 @@ def build_post_map(coarsest_stride=1,
                    multi_scales=[],
                    use_padded_im_info=False,
                    enable_multiscale_test=False,
-                   num_scale=1):
+                   num_scale=1,
+                   normalize_batch=None):
     """
     Build a mapper for post-processing batches
 
@@ -45,6 +120,8 @@ def build_post_map(coarsest_stride=1,
             use_padded_im_info (bool): whether to update im_info after padding
             enable_multiscale_test (bool): whether to use multiscale test.
             num_scale (int) : the number of scales for multiscale test.
+            normalize_batch (dict): distort, normalize and pad batches of
+                uint8 HWC images at once, None for not used.
           }
     Returns:
         a mapper function which accept one argument 'batch' and
@@ -71,6 +148,45 @@ def build_post_map(coarsest_stride=1,
             padding_batch.append((padding_im, ) + data[1:])
         return padding_batch
 
+    def normalize_padding_minibatch(batch_data):
+        cfg = normalize_batch
+        im_sizes = np.array([data[0].shape[:2] for data in batch_data])
+        max_h, max_w = im_sizes.max(axis=0)
+        if coarsest_stride > 1:
+            max_h = int(np.ceil(max_h / coarsest_stride) * coarsest_stride)
+            max_w = int(np.ceil(max_w / coarsest_stride) * coarsest_stride)
+        num = len(batch_data)
+        ims = np.zeros(
+            (num, max_h, max_w, 3),
+            dtype=np.float32 if cfg['distort'] else np.uint8)
+        for i, data in enumerate(batch_data):
+            im_h, im_w = im_sizes[i]
+            ims[i, :im_h, :im_w] = data[0]
+        if cfg['distort']:
+            ims = distort_batch(ims, im_sizes, cfg)
+
+        # normalized channel 'i' is taken from image channel 'order[i]'
+        order = [2, 1, 0] if cfg['to_bgr'] else [0, 1, 2]
+        mean = np.array(cfg['mean'])[order, np.newaxis, np.newaxis]
+        std = np.array(cfg['std'])[order, np.newaxis, np.newaxis]
+        out = np.empty((num, 3, max_h, max_w), dtype=np.float32)
+        for i, c in enumerate(order):
+            out[:, i] = ims[..., c]
+        if cfg['is_scale']:
+            out /= 255.0
+        out -= mean
+        out /= std
+
+        padding_batch = []
+        for i, data in enumerate(batch_data):
+            im_h, im_w = im_sizes[i]
+            out[i, :, im_h:, :] = 0.
+            out[i, :, :, im_w:] = 0.
+            if use_padded_im_info:
+                data[1][:2] = [max_h, max_w]
+            padding_batch.append((out[i], ) + data[1:])
+        return padding_batch
+
     def padding_multiscale_test(batch_data):
         if len(batch_data) != 1:
             raise NotImplementedError(
@@ -134,7 +250,9 @@ def build_post_map(coarsest_stride=1,
 
     def _mapper(batch_data):
         try:
-            if is_padding:
+            if normalize_batch is not None:
+                batch_data = normalize_padding_minibatch(batch_data)
+            elif is_padding:
                 batch_data = padding_minibatch(batch_data)
             if len(random_shapes) > 0:
                 batch_data = random_shape(batch_data)
@@ -28,12 +28,16 @@ else:
 
 import logging
 import traceback
+import numpy as np
 import multiprocessing as mp
 from multiprocessing.queues import Queue
 from .sharedmemory import SharedMemoryMgr
 
 logger = logging.getLogger(__name__)
 
+# alignment in bytes of ndarray data in zero-copy mode
+NDARRAY_ALIGNMENT = 64
+
 
 class SharedQueueError(ValueError):
     """ SharedQueueError
@@ -41,12 +45,114 @@ class SharedQueueError(ValueError):
     pass
 
 
+class NDArrayDesc(object):
+    """ descriptor of a ndarray field stored in a SharedBuffer
+    """
+
+    def __init__(self, offset, shape, dtype):
+        self.offset = offset
+        self.shape = shape
+        self.dtype = dtype
+
+
+class SharedBufferHolder(object):
+    """ keep a SharedBuffer alive while ndarray views on it are used,
+        and free the buffer when the last view is garbage collected
+    """
+
+    def __init__(self, buff, data_offset):
+        self._buff = buff
+        base = buff.get()
+        self._address = base.ctypes.data + data_offset
+
+    def view(self, desc):
+        """ get a ndarray view for 'desc' without copy
+        """
+        return np.asarray(_NDArrayView(self, desc))
+
+    def __del__(self):
+        buff, self._buff = self._buff, None
+        # the views may outlive the queue, whose memory manager then already
+        # released all its buffers
+        if buff is not None and \
+                buff._owner in SharedMemoryMgr.s_memory_mgrs:
+            buff.free()
+
+
+class _NDArrayView(object):
+    """ expose a region of shared memory by '__array_interface__', the
+        view returned by 'np.asarray' keeps this object as its base
+    """
+
+    def __init__(self, holder, desc):
+        self._holder = holder
+        self.__array_interface__ = {
+            'data': (holder._address + desc.offset, False),
+            'shape': tuple(desc.shape),
+            'typestr': desc.dtype,
+            'version': 3
+        }
+
+
+def _align(size):
+    return (size + NDARRAY_ALIGNMENT - 1) // NDARRAY_ALIGNMENT \
+        * NDARRAY_ALIGNMENT
+
+
+def _extract_ndarrays(obj, arrays, offset):
+    """ replace ndarray fields in 'obj' by 'NDArrayDesc', collected
+        arrays are appended to 'arrays', return new obj and end offset
+    """
+    if isinstance(obj, np.ndarray) and not obj.dtype.hasobject \
+            and obj.dtype.fields is None:
+        arr = np.ascontiguousarray(obj)
+        arrays.append((offset, arr))
+        desc = NDArrayDesc(offset, arr.shape, arr.dtype.str)
+        return desc, offset + _align(arr.nbytes)
+    elif isinstance(obj, dict):
+        new_obj = obj.copy()
+        for k, v in obj.items():
+            new_obj[k], offset = _extract_ndarrays(v, arrays, offset)
+        return new_obj, offset
+    elif type(obj) in (list, tuple):
+        items = []
+        for v in obj:
+            v, offset = _extract_ndarrays(v, arrays, offset)
+            items.append(v)
+        return type(obj)(items), offset
+    return obj, offset
+
+
+def _restore_ndarrays(obj, holder):
+    """ replace 'NDArrayDesc' in 'obj' by ndarray views on shared memory
+    """
+    if isinstance(obj, NDArrayDesc):
+        return holder.view(obj)
+    elif isinstance(obj, dict):
+        for k, v in obj.items():
+            obj[k] = _restore_ndarrays(v, holder)
+        return obj
+    elif type(obj) in (list, tuple):
+        return type(obj)([_restore_ndarrays(v, holder) for v in obj])
+    return obj
+
+
 class SharedQueue(Queue):
     """ a Queue based on shared memory to communicate data between Process,
         and it's interface is compatible with 'multiprocessing.queues.Queue'
+
+        if 'zero_copy' is True, ndarray fields of the objects are written to
+        shared memory directly and only the rest of the object is pickled,
+        'get' returns ndarray views on the shared memory instead of copies,
+        the memory is freed when all of these views are garbage collected
     """
 
-    def __init__(self, maxsize=0, mem_mgr=None, memsize=None, pagesize=None):
+    def __init__(self,
+                 maxsize=0,
+                 mem_mgr=None,
+                 memsize=None,
+                 pagesize=None,
+                 zero_copy=False):
         """ init
         """
         if six.PY3:
@@ -59,10 +165,14 @@ class SharedQueue(Queue):
         else:
             self._shared_mem = SharedMemoryMgr(
                 capacity=memsize, pagesize=pagesize)
+        self._zero_copy = zero_copy
 
     def put(self, obj, **kwargs):
         """ put an object to this queue
         """
+        if self._zero_copy:
+            return self._put_zero_copy(obj, **kwargs)
+
         obj = pickle.dumps(obj, -1)
         buff = None
         try:
@@ -79,9 +189,56 @@ class SharedQueue(Queue):
                 buff.free()
             raise e
 
+    def _put_zero_copy(self, obj, **kwargs):
+        """ put ndarray fields of 'obj' to shared memory without pickling
+        """
+        arrays = []
+        obj, data_size = _extract_ndarrays(obj, arrays, 0)
+        obj = pickle.dumps(obj, -1)
+        data_offset = _align(len(obj))
+        buff = None
+        try:
+            buff = self._shared_mem.malloc(data_offset + data_size)
+            buff.resize(data_offset + data_size)
+            base = buff.get()
+            base[:len(obj)] = np.frombuffer(obj, 'uint8', len(obj))
+            for offset, arr in arrays:
+                start = data_offset + offset
+                base[start:start + arr.nbytes] = arr.reshape(-1).view('uint8')
+            super(SharedQueue, self).put((buff, len(obj), data_offset),
+                                         **kwargs)
+        except Exception as e:
+            stack_info = traceback.format_exc()
+            err_msg = 'failed to put a element to SharedQueue '\
+                'with stack info[%s]' % (stack_info)
+            logger.warn(err_msg)
+
+            if buff is not None:
+                buff.free()
+            raise e
+
+    def _get_zero_copy(self, **kwargs):
+        """ get an object with ndarray views on shared memory
+        """
+        buff, obj_size, data_offset = super(SharedQueue, self).get(**kwargs)
+        # the holder frees 'buff' when all views are released
+        holder = SharedBufferHolder(buff, data_offset)
+        try:
+            obj = pickle.load(StringIO(buff.get(0, obj_size)))
+            return _restore_ndarrays(obj, holder)
+        except Exception as e:
+            stack_info = traceback.format_exc()
+            err_msg = 'failed to get element from SharedQueue '\
+                        'with stack info[%s]' % (stack_info)
+            logger.warn(err_msg)
+            raise e
+
     def get(self, **kwargs):
         """ get an object from this queue
         """
+        if self._zero_copy:
+            return self._get_zero_copy(**kwargs)
+
         buff = None
         try:
             buff = super(SharedQueue, self).get(**kwargs)
@@ -33,6 +33,7 @@ __all__ = [
     'mask_eval',
     'bbox2out',
     'mask2out',
+    'COCOResultWriter',
     'get_category_info',
     'proposal_eval',
     'cocoapi_eval',
@@ -82,24 +83,29 @@ def bbox_eval(results,
         {i + int(with_background): catid
          for i, catid in enumerate(cat_ids)})
 
-    xywh_results = bbox2out(
-        results, clsid2catid, is_bbox_normalized=is_bbox_normalized)
+    writer = COCOResultWriter(
+        outfile, 'bbox', clsid2catid, is_bbox_normalized=is_bbox_normalized)
+    for t in results:
+        writer.update(t)
 
-    if len(xywh_results) == 0:
+    if writer.close() == 0:
         logger.warning("The number of valid bbox detected is zero.\n \
             Please use reasonable model and check input data.\n \
             stop eval!")
         return [0.0]
-    with open(outfile, 'w') as f:
-        json.dump(xywh_results, f)
 
-    map_stats = cocoapi_eval(outfile, 'bbox', coco_gt=coco_gt)
+    map_stats = cocoapi_eval(writer, 'bbox', coco_gt=coco_gt)
     # flush coco evaluation result
     sys.stdout.flush()
     return map_stats
 
 
-def mask_eval(results, anno_file, outfile, resolution, thresh_binarize=0.5):
+def mask_eval(results,
+              anno_file,
+              outfile,
+              resolution,
+              thresh_binarize=0.5,
+              num_workers=4):
     assert 'mask' in results[0]
     assert outfile.endswith('.json')
     from pycocotools.coco import COCO
@@ -107,16 +113,22 @@ def mask_eval(results, anno_file, outfile, resolution, thresh_binarize=0.5):
     coco_gt = COCO(anno_file)
     clsid2catid = {i + 1: v for i, v in enumerate(coco_gt.getCatIds())}
 
-    segm_results = mask2out(results, clsid2catid, resolution, thresh_binarize)
-    if len(segm_results) == 0:
+    writer = COCOResultWriter(
+        outfile,
+        'segm',
+        clsid2catid,
+        resolution=resolution,
+        thresh_binarize=thresh_binarize,
+        num_workers=num_workers)
+    for t in results:
+        writer.update(t)
+
+    if writer.close() == 0:
         logger.warning("The number of valid mask detected is zero.\n \
             Please use reasonable model and check input data.")
         return
 
-    with open(outfile, 'w') as f:
-        json.dump(segm_results, f)
-
-    cocoapi_eval(outfile, 'segm', coco_gt=coco_gt)
+    cocoapi_eval(writer, 'segm', coco_gt=coco_gt)
 
 
 def cocoapi_eval(jsonfile,
@@ -126,7 +138,8 @@ def cocoapi_eval(jsonfile,
                  max_dets=(100, 300, 1000)):
     """
     Args:
-        jsonfile: Evaluation json file, eg: bbox.json, mask.json.
+        jsonfile: Evaluation json file, eg: bbox.json, mask.json,
+                  or a closed COCOResultWriter.
         style: COCOeval style, can be `bbox` , `segm` and `proposal`.
         coco_gt: Whether to load COCOAPI through anno_file,
                  eg: coco_gt = COCO(anno_file)
@@ -140,6 +153,8 @@ def cocoapi_eval(jsonfile,
     if coco_gt == None:
         coco_gt = COCO(anno_file)
     logger.info("Start evaluate...")
+    if isinstance(jsonfile, COCOResultWriter):
+        jsonfile = jsonfile.load_res()
     coco_dt = coco_gt.loadRes(jsonfile)
     if style == 'proposal':
         coco_eval = COCOeval(coco_gt, coco_dt, 'bbox')
@@ -191,6 +206,77 @@ def proposal2out(results, is_bbox_normalized=False):
     return xywh_res
 
 
+def bbox2columns(t, clsid2catid, is_bbox_normalized=False):
+    """
+    Convert the bbox result of one batch to columnar arrays.
+
+    Args:
+        t: result dict of one batch, see bbox2out.
+        clsid2catid: class id to category id map of COCO2017 dataset.
+        is_bbox_normalized: whether or not bbox is normalized.
+
+    Returns:
+        dict of `image_id` [N], `category_id` [N], `bbox` [N, 4] in
+        xywh format and `score` [N] arrays, None if no bbox detected.
+    """
+    bboxes = t['bbox'][0]
+    lengths = t['bbox'][1][0]
+    if bboxes is None or bboxes.shape == (1, 1):
+        return None
+
+    num = int(np.sum(lengths))
+    im_ids = np.array(t['im_id'][0]).reshape(-1)[:len(lengths)]
+    bboxes = np.asarray(bboxes[:num], dtype=np.float64)
+    clsids = bboxes[:, 0].astype(np.int64)
+    xmin, ymin, xmax, ymax = [bboxes[:, i] for i in range(2, 6)]
+
+    if is_bbox_normalized:
+        xmin, ymin, xmax, ymax = [
+            np.clip(v, 0., 1.) for v in [xmin, ymin, xmax, ymax]
+        ]
+        w = xmax - xmin
+        h = ymax - ymin
+        im_shape = np.asarray(t['im_shape'][0][:len(lengths)], np.float64)
+        im_shape = np.repeat(im_shape, lengths, axis=0)
+        xmin = xmin * im_shape[:, 1]
+        ymin = ymin * im_shape[:, 0]
+        w = w * im_shape[:, 1]
+        h = h * im_shape[:, 0]
+    else:
+        w = xmax - xmin + 1
+        h = ymax - ymin + 1
+
+    return {
+        'image_id': np.repeat(im_ids.astype(np.int64), lengths),
+        'category_id': _catid_table(clsid2catid)[clsids],
+        'bbox': np.stack([xmin, ymin, w, h], axis=1),
+        'score': bboxes[:, 1],
+    }
+
+
+def _catid_table(clsid2catid):
+    table = np.full((max(clsid2catid.keys()) + 1, ), -1, dtype=np.int64)
+    for clsid, catid in clsid2catid.items():
+        table[clsid] = catid
+    return table
+
+
+def columns2out(columns):
+    """
+    Convert columnar results to a list of COCO result dicts.
+    """
+    if columns is None:
+        return []
+    key = 'segmentation' if 'segmentation' in columns else 'bbox'
+    return [{
+        'image_id': int(im_id),
+        'category_id': int(catid),
+        key: v if key == 'segmentation' else v.tolist(),
+        'score': float(score)
+    } for im_id, catid, v, score in zip(columns['image_id'], columns[
+        'category_id'], columns[key], columns['score'])]
+
+
 def bbox2out(results, clsid2catid, is_bbox_normalized=False):
     """
     Args:
@@ -201,127 +287,241 @@ def bbox2out(results, clsid2catid, is_bbox_normalized=False):
     """
     xywh_res = []
     for t in results:
-        bboxes = t['bbox'][0]
-        lengths = t['bbox'][1][0]
-        im_ids = np.array(t['im_id'][0])
-        if bboxes.shape == (1, 1) or bboxes is None:
-            continue
-
-        k = 0
-        for i in range(len(lengths)):
-            num = lengths[i]
-            im_id = int(im_ids[i][0])
-            for j in range(num):
-                dt = bboxes[k]
-                clsid, score, xmin, ymin, xmax, ymax = dt.tolist()
-                catid = (clsid2catid[int(clsid)])
-
-                if is_bbox_normalized:
-                    xmin, ymin, xmax, ymax = \
-                            clip_bbox([xmin, ymin, xmax, ymax])
-                    w = xmax - xmin
-                    h = ymax - ymin
-                    im_height, im_width = t['im_shape'][0][i].tolist()
-                    xmin *= im_width
-                    ymin *= im_height
-                    w *= im_width
-                    h *= im_height
-                else:
-                    w = xmax - xmin + 1
-                    h = ymax - ymin + 1
-
-                bbox = [xmin, ymin, w, h]
-                coco_res = {
-                    'image_id': im_id,
-                    'category_id': catid,
-                    'bbox': bbox,
-                    'score': score
-                }
-                xywh_res.append(coco_res)
-                k += 1
+        xywh_res.extend(
+            columns2out(bbox2columns(t, clsid2catid, is_bbox_normalized)))
     return xywh_res
 
 
-def mask2out(results, clsid2catid, resolution, thresh_binarize=0.5):
+def mask2args(t, resolution, thresh_binarize=0.5):
+    """
+    Split the mask result of one batch into per image arguments of
+    encode_masks, only the mask of the predicted class is kept.
+    """
+    bboxes = t['bbox'][0]
+    lengths = t['bbox'][1][0]
+    im_ids = np.array(t['im_id'][0])
+    if bboxes is None or bboxes.shape == (1, 1) or len(bboxes) == 0:
+        return []
+
+    masks = t['mask'][0]
+    args = []
+    s = 0
+    for i in range(len(lengths)):
+        num = lengths[i]
+        im_shape = t['im_shape'][0][i]
+        clsids = bboxes[s:s + num, 0].astype(np.int32)
+        mask = masks[s:s + num][np.arange(num), clsids]
+        args.append((int(im_ids[i][0]), bboxes[s:s + num], mask,
+                     int(im_shape[0]), int(im_shape[1]), resolution,
+                     thresh_binarize))
+        s += num
+    return args
+
+
+def encode_masks(im_id, bboxes, masks, im_h, im_w, resolution,
+                 thresh_binarize=0.5):
+    """
+    Paste the masks of one image back to image size and encode
+    them as RLE, this is picklable to run in a process pool.
+
+    Returns:
+        im_id, bboxes [N, 6] and list of N RLE dicts
+    """
     import pycocotools.mask as mask_util
     scale = (resolution + 2.0) / resolution
 
-    segm_res = []
+    expand_bbox = expand_boxes(bboxes[:, 2:], scale)
+    expand_bbox = expand_bbox.astype(np.int32)
 
-    # for each batch
-    for t in results:
-        bboxes = t['bbox'][0]
+    padded_mask = np.zeros((resolution + 2, resolution + 2), dtype=np.float32)
+    im_mask = np.zeros((im_h, im_w), dtype=np.uint8)
 
-        lengths = t['bbox'][1][0]
-        im_ids = np.array(t['im_id'][0])
-        if bboxes.shape == (1, 1) or bboxes is None:
-            continue
-        if len(bboxes.tolist()) == 0:
-            continue
+    segms = []
+    for j in range(len(bboxes)):
+        xmin, ymin, xmax, ymax = expand_bbox[j].tolist()
+        padded_mask[1:-1, 1:-1] = masks[j]
 
-        masks = t['mask'][0]
+        w = max(xmax - xmin + 1, 1)
+        h = max(ymax - ymin + 1, 1)
 
-        s = 0
-        # for each sample
-        for i in range(len(lengths)):
-            num = lengths[i]
-            im_id = int(im_ids[i][0])
-            im_shape = t['im_shape'][0][i]
+        resized_mask = cv2.resize(padded_mask, (w, h))
+        resized_mask = np.array(resized_mask > thresh_binarize, dtype=np.uint8)
+        im_mask[:] = 0
 
-            bbox = bboxes[s:s + num][:, 2:]
-            clsid_scores = bboxes[s:s + num][:, 0:2]
-            mask = masks[s:s + num]
-            s += num
+        x0 = min(max(xmin, 0), im_w)
+        x1 = min(max(xmax + 1, 0), im_w)
+        y0 = min(max(ymin, 0), im_h)
+        y1 = min(max(ymax + 1, 0), im_h)
 
-            im_h = int(im_shape[0])
-            im_w = int(im_shape[1])
+        im_mask[y0:y1, x0:x1] = resized_mask[(y0 - ymin):(y1 - ymin), (
+            x0 - xmin):(x1 - xmin)]
+        segm = mask_util.encode(
+            np.array(
+                im_mask[:, :, np.newaxis], order='F'))[0]
+        segm['counts'] = segm['counts'].decode('utf8')
+        segms.append(segm)
+    return im_id, bboxes, segms
 
-            expand_bbox = expand_boxes(bbox, scale)
-            expand_bbox = expand_bbox.astype(np.int32)
 
-            padded_mask = np.zeros(
-                (resolution + 2, resolution + 2), dtype=np.float32)
+def segm2columns(im_id, bboxes, segms, clsid2catid):
+    """
+    Convert the output of encode_masks to columnar arrays.
+    """
+    num = len(segms)
+    return {
+        'image_id': np.full((num, ), im_id, dtype=np.int64),
+        'category_id': _catid_table(clsid2catid)[bboxes[:, 0].astype(
+            np.int64)],
+        'segmentation': segms,
+        'score': np.asarray(bboxes[:, 1], dtype=np.float64),
+    }
 
-            for j in range(num):
-                xmin, ymin, xmax, ymax = expand_bbox[j].tolist()
-                clsid, score = clsid_scores[j].tolist()
-                clsid = int(clsid)
-                padded_mask[1:-1, 1:-1] = mask[j, clsid, :, :]
-
-                catid = clsid2catid[clsid]
-
-                w = xmax - xmin + 1
-                h = ymax - ymin + 1
-                w = np.maximum(w, 1)
-                h = np.maximum(h, 1)
-
-                resized_mask = cv2.resize(padded_mask, (w, h))
-                resized_mask = np.array(
-                    resized_mask > thresh_binarize, dtype=np.uint8)
-                im_mask = np.zeros((im_h, im_w), dtype=np.uint8)
-
-                x0 = min(max(xmin, 0), im_w)
-                x1 = min(max(xmax + 1, 0), im_w)
-                y0 = min(max(ymin, 0), im_h)
-                y1 = min(max(ymax + 1, 0), im_h)
-
-                im_mask[y0:y1, x0:x1] = resized_mask[(y0 - ymin):(y1 - ymin), (
-                    x0 - xmin):(x1 - xmin)]
-                segm = mask_util.encode(
-                    np.array(
-                        im_mask[:, :, np.newaxis], order='F'))[0]
-                catid = clsid2catid[clsid]
-                segm['counts'] = segm['counts'].decode('utf8')
-                coco_res = {
-                    'image_id': im_id,
-                    'category_id': catid,
-                    'segmentation': segm,
-                    'score': score
-                }
-                segm_res.append(coco_res)
+
+def mask2out(results, clsid2catid, resolution, thresh_binarize=0.5):
+    segm_res = []
+    for t in results:
+        for args in mask2args(t, resolution, thresh_binarize):
+            segm_res.extend(
+                columns2out(segm2columns(*encode_masks(*args), clsid2catid)))
     return segm_res
 
 
+class COCOResultWriter(object):
+    """
+    Streaming COCO result sink, converts the results of each eval batch
+    to columnar arrays and appends them to a json file incrementally,
+    so no per detection dict of the whole dataset is kept in memory.
+    Masks are encoded to RLE in a process pool and written in order.
+
+    Args:
+        outfile (str): output json file.
+        style (str): result style, `bbox` or `segm`.
+        clsid2catid (dict): class id to category id map.
+        is_bbox_normalized (bool): whether or not bbox is normalized.
+        resolution (int): mask resolution, needed by `segm`.
+        thresh_binarize (float): mask binarize threshold.
+        num_workers (int): process number to encode masks, encode in
+            the current process if 0.
+        max_pending (int): max number of images being encoded, bounds
+            the memory held by the process pool.
+    """
+
+    def __init__(self,
+                 outfile,
+                 style,
+                 clsid2catid,
+                 is_bbox_normalized=False,
+                 resolution=None,
+                 thresh_binarize=0.5,
+                 num_workers=4,
+                 max_pending=256):
+        assert style in ['bbox', 'segm'], \
+            "unknown result style {}".format(style)
+        assert outfile.endswith('.json')
+        assert style != 'segm' or resolution is not None, \
+            "mask resolution should be set for segm results"
+        self.outfile = outfile
+        self.style = style
+        self.clsid2catid = clsid2catid
+        self.is_bbox_normalized = is_bbox_normalized
+        self.resolution = resolution
+        self.thresh_binarize = thresh_binarize
+        self.max_pending = max_pending
+        self.num = 0
+        self._bbox_columns = []
+        self._pending = []
+        self._pool = None
+        if style == 'segm' and num_workers > 0:
+            import multiprocessing
+            self._pool = multiprocessing.Pool(num_workers)
+        self._file = open(outfile, 'w')
+        self._file.write('[')
+
+    def update(self, res):
+        """
+        Append results of one eval batch.
+        """
+        if self._file is None:
+            raise ValueError("write to a closed COCOResultWriter")
+        if 'bbox' not in res or (self.style == 'segm' and 'mask' not in res):
+            return
+        if self.style == 'bbox':
+            columns = bbox2columns(res, self.clsid2catid,
+                                   self.is_bbox_normalized)
+            if columns is not None:
+                self._bbox_columns.append(columns)
+                self._write(columns)
+            return
+
+        for args in mask2args(res, self.resolution, self.thresh_binarize):
+            if self._pool is None:
+                self._write(segm2columns(*encode_masks(*args),
+                                         self.clsid2catid))
+            else:
+                self._pending.append(
+                    self._pool.apply_async(encode_masks, args))
+        self._flush(self.max_pending)
+
+    def close(self):
+        """
+        Wait for pending encodings and finish the json file.
+
+        Returns:
+            number of results written.
+        """
+        if self._file is None:
+            return self.num
+        self._flush(0)
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._file.write(']')
+        self._file.close()
+        self._file = None
+        logger.info("Write {} {} results to {}".format(self.num, self.style,
+                                                       self.outfile))
+        return self.num
+
+    def load_res(self):
+        """
+        Results for COCO.loadRes, a [N, 7] array of [image_id, x, y, w,
+        h, score, category_id] for `bbox`, which skips parsing the json
+        file, and the json file for `segm`.
+        """
+        self.close()
+        if self.style == 'segm' or len(self._bbox_columns) == 0:
+            return self.outfile
+        columns = {
+            k: np.concatenate([c[k] for c in self._bbox_columns])
+            for k in self._bbox_columns[0]
+        }
+        return np.hstack([
+            columns['image_id'][:, np.newaxis], columns['bbox'],
+            columns['score'][:, np.newaxis],
+            columns['category_id'][:, np.newaxis]
+        ])
+
+    def _flush(self, max_pending):
+        while len(self._pending) > max_pending:
+            columns = segm2columns(*self._pending.pop(0).get(),
+                                   self.clsid2catid)
+            self._write(columns)
+
+    def _write(self, columns):
+        res = columns2out(columns)
+        if len(res) == 0:
+            return
+        if self.num > 0:
+            self._file.write(', ')
+        self._file.write(json.dumps(res)[1:-1])
+        self.num += len(res)
+
+    def __del__(self):
+        if self._pool is not None:
+            self._pool.terminate()
+
+
 def expand_boxes(boxes, scale):
     """
     Expand an array of boxes by a given scale.
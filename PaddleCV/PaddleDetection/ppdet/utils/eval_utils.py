@@ -26,7 +26,10 @@ import paddle.fluid as fluid
 from ppdet.utils.voc_eval import bbox_eval as voc_bbox_eval
 from ppdet.utils.post_process import mstest_box_post_process, mstest_mask_post_process, box_flip
 
-__all__ = ['parse_fetches', 'eval_run', 'eval_results', 'json_eval_results']
+__all__ = [
+    'parse_fetches', 'eval_run', 'eval_results', 'json_eval_results',
+    'coco_result_writers'
+]
 
 logger = logging.getLogger(__name__)
 
@@ -103,9 +106,12 @@ def eval_run(exe,
              cfg=None,
              sub_prog=None,
              sub_keys=None,
-             sub_values=None):
+             sub_values=None,
+             result_writers=None):
     """
     Run evaluation program, return program outputs.
+    If result_writers is set, outputs of each batch are streamed to
+    the writers and masks are not kept in the returned outputs.
     """
     iter_id = 0
     results = []
@@ -152,6 +158,10 @@ def eval_run(exe,
             if multi_scale_test:
                 res = clean_res(
                     res, ['im_info', 'bbox', 'im_id', 'im_shape', 'mask'])
+            if result_writers:
+                for writer in result_writers:
+                    writer.update(res)
+                res.pop('mask', None)
             results.append(res)
             if iter_id % 100 == 0:
                 logger.info('Test iter {}'.format(iter_id))
@@ -180,11 +190,13 @@ def eval_results(results,
                  resolution=None,
                  is_bbox_normalized=False,
                  output_directory=None,
-                 map_type='11point'):
+                 map_type='11point',
+                 result_writers=None,
+                 num_workers=4):
     """Evaluation for evaluation program results"""
     box_ap_stats = []
     if metric == 'COCO':
-        from ppdet.utils.coco_eval import proposal_eval, bbox_eval, mask_eval
+        from ppdet.utils.coco_eval import proposal_eval, bbox_eval, mask_eval, cocoapi_eval
         anno_file = getattr(feed.dataset, 'annotation', None)
         with_background = getattr(feed, 'with_background', True)
         if 'proposal' in results[0]:
@@ -192,7 +204,19 @@ def eval_results(results,
             if output_directory:
                 output = os.path.join(output_directory, 'proposal.json')
             proposal_eval(results, anno_file, output)
-        if 'bbox' in results[0]:
+        streamed = []
+        for writer in result_writers or []:
+            streamed.append(writer.style)
+            if writer.close() == 0:
+                logger.warning("The number of valid {} detected is zero."
+                               .format(writer.style))
+                if writer.style == 'bbox':
+                    box_ap_stats = [0.0]
+                continue
+            stats = cocoapi_eval(writer, writer.style, anno_file=anno_file)
+            if writer.style == 'bbox':
+                box_ap_stats = stats
+        if 'bbox' in results[0] and 'bbox' not in streamed:
             output = 'bbox.json'
             if output_directory:
                 output = os.path.join(output_directory, 'bbox.json')
@@ -204,11 +228,16 @@ def eval_results(results,
                 with_background,
                 is_bbox_normalized=is_bbox_normalized)
 
-        if 'mask' in results[0]:
+        if 'mask' in results[0] and 'segm' not in streamed:
             output = 'mask.json'
             if output_directory:
                 output = os.path.join(output_directory, 'mask.json')
-            mask_eval(results, anno_file, output, resolution)
+            mask_eval(
+                results,
+                anno_file,
+                output,
+                resolution,
+                num_workers=num_workers)
     else:
         if 'accum_map' in results[-1]:
             res = np.mean(results[-1]['accum_map'][0])
@@ -245,3 +274,38 @@ def json_eval_results(feed, metric, json_directory=None):
             cocoapi_eval(v_json, coco_eval_style[i], anno_file=anno_file)
         else:
             logger.info("{} not exists!".format(v_json))
+
+
+def coco_result_writers(feed,
+                        output_directory=None,
+                        resolution=None,
+                        is_bbox_normalized=False,
+                        num_workers=4):
+    """
+    Create streaming COCO result writers of bbox results, and of mask
+    results if resolution is set, to be passed to eval_run and
+    eval_results
+    """
+    from ppdet.utils.coco_eval import COCOResultWriter, get_category_info_from_anno
+    anno_file = getattr(feed.dataset, 'annotation', None)
+    with_background = getattr(feed, 'with_background', True)
+    output_directory = output_directory or ''
+
+    clsid2catid, _ = get_category_info_from_anno(anno_file, with_background)
+    writers = [
+        COCOResultWriter(
+            os.path.join(output_directory, 'bbox.json'),
+            'bbox',
+            clsid2catid,
+            is_bbox_normalized=is_bbox_normalized)
+    ]
+    if resolution is not None:
+        clsid2catid, _ = get_category_info_from_anno(anno_file, True)
+        writers.append(
+            COCOResultWriter(
+                os.path.join(output_directory, 'mask.json'),
+                'segm',
+                clsid2catid,
+                resolution=resolution,
+                num_workers=num_workers))
+    return writers
@@ -22,7 +22,10 @@ import numpy as np
 import logging
 logger = logging.getLogger(__name__)
 
-__all__ = ['bbox_area', 'jaccard_overlap', 'DetectionMAP']
+__all__ = [
+    'bbox_area', 'jaccard_overlap', 'jaccard_overlaps', 'ScorePosRecord',
+    'DetectionMAP'
+]
 
 
 def bbox_area(bbox, is_bbox_normalized):
@@ -54,6 +57,71 @@ def jaccard_overlap(pred, gt, is_bbox_normalized=False):
     return overlap
 
 
+def jaccard_overlaps(preds, gts, is_bbox_normalized=False):
+    """
+    Calculate pairwise jaccard overlap ratio matrix of shape [P, G]
+    between P predicted and G ground truth bounding boxes, same
+    as calling jaccard_overlap for each pair
+    """
+    preds = np.asarray(preds, dtype=np.float64).reshape(-1, 4)[:, None, :]
+    gts = np.asarray(gts, dtype=np.float64).reshape(-1, 4)[None, :, :]
+    norm = 1. - float(is_bbox_normalized)
+    inter_w = np.minimum(preds[..., 2], gts[..., 2]) - \
+        np.maximum(preds[..., 0], gts[..., 0]) + norm
+    inter_h = np.minimum(preds[..., 3], gts[..., 3]) - \
+        np.maximum(preds[..., 1], gts[..., 1]) + norm
+    inter_size = inter_w * inter_h
+    pred_size = (preds[..., 2] - preds[..., 0] + norm) * \
+        (preds[..., 3] - preds[..., 1] + norm)
+    gt_size = (gts[..., 2] - gts[..., 0] + norm) * \
+        (gts[..., 3] - gts[..., 1] + norm)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overlap = inter_size / (pred_size + gt_size - inter_size)
+    disjoint = (preds[..., 0] >= gts[..., 2]) | (preds[..., 2] <= gts[..., 0]) \
+        | (preds[..., 1] >= gts[..., 3]) | (preds[..., 3] <= gts[..., 1])
+    overlap[disjoint] = 0.
+    return overlap
+
+
+class ScorePosRecord(object):
+    """
+    Growable arrays of [score, pos] records of one class, capacity
+    is doubled when full so appending is amortized O(1)
+
+    Args:
+        capacity (int): initial capacity. Default 1024.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self._scores = np.empty((capacity, ), dtype=np.float64)
+        self._poss = np.empty((capacity, ), dtype=np.float64)
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, scores, poss):
+        """
+        Append scores and positive flags of several predictions
+        """
+        num = len(scores)
+        if self.size + num > len(self._scores):
+            capacity = max(2 * len(self._scores), self.size + num)
+            self._scores = np.resize(self._scores, capacity)
+            self._poss = np.resize(self._poss, capacity)
+        self._scores[self.size:self.size + num] = scores
+        self._poss[self.size:self.size + num] = poss
+        self.size += num
+
+    @property
+    def scores(self):
+        return self._scores[:self.size]
+
+    @property
+    def poss(self):
+        return self._poss[:self.size]
+
+
 class DetectionMAP(object):
     """
     Calculate detection mean average precision.
@@ -95,46 +163,61 @@ class DetectionMAP(object):
         Update metric statics from given prediction and ground
         truth infomations.
         """
+        gt_label = np.array(gt_label).reshape(-1).astype(np.int64)
         if difficult is None:
             difficult = np.zeros_like(gt_label)
+        difficult = np.array(difficult).reshape(-1).astype(np.int64)
 
         # record class gt count
-        for gtl, diff in zip(gt_label, difficult):
-            if self.evaluate_difficult or int(diff) == 0:
-                self.class_gt_counts[int(np.array(gtl))] += 1
-
-        # record class score positive
-        visited = [False] * len(gt_label)
-        for b in bbox:
-            label, score, xmin, ymin, xmax, ymax = b.tolist()
-            pred = [xmin, ymin, xmax, ymax]
-            max_idx = -1
-            max_overlap = -1.0
-            for i, gl in enumerate(gt_label):
-                if int(gl) == int(label):
-                    overlap = jaccard_overlap(pred, gt_box[i],
-                                              self.is_bbox_normalized)
-                    if overlap > max_overlap:
-                        max_overlap = overlap
-                        max_idx = i
-
-            if max_overlap > self.overlap_thresh:
-                if self.evaluate_difficult or \
-                        int(np.array(difficult[max_idx])) == 0:
-                    if not visited[max_idx]:
-                        self.class_score_poss[int(label)].append([score, 1.0])
-                        visited[max_idx] = True
-                    else:
-                        self.class_score_poss[int(label)].append([score, 0.0])
-            else:
-                self.class_score_poss[int(label)].append([score, 0.0])
+        if self.evaluate_difficult:
+            np.add.at(self.class_gt_counts, gt_label, 1)
+        else:
+            np.add.at(self.class_gt_counts, gt_label[difficult == 0], 1)
+
+        bbox = np.array(bbox, dtype=np.float64).reshape(-1, 6)
+        if bbox.shape[0] == 0:
+            return
+        label = bbox[:, 0].astype(np.int64)
+        score = bbox[:, 1]
+
+        # each prediction matches the ground truth box of the same label
+        # with max overlap, the first one on ties
+        overlaps = jaccard_overlaps(bbox[:, 2:], gt_box,
+                                    self.is_bbox_normalized)
+        overlaps = np.where(label[:, None] == gt_label[None, :], overlaps, -1.)
+        if overlaps.shape[1] > 0:
+            max_idx = overlaps.argmax(axis=1)
+            max_overlap = overlaps[np.arange(len(label)), max_idx]
+        else:
+            max_idx = np.zeros_like(label)
+            max_overlap = -np.ones_like(score)
+
+        matched = max_overlap > self.overlap_thresh
+        ignored = np.zeros_like(matched)
+        if not self.evaluate_difficult:
+            ignored[matched] = difficult[max_idx[matched]] != 0
+
+        # only the first prediction matching a ground truth box in
+        # prediction order is a true positive, the others are false
+        pos = np.zeros_like(score)
+        matched_idx = np.where(matched & ~ignored)[0]
+        _, first = np.unique(max_idx[matched_idx], return_index=True)
+        pos[matched_idx[first]] = 1.0
+
+        keep = ~ignored
+        label, score, pos = label[keep], score[keep], pos[keep]
+        for l in np.unique(label):
+            inds = label == l
+            self.class_score_poss[int(l)].extend(score[inds], pos[inds])
 
     def reset(self):
         """
         Reset metric statics
         """
-        self.class_score_poss = [[] for _ in range(self.class_num)]
-        self.class_gt_counts = [0] * self.class_num
+        self.class_score_poss = [
+            ScorePosRecord() for _ in range(self.class_num)
+        ]
+        self.class_gt_counts = np.zeros((self.class_num, ), dtype=np.int64)
         self.mAP = None
 
     def accumulate(self):
@@ -148,39 +231,36 @@ class DetectionMAP(object):
             if count == 0 or len(score_pos) == 0:
                 continue
 
-            accum_tp_list, accum_fp_list = \
-                    self._get_tp_fp_accum(score_pos)
-            precision = []
-            recall = []
-            for ac_tp, ac_fp in zip(accum_tp_list, accum_fp_list):
-                precision.append(float(ac_tp) / (ac_tp + ac_fp))
-                recall.append(float(ac_tp) / count)
+            accum_tp, accum_fp = self._get_tp_fp_accum(score_pos)
+            precision = accum_tp / (accum_tp + accum_fp).astype(np.float64)
+            recall = accum_tp / float(count)
 
             if self.map_type == '11point':
+                # recall is non-decreasing, at recall level j / 10 take the
+                # max precision of the records scanned back from the
+                # previous level, same as a backward scan over all records
                 max_precisions = [0.] * 11
                 start_idx = len(precision) - 1
                 for j in range(10, -1, -1):
-                    for i in range(start_idx, -1, -1):
-                        if recall[i] < float(j) / 10.:
-                            start_idx = i
-                            if j > 0:
-                                max_precisions[j - 1] = max_precisions[j]
-                                break
-                        else:
-                            if max_precisions[j] < precision[i]:
-                                max_precisions[j] = precision[i]
+                    end_idx = np.searchsorted(
+                        recall[:start_idx + 1], float(j) / 10., side='left')
+                    if end_idx <= start_idx:
+                        max_precisions[j] = max(
+                            max_precisions[j],
+                            float(precision[end_idx:start_idx + 1].max()))
+                    if end_idx > 0:
+                        start_idx = end_idx - 1
+                        if j > 0:
+                            max_precisions[j - 1] = max_precisions[j]
                 mAP += sum(max_precisions) / 11.
                 valid_cnt += 1
             elif self.map_type == 'integral':
-                import math
-                ap = 0.
-                prev_recall = 0.
-                for i in range(len(precision)):
-                    recall_gap = math.fabs(recall[i] - prev_recall)
-                    if recall_gap > 1e-6:
-                        ap += precision[i] * recall_gap
-                        prev_recall = recall[i]
-                mAP += ap
+                # recall moves in steps of 1 / count, each step larger
+                # than 1e-6 adds precision * recall_gap to ap
+                recall_gap = np.diff(recall, prepend=0.)
+                inds = recall_gap > 1e-6
+                ap = np.cumsum(precision[inds] * recall_gap[inds])
+                mAP += float(ap[-1]) if len(ap) > 0 else 0.
                 valid_cnt += 1
             else:
                 logger.error("Unspported mAP type {}".format(self.map_type))
@@ -196,19 +276,13 @@ class DetectionMAP(object):
             logger.error("mAP is not calculated.")
         return self.mAP
 
-    def _get_tp_fp_accum(self, score_pos_list):
+    def _get_tp_fp_accum(self, score_pos):
         """
         Calculate accumulating true/false positive results from
         [score, pos] records
         """
-        sorted_list = sorted(score_pos_list, key=lambda s: s[0], reverse=True)
-        accum_tp = 0
-        accum_fp = 0
-        accum_tp_list = []
-        accum_fp_list = []
-        for (score, pos) in sorted_list:
-            accum_tp += int(pos)
-            accum_tp_list.append(accum_tp)
-            accum_fp += 1 - int(pos)
-            accum_fp_list.append(accum_fp)
-        return accum_tp_list, accum_fp_list
+        order = np.argsort(-score_pos.scores, kind='mergesort')
+        pos = score_pos.poss[order].astype(np.int64)
+        accum_tp = np.cumsum(pos)
+        accum_fp = np.cumsum(1 - pos)
+        return accum_tp, accum_fp
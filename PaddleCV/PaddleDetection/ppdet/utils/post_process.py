@@ -21,7 +21,7 @@ import numpy as np
 
 import paddle.fluid as fluid
 
-__all__ = ['nms']
+__all__ = ['nms', 'soft_nms', 'box_voting']
 
 logger = logging.getLogger(__name__)
 
@@ -48,69 +48,106 @@ def nms(dets, thresh):
     areas = (x2 - x1 + 1) * (y2 - y1 + 1)
     order = scores.argsort()[::-1]
 
-    ndets = dets.shape[0]
-    suppressed = np.zeros((ndets), dtype=np.int)
-
-    # nominal indices
-    # _i, _j
-    # sorted indices
-    # i, j
-    # temp variables for box i's (the box currently under consideration)
-    # ix1, iy1, ix2, iy2, iarea
-
-    # variables for computing overlap with box j (lower scoring box)
-    # xx1, yy1, xx2, yy2
-    # w, h
-    # inter, ovr
-
-    for _i in range(ndets):
-        i = order[_i]
-        if suppressed[i] == 1:
-            continue
-        ix1 = x1[i]
-        iy1 = y1[i]
-        ix2 = x2[i]
-        iy2 = y2[i]
-        iarea = areas[i]
-        for _j in range(_i + 1, ndets):
-            j = order[_j]
-            if suppressed[j] == 1:
-                continue
-            xx1 = max(ix1, x1[j])
-            yy1 = max(iy1, y1[j])
-            xx2 = min(ix2, x2[j])
-            yy2 = min(iy2, y2[j])
-            w = max(0.0, xx2 - xx1 + 1)
-            h = max(0.0, yy2 - yy1 + 1)
-            inter = w * h
-            ovr = inter / (iarea + areas[j] - inter)
-            if ovr >= thresh:
-                suppressed[j] = 1
+    # the box with the highest remaining score is always kept, every
+    # lower scoring box overlapping it is dropped in one vectorized step,
+    # suppressed boxes never suppress others, same as the pairwise loop
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[rest] - inter)
+        order = rest[ovr < thresh]
+
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
+def soft_nms(dets, sigma=0.5, thresh=0.3, score_thresh=0.001,
+             method='gaussian'):
+    """
+    Apply Soft-NMS, which decays the scores of overlapping boxes instead
+    of removing them.
+
+    Args:
+        dets (np.ndarray): detections of shape [N, 5], [score, x1, y1, x2, y2]
+        sigma (float): variance of the gaussian decay
+        thresh (float): IoU threshold of the linear and hard decay
+        score_thresh (float): boxes decayed below this score are dropped
+        method (str): one of 'linear', 'gaussian' or 'hard'
+
+    Returns:
+        rescored detections sorted by descending score.
+    """
+    assert method in ['linear', 'gaussian', 'hard'], \
+        "unknown soft-nms method {}".format(method)
+    if dets.shape[0] == 0:
+        return dets
+    dets = dets.copy()
+    x1 = dets[:, 1]
+    y1 = dets[:, 2]
+    x2 = dets[:, 3]
+    y2 = dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
 
-    return np.where(suppressed == 0)[0]
+    keep = []
+    remain = np.arange(dets.shape[0])
+    while remain.size > 0:
+        top = np.argmax(dets[remain, 0])
+        i = remain[top]
+        keep.append(i)
+        remain = np.delete(remain, top)
+        if remain.size == 0:
+            break
+        xx1 = np.maximum(x1[i], x1[remain])
+        yy1 = np.maximum(y1[i], y1[remain])
+        xx2 = np.minimum(x2[i], x2[remain])
+        yy2 = np.minimum(y2[i], y2[remain])
+        w = np.maximum(0.0, xx2 - xx1 + 1)
+        h = np.maximum(0.0, yy2 - yy1 + 1)
+        inter = w * h
+        ovr = inter / (areas[i] + areas[remain] - inter)
+        if method == 'linear':
+            weight = np.where(ovr > thresh, 1 - ovr, 1.0)
+        elif method == 'gaussian':
+            weight = np.exp(-(ovr * ovr) / sigma)
+        else:
+            weight = np.where(ovr > thresh, 0.0, 1.0)
+        dets[remain, 0] *= weight.astype(dets.dtype)
+        remain = remain[dets[remain, 0] >= score_thresh]
+
+    return dets[keep, :]
 
 
 def bbox_area(box):
-    w = box[2] - box[0] + 1
-    h = box[3] - box[1] + 1
+    w = box[..., 2] - box[..., 0] + 1
+    h = box[..., 3] - box[..., 1] + 1
     return w * h
 
 
 def bbox_overlaps(x, y):
-    N = x.shape[0]
-    K = y.shape[0]
-    overlaps = np.zeros((N, K), dtype=np.float32)
-    for k in range(K):
-        y_area = bbox_area(y[k])
-        for n in range(N):
-            iw = min(x[n, 2], y[k, 2]) - max(x[n, 0], y[k, 0]) + 1
-            if iw > 0:
-                ih = min(x[n, 3], y[k, 3]) - max(x[n, 1], y[k, 1]) + 1
-                if ih > 0:
-                    x_area = bbox_area(x[n])
-                    ua = x_area + y_area - iw * ih
-                    overlaps[n, k] = iw * ih / ua
-    return overlaps
+    """
+    Pairwise IoU matrix of shape [N, K] between boxes x [N, 4]
+    and boxes y [K, 4].
+    """
+    x_area = bbox_area(x)[:, np.newaxis]
+    y_area = bbox_area(y)[np.newaxis, :]
+    iw = np.minimum(x[:, np.newaxis, 2], y[np.newaxis, :, 2]) - \
+        np.maximum(x[:, np.newaxis, 0], y[np.newaxis, :, 0]) + 1
+    ih = np.minimum(x[:, np.newaxis, 3], y[np.newaxis, :, 3]) - \
+        np.maximum(x[:, np.newaxis, 1], y[np.newaxis, :, 1]) + 1
+    iw = np.maximum(iw, 0)
+    ih = np.maximum(ih, 0)
+    inter = iw * ih
+    ua = x_area + y_area - inter
+    overlaps = np.where(inter > 0, inter / np.where(inter > 0, ua, 1), 0)
+    return overlaps.astype(np.float32)
 
 
 def box_voting(nms_dets, dets, vote_thresh):
@@ -119,11 +156,11 @@ def box_voting(nms_dets, dets, vote_thresh):
     all_boxes = dets[:, 1:]
     all_scores = dets[:, 0]
     top_to_all_overlaps = bbox_overlaps(top_boxes, all_boxes)
-    for k in range(nms_dets.shape[0]):
-        inds_to_vote = np.where(top_to_all_overlaps[k] >= vote_thresh)[0]
-        boxes_to_vote = all_boxes[inds_to_vote, :]
-        ws = all_scores[inds_to_vote]
-        top_dets[k, 1:] = np.average(boxes_to_vote, axis=0, weights=ws)
+    # score weighted average of all boxes voting for each kept box,
+    # every kept box overlaps itself, so the weights never sum to zero
+    ws = np.where(top_to_all_overlaps >= vote_thresh, all_scores[np.newaxis],
+                  0).astype(all_scores.dtype)
+    top_dets[:, 1:] = np.dot(ws, all_boxes) / ws.sum(axis=1, keepdims=True)
 
     return top_dets
 
@@ -136,13 +173,19 @@ def get_nms_result(boxes, scores, cfg):
         boxes_j = boxes[inds, j * 4:(j + 1) * 4]
         dets_j = np.hstack((scores_j[:, np.newaxis], boxes_j)).astype(
             np.float32, copy=False)
-        keep = nms(dets_j, cfg.MultiScaleTEST['nms_thresh'])
-        nms_dets = dets_j[keep, :]
+        if cfg.MultiScaleTEST.get('use_soft_nms', False):
+            nms_dets = soft_nms(
+                dets_j,
+                sigma=cfg.MultiScaleTEST.get('soft_nms_sigma', 0.5),
+                thresh=cfg.MultiScaleTEST['nms_thresh'])
+        else:
+            keep = nms(dets_j, cfg.MultiScaleTEST['nms_thresh'])
+            nms_dets = dets_j[keep, :]
         if cfg.MultiScaleTEST['enable_voting']:
             nms_dets = box_voting(nms_dets, dets_j,
                                   cfg.MultiScaleTEST['vote_thresh'])
         #add labels
-        label = np.array([j for _ in range(len(keep))])
+        label = np.full((nms_dets.shape[0], ), j)
         nms_dets = np.hstack((label[:, np.newaxis], nms_dets)).astype(
             np.float32, copy=False)
         cls_boxes[j] = nms_dets
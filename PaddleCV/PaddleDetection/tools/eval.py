@@ -33,7 +33,7 @@ set_paddle_flags(
 
 import paddle.fluid as fluid
 
-from ppdet.utils.eval_utils import parse_fetches, eval_run, eval_results, json_eval_results
+from ppdet.utils.eval_utils import parse_fetches, eval_run, eval_results, json_eval_results, coco_result_writers
 import ppdet.utils.checkpoint as checkpoint
 from ppdet.utils.check import check_gpu
 from ppdet.modeling.model_input import create_feed
@@ -147,8 +147,18 @@ def main():
         if 'weights' in cfg:
             checkpoint.load_params(exe, sub_eval_prog, cfg.weights)
 
+    # stream bbox and mask results to json files batch by batch
+    result_writers = None
+    if FLAGS.stream_eval and cfg.metric == 'COCO':
+        resolution = None
+        if 'Mask' in main_arch:
+            resolution = model.mask_head.resolution
+        result_writers = coco_result_writers(
+            eval_feed, FLAGS.output_eval, resolution, is_bbox_normalized,
+            FLAGS.eval_workers)
+
     results = eval_run(exe, compile_program, pyreader, keys, values, cls, cfg,
-                       sub_eval_prog, sub_keys, sub_values)
+                       sub_eval_prog, sub_keys, sub_values, result_writers)
 
     # evaluation
     resolution = None
@@ -157,7 +167,8 @@ def main():
     # if map_type not set, use default 11point, only use in VOC eval
     map_type = cfg.map_type if 'map_type' in cfg else '11point'
     eval_results(results, eval_feed, cfg.metric, cfg.num_classes, resolution,
-                 is_bbox_normalized, FLAGS.output_eval, map_type)
+                 is_bbox_normalized, FLAGS.output_eval, map_type,
+                 result_writers, FLAGS.eval_workers)
 
 
 if __name__ == '__main__':
@@ -179,5 +190,17 @@ if __name__ == '__main__':
         default=None,
         type=str,
         help="Evaluation file directory, default is current directory.")
+    parser.add_argument(
+        "--stream_eval",
+        action='store_true',
+        default=False,
+        help="Whether to stream COCO results to json files batch by batch "
+        "instead of keeping all results in memory")
+    parser.add_argument(
+        "--eval_workers",
+        default=4,
+        type=int,
+        help="Process number to encode masks, encode in the main process "
+        "if 0.")
     FLAGS = parser.parse_args()
     main()
@@ -0,0 +1,150 @@
+# Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Micro-benchmark of the multi-scale test post-processing, compares the
+vectorized NMS and box voting in ppdet.utils.post_process with the
+original pure Python loops and checks that both give the same results.
+
+    python tools/post_process_benchmark.py --num_boxes 1000 --repeat 5
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+import numpy as np
+
+from ppdet.utils.post_process import nms, box_voting
+
+
+def loop_nms(dets, thresh):
+    if dets.shape[0] == 0:
+        return []
+    scores = dets[:, 0]
+    x1 = dets[:, 1]
+    y1 = dets[:, 2]
+    x2 = dets[:, 3]
+    y2 = dets[:, 4]
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = scores.argsort()[::-1]
+    ndets = dets.shape[0]
+    suppressed = np.zeros((ndets), dtype=np.int32)
+    for _i in range(ndets):
+        i = order[_i]
+        if suppressed[i] == 1:
+            continue
+        for _j in range(_i + 1, ndets):
+            j = order[_j]
+            if suppressed[j] == 1:
+                continue
+            xx1 = max(x1[i], x1[j])
+            yy1 = max(y1[i], y1[j])
+            xx2 = min(x2[i], x2[j])
+            yy2 = min(y2[i], y2[j])
+            w = max(0.0, xx2 - xx1 + 1)
+            h = max(0.0, yy2 - yy1 + 1)
+            inter = w * h
+            ovr = inter / (areas[i] + areas[j] - inter)
+            if ovr >= thresh:
+                suppressed[j] = 1
+    return np.where(suppressed == 0)[0]
+
+
+def loop_box_voting(nms_dets, dets, vote_thresh):
+    def area(box):
+        return (box[2] - box[0] + 1) * (box[3] - box[1] + 1)
+
+    top_dets = nms_dets.copy()
+    top_boxes = nms_dets[:, 1:]
+    all_boxes = dets[:, 1:]
+    all_scores = dets[:, 0]
+    overlaps = np.zeros((top_boxes.shape[0], all_boxes.shape[0]), np.float32)
+    for k in range(all_boxes.shape[0]):
+        for n in range(top_boxes.shape[0]):
+            x, y = top_boxes[n], all_boxes[k]
+            iw = min(x[2], y[2]) - max(x[0], y[0]) + 1
+            ih = min(x[3], y[3]) - max(x[1], y[1]) + 1
+            if iw > 0 and ih > 0:
+                overlaps[n, k] = iw * ih / (area(x) + area(y) - iw * ih)
+    for k in range(nms_dets.shape[0]):
+        inds = np.where(overlaps[k] >= vote_thresh)[0]
+        top_dets[k, 1:] = np.average(
+            all_boxes[inds, :], axis=0, weights=all_scores[inds])
+    return top_dets
+
+
+def random_dets(num_boxes, seed=0):
+    rng = np.random.RandomState(seed)
+    # clustered boxes, as produced by multi-scale and flip test
+    centers = rng.uniform(0, 1000, size=(num_boxes // 10 + 1, 2))
+    xy = centers[rng.randint(0, len(centers), num_boxes)] + \
+        rng.normal(0, 8, size=(num_boxes, 2))
+    wh = rng.uniform(20, 200, size=(num_boxes, 2))
+    scores = rng.uniform(0.05, 1, size=(num_boxes, 1))
+    dets = np.hstack([scores, xy, xy + wh])
+    return dets.astype(np.float32)
+
+
+def timeit(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        out = func()
+    return out, (time.time() - start) / repeat
+
+
+def main():
+    dets = random_dets(FLAGS.num_boxes)
+
+    keep_loop, t_loop = timeit(lambda: loop_nms(dets, FLAGS.nms_thresh),
+                               FLAGS.repeat)
+    keep_vec, t_vec = timeit(lambda: nms(dets, FLAGS.nms_thresh),
+                             FLAGS.repeat)
+    assert np.array_equal(keep_loop, keep_vec), "nms results mismatch"
+    print("nms        boxes: {}, kept: {}, loop: {:.4f}s, vectorized: "
+          "{:.4f}s, speedup: {:.1f}x".format(
+              len(dets), len(keep_vec), t_loop, t_vec, t_loop / t_vec))
+
+    nms_dets = dets[keep_vec, :]
+    vote_loop, t_loop = timeit(
+        lambda: loop_box_voting(nms_dets, dets, FLAGS.vote_thresh),
+        FLAGS.repeat)
+    vote_vec, t_vec = timeit(
+        lambda: box_voting(nms_dets, dets, FLAGS.vote_thresh), FLAGS.repeat)
+    assert np.allclose(vote_loop, vote_vec, rtol=1e-5, atol=1e-3), \
+        "box voting results mismatch"
+    print("box_voting boxes: {}, kept: {}, loop: {:.4f}s, vectorized: "
+          "{:.4f}s, speedup: {:.1f}x".format(
+              len(dets), len(keep_vec), t_loop, t_vec, t_loop / t_vec))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--num_boxes",
+        default=1000,
+        type=int,
+        help="Number of pre-NMS boxes of one class.")
+    parser.add_argument(
+        "--nms_thresh", default=0.5, type=float, help="NMS IoU threshold.")
+    parser.add_argument(
+        "--vote_thresh",
+        default=0.9,
+        type=float,
+        help="Box voting IoU threshold.")
+    parser.add_argument(
+        "--repeat", default=3, type=int, help="Repeat times of each run.")
+    FLAGS = parser.parse_args()
+    main()
@@ -0,0 +1,124 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Benchmark of the mp4 loaders of KineticsReader, compares decoding all frames
+(mp4_dense_loader) with decoding only the sampled ones (mp4_loader) and
+reports the sampled frames per second of each.
+
+    # on a list of videos, one 'path label' per line as the mp4 filelist
+    python data/dataset/kinetics/mp4_loader_benchmark.py --filelist val.list
+    # on a generated 10 seconds video
+    python data/dataset/kinetics/mp4_loader_benchmark.py --seg_num 8
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import cv2
+import numpy as np
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from reader.kinetics_reader import mp4_loader, mp4_dense_loader
+
+
+def make_video(path, num_frames, width=340, height=256, fps=30):
+    writer = cv2.VideoWriter(path,
+                             cv2.VideoWriter_fourcc(*'mp4v'), fps,
+                             (width, height))
+    rng = np.random.RandomState(0)
+    base = rng.randint(0, 255, (height, width, 3)).astype('uint8')
+    for i in range(num_frames):
+        frame = np.roll(base, i * 2, axis=1)
+        cv2.putText(frame,
+                    str(i), (20, 100), cv2.FONT_HERSHEY_SIMPLEX, 2,
+                    (255, 255, 255), 3)
+        writer.write(frame)
+    writer.release()
+
+
+def run(loader, videos, mode, repeat, **kwargs):
+    random.seed(0)
+    num_frames = 0
+    start = time.time()
+    for _ in range(repeat):
+        for video in videos:
+            imgs = loader(video, args.seg_num, args.seglen, mode, **kwargs)
+            num_frames += len(imgs)
+    return num_frames / (time.time() - start)
+
+
+def main():
+    if args.filelist:
+        with open(args.filelist) as f:
+            videos = [line.strip().split(' ')[0] for line in f if line.strip()]
+        videos = videos[:args.num_videos]
+    else:
+        video = os.path.join(tempfile.mkdtemp(), 'benchmark.mp4')
+        make_video(video, args.num_frames)
+        videos = [video]
+
+    # both loaders sample the same frames in test mode
+    for video in videos[:3]:
+        dense = mp4_dense_loader(video, args.seg_num, args.seglen, 'test')
+        sparse = mp4_loader(
+            video, args.seg_num, args.seglen, 'test', seek_gap=args.seek_gap)
+        assert len(dense) == len(sparse)
+        for a, b in zip(dense, sparse):
+            assert np.array_equal(np.array(a), np.array(b)), \
+                "sampled frames of {} mismatch".format(video)
+
+    print("videos: {}, seg_num: {}, seglen: {}".format(
+        len(videos), args.seg_num, args.seglen))
+    for mode in ['train', 'test']:
+        dense = run(mp4_dense_loader, videos, mode, args.repeat)
+        sparse = run(mp4_loader,
+                     videos,
+                     mode,
+                     args.repeat,
+                     seek_gap=args.seek_gap)
+        print("{:5s} dense: {:.1f} frames/s, sparse: {:.1f} frames/s, "
+              "speedup: {:.2f}x".format(mode, dense, sparse, sparse / dense))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--filelist', default='', type=str, help='mp4 filelist to decode.')
+    parser.add_argument(
+        '--num_videos',
+        default=100,
+        type=int,
+        help='Max number of videos of the filelist.')
+    parser.add_argument(
+        '--num_frames',
+        default=300,
+        type=int,
+        help='Number of frames of the generated video.')
+    parser.add_argument(
+        '--seg_num', default=8, type=int, help='Number of segments.')
+    parser.add_argument(
+        '--seglen', default=1, type=int, help='Frames of each segment.')
+    parser.add_argument(
+        '--seek_gap',
+        default=32,
+        type=int,
+        help='Seek instead of grab when the next sampled frame is further.')
+    parser.add_argument(
+        '--repeat', default=5, type=int, help='Repeat times of each run.')
+    args = parser.parse_args()
+    main()
@@ -0,0 +1,142 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Convert a pkl or mp4 filelist of KineticsReader to frame shards, and write
+the shard filelist to use with format "shard".
+
+    # pkl filelist, one pkl path per line
+    python video2shard.py --input_format pkl --filelist train.list \\
+        --output_dir data_k400/train_shard --output_list train_shard.list
+    # mp4 filelist, one 'path label' per line
+    python video2shard.py --input_format mp4 --filelist train_mp4.list \\
+        --output_dir data_k400/train_shard --output_list train_shard.list
+"""
+
+import os
+import sys
+import random
+import argparse
+from multiprocessing import Pool
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import cv2
+
+sys.path.insert(
+    0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+from reader.frame_shard import FrameShardWriter, INDEX_SUFFIX
+
+
+def load_pkl(line):
+    path = line.strip()
+    if sys.version_info < (3, 0):
+        vid, label, frames = pickle.load(open(path, 'rb'))
+    else:
+        vid, label, frames = pickle.load(open(path, 'rb'), encoding='bytes')
+    return vid, label, frames
+
+
+def load_mp4(line):
+    path, label = line.strip().split(' ')
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(
+            cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY,
+                                         FLAGS.quality])[1].tobytes())
+    cap.release()
+    vid = './' + os.path.basename(path).split('.')[0]
+    return vid, int(label), frames
+
+
+def write_shard(task):
+    prefix, lines = task
+    load = load_pkl if FLAGS.input_format == 'pkl' else load_mp4
+    writer = FrameShardWriter(prefix)
+    for line in lines:
+        try:
+            vid, label, frames = load(line)
+        except Exception as e:
+            print("Skip {}: {}".format(line.strip(), e))
+            continue
+        writer.add(vid, label, frames)
+    writer.close()
+    print("Write {} videos to {}".format(len(writer), prefix))
+    return prefix + INDEX_SUFFIX
+
+
+def main():
+    with open(FLAGS.filelist) as f:
+        lines = [line for line in f if line.strip()]
+    # filelists are often sorted by class, shuffle so that every shard holds
+    # a mix of classes and the shard level shuffle of the reader is enough
+    random.Random(FLAGS.seed).shuffle(lines)
+    if not os.path.exists(FLAGS.output_dir):
+        os.makedirs(FLAGS.output_dir)
+    tasks = []
+    for i in range(0, len(lines), FLAGS.videos_per_shard):
+        prefix = os.path.join(FLAGS.output_dir, "{}-{:05d}".format(
+            FLAGS.prefix, len(tasks)))
+        tasks.append((prefix, lines[i:i + FLAGS.videos_per_shard]))
+
+    pool = Pool(processes=FLAGS.num_threads)
+    index_paths = pool.map(write_shard, tasks)
+    pool.close()
+    pool.join()
+    with open(FLAGS.output_list, 'w') as f:
+        for path in index_paths:
+            f.write(path + '\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--input_format',
+        default='pkl',
+        choices=['pkl', 'mp4'],
+        help='Format of the videos in filelist.')
+    parser.add_argument(
+        '--filelist', type=str, required=True, help='Filelist to convert.')
+    parser.add_argument(
+        '--output_dir', type=str, required=True, help='Directory of shards.')
+    parser.add_argument(
+        '--output_list',
+        type=str,
+        required=True,
+        help='Filelist of the shards to write.')
+    parser.add_argument(
+        '--prefix', default='kinetics', type=str, help='Prefix of shards.')
+    parser.add_argument(
+        '--videos_per_shard',
+        default=1000,
+        type=int,
+        help='Number of videos of each shard.')
+    parser.add_argument(
+        '--quality',
+        default=95,
+        type=int,
+        help='JPEG quality of the frames decoded from mp4.')
+    parser.add_argument(
+        '--num_threads', default=8, type=int, help='Number of processes.')
+    parser.add_argument(
+        '--seed',
+        default=0,
+        type=int,
+        help='Random seed of the shuffle of filelist before sharding.')
+    FLAGS = parser.parse_args()
+    main()
@@ -15,10 +15,8 @@ import numpy as np
 import datetime
 import logging
 import json
-import pandas as pd
-from models.bmn.bmn_utils import boundary_choose, soft_nms, bmn_post_processing
+from models.bmn.bmn_utils import gen_props, bmn_post_processing
 import time
-import os
 logger = logging.getLogger(__name__)
 
 
@@ -38,8 +36,8 @@ class MetricsCalculator():
             1.0 / self.tscale * i for i in range(1, self.tscale + 1)
         ]
         if self.mode == "test" or self.mode == "infer":
-            self.output_path = cfg[self.mode.upper()]["output_path"]
             self.result_path = cfg[self.mode.upper()]["result_path"]
+            self.pp_num = cfg[self.mode.upper()].get("pp_num", 12)
         self.reset()
 
     def get_dataset_dict(self):
@@ -65,36 +63,13 @@ class MetricsCalculator():
         self.aggr_pem_reg_loss = 0.0
         self.aggr_pem_cls_loss = 0.0
         self.aggr_batch_size = 0
-        if self.mode == 'test' or self.mode == "infer":
-            if not os.path.exists(self.output_path):
-                os.makedirs(self.output_path)
+        self.video_props = {}
 
     def gen_props(self, pred_bm, pred_start, pred_end, fid):
         video_name = self.video_list[fid]
         pred_bm = pred_bm[0, 0, :, :] * pred_bm[0, 1, :, :]
-        start_mask = boundary_choose(pred_start)
-        start_mask[0] = 1.
-        end_mask = boundary_choose(pred_end)
-        end_mask[-1] = 1.
-        score_vector_list = []
-        for idx in range(self.dscale):
-            for jdx in range(self.tscale):
-                start_index = jdx
-                end_index = start_index + idx
-                if end_index < self.tscale and start_mask[
-                        start_index] == 1 and end_mask[end_index] == 1:
-                    xmin = self.snippet_xmins[start_index]
-                    xmax = self.snippet_xmaxs[end_index]
-                    xmin_score = pred_start[start_index]
-                    xmax_score = pred_end[end_index]
-                    bm_score = pred_bm[idx, jdx]
-                    conf_score = xmin_score * xmax_score * bm_score
-                    score_vector_list.append([xmin, xmax, conf_score])
-
-        score_vector_list = np.stack(score_vector_list)
-        video_df = pd.DataFrame(score_vector_list, columns=self.cols)
-        video_df.to_csv(
-            os.path.join(self.output_path, "%s.csv" % video_name), index=False)
+        self.video_props[video_name] = gen_props(
+            pred_bm, pred_start, pred_end, self.tscale, self.dscale)
 
     def accumulate(self, fetch_list):
         cur_batch_size = 1  # iteration counter,for test and inference, batch_size=1
@@ -129,12 +104,13 @@ class MetricsCalculator():
         self.avg_pem_reg_loss = self.aggr_pem_reg_loss / self.aggr_batch_size
         self.avg_pem_cls_loss = self.aggr_pem_cls_loss / self.aggr_batch_size
         if self.mode == 'test':
-            bmn_post_processing(self.video_dict, self.subset, self.output_path,
-                                self.result_path)
+            bmn_post_processing(self.video_dict, self.subset,
+                                self.video_props, self.result_path,
+                                self.pp_num)
 
     def finalize_infer_metrics(self):
-        bmn_post_processing(self.video_dict, self.subset, self.output_path,
-                            self.result_path)
+        bmn_post_processing(self.video_dict, self.subset, self.video_props,
+                            self.result_path, self.pp_num)
 
     def get_computed_metrics(self):
         json_stats = {}
@@ -15,11 +15,9 @@ import numpy as np
 import datetime
 import logging
 import json
-import pandas as pd
-from models.bsn.bsn_utils import soft_nms, bsn_post_processing
+from models.bsn.bsn_utils import bsn_post_processing
 import time
 logger = logging.getLogger(__name__)
-import os
 
 
 class MetricsCalculator():
@@ -32,8 +30,8 @@ class MetricsCalculator():
         self.file_list = cfg["INFER"]["filelist"]
         self.get_dataset_dict()
         if self.mode == "test" or self.mode == "infer":
-            self.output_path_pem = cfg[self.mode.upper()]["output_path_pem"]
             self.result_path_pem = cfg[self.mode.upper()]["result_path_pem"]
+            self.pp_num = cfg[self.mode.upper()].get("pp_num", 12)
         self.reset()
 
     def get_dataset_dict(self):
@@ -56,24 +54,20 @@ class MetricsCalculator():
         logger.info('Resetting {} metrics...'.format(self.mode))
         self.aggr_loss = 0.0
         self.aggr_batch_size = 0
-        if self.mode == 'test' or self.mode == 'infer':
-            if not os.path.exists(self.output_path_pem):
-                os.makedirs(self.output_path_pem)
+        self.video_props = {}
 
     def save_results(self, pred_iou, props_info, fid):
         if self.mode == 'infer':
             video_name = self.video_list[fid[0]]
         else:
             video_name = self.video_list[fid[0][0]]
-        df = pd.DataFrame()
-        df["xmin"] = props_info[0, :, 0]
-        df["xmax"] = props_info[0, :, 1]
-        df["xmin_score"] = props_info[0, :, 2]
-        df["xmax_score"] = props_info[0, :, 3]
-        df["iou_score"] = pred_iou.squeeze()
-        df.to_csv(
-            os.path.join(self.output_path_pem, video_name + ".csv"),
-            index=False)
+        # proposals of [xmin, xmax, score], kept in memory for soft-nms
+        props = props_info[0, :, :2].astype('float64')
+        score = props_info[0, :, 2].astype('float64') * \
+            props_info[0, :, 3].astype('float64') * \
+            pred_iou.squeeze().astype('float64')
+        self.video_props[video_name] = np.concatenate(
+            [props, score[:, None]], axis=1)
 
     def accumulate(self, fetch_list):
         cur_batch_size = 1  # iteration counter
@@ -98,11 +92,12 @@ class MetricsCalculator():
         self.avg_loss = self.aggr_loss / self.aggr_batch_size
         if self.mode == 'test':
             bsn_post_processing(self.video_dict, self.subset,
-                                self.output_path_pem, self.result_path_pem)
+                                self.video_props, self.result_path_pem,
+                                self.pp_num)
 
     def finalize_infer_metrics(self):
-        bsn_post_processing(self.video_dict, self.subset, self.output_path_pem,
-                            self.result_path_pem)
+        bsn_post_processing(self.video_dict, self.subset, self.video_props,
+                            self.result_path_pem, self.pp_num)
 
     def get_computed_metrics(self):
         json_stats = {}
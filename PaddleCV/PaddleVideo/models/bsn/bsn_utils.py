@@ -17,7 +17,6 @@ from scipy.interpolate import interp1d
 import pandas as pd
 import multiprocessing as mp
 import json
-import pandas
 import numpy
 import random
 import os
@@ -59,105 +58,78 @@ def boundary_choose(score_list, peak_thres):
     return mask
 
 
-def soft_nms(df, alpha, t1, t2):
+def soft_nms_props(props, alpha, t1, t2, max_num=101):
     '''
-    df: proposals generated by network;
+    props: proposals generated by network, array of [xmin, xmax, score];
     alpha: alpha value of Gaussian decaying function;
-    t1, t2: threshold for soft nms.
+    t1, t2: threshold for soft nms;
+    max_num: max number of kept proposals.
+    returns kept proposals as array of [xmin, xmax, score].
     '''
-    df = df.sort_values(by="score", ascending=False)
-    tstart = list(df.xmin.values[:])
-    tend = list(df.xmax.values[:])
-    tscore = list(df.score.values[:])
-
-    rstart = []
-    rend = []
-    rscore = []
-
-    while len(tscore) > 1 and len(rscore) < 101:
-        max_index = tscore.index(max(tscore))
-        tmp_iou_list = iou_with_anchors(
-            np.array(tstart),
-            np.array(tend), tstart[max_index], tend[max_index])
-        for idx in range(0, len(tscore)):
-            if idx != max_index:
-                tmp_iou = tmp_iou_list[idx]
-                tmp_width = tend[max_index] - tstart[max_index]
-                if tmp_iou > t1 + (t2 - t1) * tmp_width:
-                    tscore[idx] = tscore[idx] * np.exp(-np.square(tmp_iou) /
-                                                       alpha)
-
-        rstart.append(tstart[max_index])
-        rend.append(tend[max_index])
-        rscore.append(tscore[max_index])
-        tstart.pop(max_index)
-        tend.pop(max_index)
-        tscore.pop(max_index)
-
-    newDf = pd.DataFrame()
-    newDf['score'] = rscore
-    newDf['xmin'] = rstart
-    newDf['xmax'] = rend
-    return newDf
-
-
-def video_process(video_list,
-                  video_dict,
-                  output_path_pem,
-                  snms_alpha=0.75,
-                  snms_t1=0.65,
-                  snms_t2=0.9):
-
-    for video_name in video_list:
-        df = pd.read_csv(os.path.join(output_path_pem, video_name + ".csv"))
-        df["score"] = df.xmin_score.values[:] * df.xmax_score.values[:] * df.iou_score.values[:]
-        if len(df) > 1:
-            df = soft_nms(df, snms_alpha, snms_t1, snms_t2)
-
-        video_duration = video_dict[video_name]["duration_second"]
-        proposal_list = []
-        for idx in range(min(100, len(df))):
-            tmp_prop={"score":df.score.values[idx],\
-                      "segment":[max(0,df.xmin.values[idx])*video_duration,\
-                                 min(1,df.xmax.values[idx])*video_duration]}
-            proposal_list.append(tmp_prop)
-        result_dict[video_name[2:]] = proposal_list
-
-
-def bsn_post_processing(video_dict, subset, output_path_pem, result_path_pem):
-    video_list = video_dict.keys()
+    order = np.argsort(-props[:, 2], kind='mergesort')
+    tstart = props[order, 0].astype('float64')
+    tend = props[order, 1].astype('float64')
+    tscore = props[order, 2].astype('float64')
+    alive = np.ones(len(tscore), dtype=bool)
+
+    keep = []
+    num_alive = len(tscore)
+    while num_alive > 1 and len(keep) < max_num:
+        max_index = np.flatnonzero(alive)[np.argmax(tscore[alive])]
+        tmp_iou = iou_with_anchors(tstart, tend, tstart[max_index],
+                                   tend[max_index])
+        tmp_width = tend[max_index] - tstart[max_index]
+        decay = alive & (tmp_iou > t1 + (t2 - t1) * tmp_width)
+        decay[max_index] = False
+        tscore[decay] = tscore[decay] * np.exp(-np.square(tmp_iou[decay]) /
+                                               alpha)
+        keep.append(max_index)
+        alive[max_index] = False
+        num_alive -= 1
+
+    keep = np.array(keep, dtype='int64')
+    return np.stack([tstart[keep], tend[keep], tscore[keep]], axis=1)
+
+
+def video_process(args):
+    video_name, props, video_duration, snms_alpha, snms_t1, snms_t2 = args
+    if len(props) > 1:
+        props = soft_nms_props(props, snms_alpha, snms_t1, snms_t2)
+
+    proposal_list = []
+    for idx in range(min(100, len(props))):
+        tmp_prop={"score":float(props[idx, 2]),\
+                  "segment":[max(0,props[idx, 0])*video_duration,\
+                             min(1,props[idx, 1])*video_duration]}
+        proposal_list.append(tmp_prop)
+    return video_name[2:], proposal_list
+
+
+def bsn_post_processing(video_dict,
+                        subset,
+                        video_props,
+                        result_path_pem,
+                        pp_num=12,
+                        snms_alpha=0.75,
+                        snms_t1=0.65,
+                        snms_t2=0.9):
+    """Soft-NMS the proposals of all videos in 'video_props', a dict of
+    video name to array of [xmin, xmax, score], with a pool of 'pp_num'
+    processes, and dump the results to 'result_path_pem'.
+    """
     video_list = list(video_dict.keys())
-    global result_dict
-    result_dict = mp.Manager().dict()
-    pp_num = 12
-
-    num_videos = len(video_list)
-    num_videos_per_thread = int(num_videos / pp_num)
-    processes = []
-    for tid in range(pp_num - 1):
-        tmp_video_list = video_list[tid * num_videos_per_thread:(tid + 1) *
-                                    num_videos_per_thread]
-        p = mp.Process(
-            target=video_process,
-            args=(
-                tmp_video_list,
-                video_dict,
-                output_path_pem, ))
-        p.start()
-        processes.append(p)
-    tmp_video_list = video_list[(pp_num - 1) * num_videos_per_thread:]
-    p = mp.Process(
-        target=video_process,
-        args=(
-            tmp_video_list,
-            video_dict,
-            output_path_pem, ))
-    p.start()
-    processes.append(p)
-    for p in processes:
-        p.join()
-
-    result_dict = dict(result_dict)
+    tasks = [(video_name, video_props[video_name],
+              video_dict[video_name]["duration_second"], snms_alpha, snms_t1,
+              snms_t2) for video_name in video_list]
+    if pp_num > 1:
+        pool = mp.Pool(pp_num)
+        results = pool.map(video_process, tasks, chunksize=16)
+        pool.close()
+        pool.join()
+    else:
+        results = [video_process(task) for task in tasks]
+
+    result_dict = dict(results)
     output_dict = {
         "version": "VERSION 1.3",
         "results": result_dict,
@@ -183,7 +155,7 @@ def generate_props(pgm_config, video_list, video_dict, output_path_tem,
         else:
             top_K = pgm_config["pgm_top_K"]
 
-        tdf = pandas.read_csv(
+        tdf = pd.read_csv(
             os.path.join(output_path_tem, video_name + ".csv"))
         start_scores = tdf.start.values[:]
         end_scores = tdf.end.values[:]
@@ -219,7 +191,7 @@ def generate_props(pgm_config, video_list, video_dict, output_path_tem,
 
         score_vector_list = np.stack(score_vector_list)
         col_name = ["xmin", "xmax", "xmin_score", "xmax_score"]
-        new_df = pandas.DataFrame(score_vector_list, columns=col_name)
+        new_df = pd.DataFrame(score_vector_list, columns=col_name)
         new_df["score"] = new_df.xmin_score * new_df.xmax_score
         new_df = new_df.sort_values(by="score", ascending=False)
         new_df = new_df[:top_K]
@@ -272,13 +244,13 @@ def generate_feats(pgm_config, video_list, video_dict, output_path_tem,
     seg_xmaxs = [1.0 / tscale * i for i in range(1, tscale + 1)]
 
     for video_name in video_list:
-        adf = pandas.read_csv(
+        adf = pd.read_csv(
             os.path.join(output_path_tem, video_name + ".csv"))
         score_action = adf.action.values[:]
         video_scale = len(adf)
         video_gap = seg_xmaxs[0] - seg_xmins[0]
         video_extend = int(video_scale / 4 + 10)
-        pdf = pandas.read_csv(
+        pdf = pd.read_csv(
             os.path.join(output_path_pgm_proposal, video_name + ".csv"))
         tmp_zeros = numpy.zeros([video_extend])
         score_action = numpy.concatenate((tmp_zeros, score_action, tmp_zeros))
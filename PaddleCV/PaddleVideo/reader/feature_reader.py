@@ -13,6 +13,8 @@
 #limitations under the License.
 
 import sys
+import functools
+import paddle
 from .reader_utils import DataReader
 try:
     import cPickle as pickle
@@ -35,11 +37,13 @@ class FeatureReader(DataReader):
                  batch_size
                  list
                  NextVlad only: eigen_file
+                 shuffle_size, size of the shuffle buffer across files when training
+                 num_threads, number of threads to process and prefetch samples
+                 buf_size, size of the prefetch queue
     """
 
     def __init__(self, name, mode, cfg):
-        self.name = name
-        self.mode = mode
+        super(FeatureReader, self).__init__(name, mode, cfg)
         self.num_classes = cfg.MODEL.num_classes
 
         # set batch size and file list
@@ -47,65 +51,104 @@ class FeatureReader(DataReader):
         self.filelist = cfg[mode.upper()]['filelist']
         self.eigen_file = cfg.MODEL.get('eigen_file', None)
         self.seg_num = cfg.MODEL.get('seg_num', None)
+        self.shuffle_size = self.get_config_from_sec(mode, 'shuffle_size',
+                                                     1024)
+        self.num_threads = self.get_config_from_sec(mode, 'num_threads', 1)
+        self.buf_size = self.get_config_from_sec(mode, 'buf_size', 1024)
 
     def create_reader(self):
         fl = open(self.filelist).readlines()
         fl = [line.strip() for line in fl if line.strip() != '']
-        if self.mode == 'train':
+
+        def load_file(filepath):
+            if python_ver < (3, 0):
+                data = pickle.load(open(filepath, 'rb'))
+            else:
+                data = pickle.load(open(filepath, 'rb'), encoding='bytes')
+            return data
+
+        def record_reader():
+            if self.mode != 'train':
+                for filepath in fl:
+                    for record in load_file(filepath):
+                        yield record
+                return
+
+            # records of several files are mixed in the shuffle buffer,
+            # a random one of the buffer is replaced by each new record
             random.shuffle(fl)
+            buf = []
+            for filepath in fl:
+                data = load_file(filepath)
+                random.shuffle(data)
+                for record in data:
+                    if len(buf) < self.shuffle_size:
+                        buf.append(record)
+                        continue
+                    i = random.randint(0, len(buf) - 1)
+                    yield buf[i]
+                    buf[i] = record
+            random.shuffle(buf)
+            for record in buf:
+                yield record
+
+        mapper = functools.partial(
+            process_record,
+            mode=self.mode,
+            name=self.name,
+            num_classes=self.num_classes,
+            seg_num=self.seg_num)
 
         def reader():
+            if self.num_threads > 1:
+                samples = paddle.reader.xmap_readers(
+                    mapper,
+                    record_reader,
+                    self.num_threads,
+                    self.buf_size,
+                    order=(self.mode != 'train'))()
+            else:
+                samples = (mapper(record) for record in record_reader())
             batch_out = []
-            for filepath in fl:
-                if python_ver < (3, 0):
-                    data = pickle.load(open(filepath, 'rb'))
-                else:
-                    data = pickle.load(open(filepath, 'rb'), encoding='bytes')
-                indexes = list(range(len(data)))
-                if self.mode == 'train':
-                    random.shuffle(indexes)
-                for i in indexes:
-                    record = data[i]
-                    nframes = record[b'nframes']
-                    rgb = record[b'feature'].astype(float)
-                    audio = record[b'audio'].astype(float)
-                    if self.mode != 'infer':
-                        label = record[b'label']
-                        one_hot_label = make_one_hot(label, self.num_classes)
-                    video = record[b'video']
-
-                    rgb = rgb[0:nframes, :]
-                    audio = audio[0:nframes, :]
-
-                    if self.name != 'NEXTVLAD':
-                        rgb = dequantize(
-                            rgb,
-                            max_quantized_value=2.,
-                            min_quantized_value=-2.)
-                        audio = dequantize(
-                            audio,
-                            max_quantized_value=2,
-                            min_quantized_value=-2)
-
-                    if self.name == 'ATTENTIONCLUSTER':
-                        sample_inds = generate_random_idx(rgb.shape[0],
-                                                          self.seg_num)
-                        rgb = rgb[sample_inds]
-                        audio = audio[sample_inds]
-                    if self.mode != 'infer':
-                        batch_out.append((rgb, audio, one_hot_label))
-                    else:
-                        batch_out.append((rgb, audio, video))
-                    if len(batch_out) == self.batch_size:
-                        yield batch_out
-                        batch_out = []
+            for sample in samples:
+                batch_out.append(sample)
+                if len(batch_out) == self.batch_size:
+                    yield batch_out
+                    batch_out = []
 
         return reader
 
 
+def process_record(record, mode, name, num_classes, seg_num):
+    nframes = record[b'nframes']
+    rgb = record[b'feature'][0:nframes, :]
+    audio = record[b'audio'][0:nframes, :]
+
+    # subsample the frames before dequantizing
+    if name == 'ATTENTIONCLUSTER':
+        sample_inds = generate_random_idx(rgb.shape[0], seg_num)
+        rgb = rgb[sample_inds]
+        audio = audio[sample_inds]
+
+    if name != 'NEXTVLAD':
+        rgb = dequantize(
+            rgb, max_quantized_value=2., min_quantized_value=-2.)
+        audio = dequantize(
+            audio, max_quantized_value=2, min_quantized_value=-2)
+    else:
+        rgb = rgb.astype('float32')
+        audio = audio.astype('float32')
+
+    if mode != 'infer':
+        one_hot_label = make_one_hot(record[b'label'], num_classes)
+        return (rgb, audio, one_hot_label)
+    else:
+        return (rgb, audio, record[b'video'])
+
+
 def dequantize(feat_vector, max_quantized_value=2., min_quantized_value=-2.):
     """
-    Dequantize the feature from the byte format to the float format
+    Dequantize the feature from the byte format to the float32 format
     """
 
     assert max_quantized_value > min_quantized_value
@@ -113,7 +156,9 @@ def dequantize(feat_vector, max_quantized_value=2., min_quantized_value=-2.):
     scalar = quantized_range / 255.0
     bias = (quantized_range / 512.0) + min_quantized_value
 
-    return feat_vector * scalar + bias
+    feat = np.multiply(feat_vector, np.float32(scalar), dtype=np.float32)
+    feat += np.float32(bias)
+    return feat
 
 
 def make_one_hot(label, dim=3862):
@@ -0,0 +1,128 @@
+#  Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Sharded container of the encoded frames of many videos. A shard is a pair
+of files:
+    xxx.data    the JPEG bytes of all frames of all videos, concatenated
+    xxx.index   pickled dict of version and a list of (vid, label, offsets)
+                of each video, offsets is an int64 array of frame_num + 1
+                byte offsets into xxx.data
+The data file is memory mapped, so only the bytes of the sampled frames are
+read. The filelist of the 'shard' format lists the index files.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+import numpy as np
+
+SHARD_VERSION = 1
+DATA_SUFFIX = '.data'
+INDEX_SUFFIX = '.index'
+
+
+class FrameShardWriter(object):
+    """Write videos to the shard 'prefix'.data and 'prefix'.index"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.videos = []
+        self.offset = 0
+        self.data_file = open(prefix + DATA_SUFFIX, 'wb')
+
+    def add(self, vid, label, frames):
+        """frames is a list of encoded frames"""
+        offsets = np.zeros((len(frames) + 1, ), dtype=np.int64)
+        np.cumsum([len(f) for f in frames], out=offsets[1:])
+        offsets += self.offset
+        for frame in frames:
+            self.data_file.write(frame)
+        self.offset = int(offsets[-1])
+        self.videos.append((vid, label, offsets))
+
+    def __len__(self):
+        return len(self.videos)
+
+    def close(self):
+        self.data_file.close()
+        with open(self.prefix + INDEX_SUFFIX, 'wb') as f:
+            pickle.dump(
+                {
+                    'version': SHARD_VERSION,
+                    'videos': self.videos
+                },
+                f,
+                protocol=2)
+
+
+class FrameShard(object):
+    """Read only view of a shard, opened by its index file"""
+
+    def __init__(self, index_path):
+        assert index_path.endswith(INDEX_SUFFIX), \
+            'invalid shard index {}'.format(index_path)
+        with open(index_path, 'rb') as f:
+            index = pickle.load(f)
+        assert index['version'] == SHARD_VERSION, \
+            'unsupported shard version {}'.format(index['version'])
+        self.videos = index['videos']
+        data_path = index_path[:-len(INDEX_SUFFIX)] + DATA_SUFFIX
+        if os.path.getsize(data_path) > 0:
+            self.data = np.memmap(data_path, dtype=np.uint8, mode='r')
+        else:
+            self.data = np.zeros((0, ), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.videos)
+
+    def info(self, idx):
+        """vid, label and frame number of the idx-th video"""
+        vid, label, offsets = self.videos[idx]
+        return vid, label, len(offsets) - 1
+
+    def frame(self, idx, frame_idx):
+        """encoded bytes of a frame of the idx-th video"""
+        offsets = self.videos[idx][2]
+        return self.data[offsets[frame_idx]:offsets[frame_idx + 1]].tobytes()
+
+
+_shard_cache = OrderedDict()
+_shard_cache_lock = threading.Lock()
+
+
+def open_shard(index_path, max_open=16):
+    """Shards opened by the reader workers, the last max_open are kept"""
+    with _shard_cache_lock:
+        shard = _shard_cache.pop(index_path, None)
+        if shard is None:
+            shard = FrameShard(index_path)
+        _shard_cache[index_path] = shard
+        while len(_shard_cache) > max_open:
+            _shard_cache.popitem(last=False)
+    return shard
+
+
+def read_shard_list(filelist):
+    """index paths and video numbers of the shards in filelist"""
+    shards = []
+    with open(filelist) as flist:
+        for line in flist:
+            path = line.strip()
+            if path:
+                shards.append((path, len(open_shard(path))))
+    return shards
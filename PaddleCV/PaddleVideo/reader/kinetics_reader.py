@@ -30,6 +30,7 @@ from PIL import Image, ImageEnhance
 import logging
 
 from .reader_utils import DataReader
+from .frame_shard import open_shard, read_shard_list
 
 logger = logging.getLogger(__name__)
 python_ver = sys.version_info
@@ -37,9 +38,11 @@ python_ver = sys.version_info
 
 class KineticsReader(DataReader):
     """
-    Data reader for kinetics dataset of two format mp4 and pkl.
+    Data reader for kinetics dataset of three format mp4, pkl and shard.
     1. mp4, the original format of kinetics400
     2. pkl, the mp4 was decoded previously and stored as pkl
+    3. shard, the frames of many videos stored in a memory mapped shard,
+       see reader/frame_shard.py
     In both case, load the data, and then get the frame data in the form of numpy and label as an integer.
      dataset cfg: format
                   num_classes
@@ -201,6 +204,44 @@ class KineticsReader(DataReader):
             return imgs_transform(imgs, mode, seg_num, seglen, \
                          short_size, target_size, img_mean, img_std, name = self.name), ret_label
 
+        def decode_shard(sample, mode, seg_num, seglen, short_size,
+                         target_size, img_mean, img_std):
+            index_path, idx = sample
+            try:
+                shard = open_shard(index_path)
+                vid, label, videolen = shard.info(idx)
+                if videolen < 1:
+                    logger.error('{} of {} frame length {} less than 1.'.format(
+                        vid, index_path, videolen))
+                    return None, None
+                indices = get_sample_indices(videolen, seg_num, seglen, mode)
+                imgs = [imageloader(shard.frame(idx, i)) for i in indices]
+            except:
+                logger.info('Error when loading {} of {}'.format(idx,
+                                                                 index_path))
+                return None, None
+
+            if mode == 'train' or mode == 'valid' or mode == 'test':
+                ret_label = label
+            elif mode == 'infer':
+                ret_label = vid
+
+            return imgs_transform(imgs, mode, seg_num, seglen, \
+                         short_size, target_size, img_mean, img_std, name = self.name), ret_label
+
+        def shard_reader():
+            # shuffle the shards and the videos inside each shard, so the
+            # workers read nearby videos of a few shards at the same time
+            shards = list(shard_list)
+            if shuffle:
+                random.shuffle(shards)
+            for index_path, num_videos in shards:
+                indexes = list(range(num_videos))
+                if shuffle:
+                    random.shuffle(indexes)
+                for idx in indexes:
+                    yield [index_path, idx]
+
         def reader():
             with open(pickle_list) as flist:
                 lines = [line.strip() for line in flist]
@@ -214,6 +255,11 @@ class KineticsReader(DataReader):
             decode_func = decode_pickle
         elif format == 'mp4':
             decode_func = decode_mp4
+        elif format == 'shard':
+            decode_func = decode_shard
+            # the index files are loaded once, not at every epoch
+            shard_list = read_shard_list(pickle_list)
+            reader = shard_reader
         else:
             raise "Not implemented format {}".format(format)
 
@@ -410,11 +456,14 @@ def imageloader(buf):
     return img.convert('RGB')
 
 
-def video_loader(frames, nsample, seglen, mode):
-    videolen = len(frames)
+def get_sample_indices(videolen, nsample, seglen, mode):
+    """Indices of the nsample x seglen frames sampled from a video of
+    videolen frames, a random snippet of each segment when training and
+    the center snippet otherwise.
+    """
     average_dur = int(videolen / nsample)
 
-    imgs = []
+    indices = []
     for i in range(nsample):
         idx = 0
         if mode == 'train':
@@ -435,14 +484,18 @@ def video_loader(frames, nsample, seglen, mode):
                 idx = i
 
         for jj in range(idx, idx + seglen):
-            imgbuf = frames[int(jj % videolen)]
-            img = imageloader(imgbuf)
-            imgs.append(img)
+            indices.append(int(jj % videolen))
+
+    return indices
 
-    return imgs
 
+def video_loader(frames, nsample, seglen, mode):
+    indices = get_sample_indices(len(frames), nsample, seglen, mode)
+    return [imageloader(frames[idx]) for idx in indices]
 
-def mp4_loader(filepath, nsample, seglen, mode):
+
+def mp4_dense_loader(filepath, nsample, seglen, mode):
+    """Decode all frames of the video, then sample from them"""
     cap = cv2.VideoCapture(filepath)
     videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     sampledFrames = []
@@ -453,30 +506,45 @@ def mp4_loader(filepath, nsample, seglen, mode):
             continue
         img = frame[:, :, ::-1]
         sampledFrames.append(img)
-    average_dur = int(len(sampledFrames) / nsample)
-    imgs = []
-    for i in range(nsample):
-        idx = 0
-        if mode == 'train':
-            if average_dur >= seglen:
-                idx = random.randint(0, average_dur - seglen)
-                idx += i * average_dur
-            elif average_dur >= 1:
-                idx += i * average_dur
-            else:
-                idx = i
-        else:
-            if average_dur >= seglen:
-                idx = (average_dur - 1) // 2
-                idx += i * average_dur
-            elif average_dur >= 1:
-                idx += i * average_dur
-            else:
-                idx = i
+    cap.release()
+    indices = get_sample_indices(len(sampledFrames), nsample, seglen, mode)
+    return [
+        Image.fromarray(
+            sampledFrames[idx], mode='RGB') for idx in indices
+    ]
 
-        for jj in range(idx, idx + seglen):
-            imgbuf = sampledFrames[int(jj % len(sampledFrames))]
-            img = Image.fromarray(imgbuf, mode='RGB')
-            imgs.append(img)
 
-    return imgs
+def mp4_loader(filepath, nsample, seglen, mode, seek_gap=32):
+    """Decode only the sampled frames of the video. The indices are computed
+    from the frame count first, frames in between are skipped by grab()
+    without being retrieved, or by seeking when the next sampled frame is
+    more than seek_gap frames ahead. Fall back to mp4_dense_loader when the
+    frame count is not available or wrong.
+    """
+    cap = cv2.VideoCapture(filepath)
+    videolen = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if videolen < 1:
+        cap.release()
+        return mp4_dense_loader(filepath, nsample, seglen, mode)
+
+    indices = get_sample_indices(videolen, nsample, seglen, mode)
+    frames = {}
+    pos = 0
+    for target in sorted(set(indices)):
+        if seek_gap > 0 and target - pos > seek_gap:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            pos = target
+        while pos < target and cap.grab():
+            pos += 1
+        ret, frame = cap.read() if pos == target else (False, None)
+        if not ret:
+            break
+        pos += 1
+        frames[target] = Image.fromarray(frame[:, :, ::-1], mode='RGB')
+    cap.release()
+
+    if len(frames) < len(set(indices)):
+        logger.info('{} frame count {} is not reliable, decode all frames'.
+                    format(filepath, videolen))
+        return mp4_dense_loader(filepath, nsample, seglen, mode)
+    return [frames[idx] for idx in indices]
@@ -36,6 +36,97 @@ from .reader_utils import DataReader
 python_ver = sys.version_info
 
 
+def sliding_clips_meta(sliding_clip_path):
+    """
+    The sorted .npy clip names of sliding_clip_path, and the meta of a pack
+    of them: the directory, the number of clips and the newest mtime
+    """
+    clip_names = sorted(
+        name for name in os.listdir(sliding_clip_path)
+        if name.endswith('.npy'))
+    assert len(clip_names) > 0, 'no sliding clips in {}'.format(
+        sliding_clip_path)
+    mtime = max(
+        os.path.getmtime(os.path.join(sliding_clip_path, name))
+        for name in clip_names)
+    meta = {
+        'sliding_clip_path': os.path.abspath(sliding_clip_path),
+        'num_clips': len(clip_names),
+        'mtime': mtime
+    }
+    return clip_names, meta
+
+
+def pack_sliding_clips(sliding_clip_path, packed_path, clip_names, meta):
+    """
+    Pack the .npy features of all sliding clips into one matrix
+    packed_path/feats.npy, with the clip names of the rows in
+    packed_path/names.pkl and the meta of the clips in packed_path/meta.pkl
+    """
+    if not os.path.exists(packed_path):
+        os.makedirs(packed_path)
+    # feats.npy is renamed into place last, a pack is only used with it
+    feats_path = os.path.join(packed_path, 'feats.npy')
+    if os.path.exists(feats_path):
+        os.remove(feats_path)
+    first = np.load(os.path.join(sliding_clip_path, clip_names[0]))
+    tmp_path = os.path.join(packed_path, 'feats.tmp.npy')
+    feats = np.lib.format.open_memmap(
+        tmp_path,
+        mode='w+',
+        dtype=first.dtype,
+        shape=(len(clip_names), first.shape[-1]))
+    for i, clip_name in enumerate(clip_names):
+        feats[i] = np.load(os.path.join(sliding_clip_path, clip_name))
+    feats.flush()
+    del feats
+    with open(os.path.join(packed_path, 'names.pkl'), 'wb') as f:
+        pickle.dump(clip_names, f, protocol=2)
+    with open(os.path.join(packed_path, 'meta.pkl'), 'wb') as f:
+        pickle.dump(meta, f, protocol=2)
+    os.rename(tmp_path, feats_path)
+    logger.info('packed {} sliding clips of {} to {}'.format(
+        len(clip_names), sliding_clip_path, packed_path))
+
+
+def load_pack_meta(packed_path):
+    if not os.path.exists(os.path.join(packed_path, 'feats.npy')) or \
+            not os.path.exists(os.path.join(packed_path, 'meta.pkl')):
+        return None
+    with open(os.path.join(packed_path, 'meta.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+class SlidingClipFeats(object):
+    """
+    Memory mapped features of the sliding clips packed by pack_sliding_clips,
+    the clips are packed at the first use, and packed again when the number
+    of clips or their newest mtime changed
+    """
+
+    def __init__(self, sliding_clip_path, packed_path=None):
+        if packed_path is None:
+            packed_path = sliding_clip_path.rstrip('/') + '_packed'
+        clip_names, meta = sliding_clips_meta(sliding_clip_path)
+        if load_pack_meta(packed_path) != meta:
+            pack_sliding_clips(sliding_clip_path, packed_path, clip_names,
+                               meta)
+        with open(os.path.join(packed_path, 'names.pkl'), 'rb') as f:
+            self.clip_names = pickle.load(f)
+        self.index = dict((name, i) for i, name in enumerate(self.clip_names))
+        self.feats = np.load(
+            os.path.join(packed_path, 'feats.npy'), mmap_mode='r')
+
+    def __contains__(self, clip_name):
+        return clip_name in self.index
+
+    def row(self, clip_name, default=-1):
+        return self.index.get(clip_name, default)
+
+    def __getitem__(self, clip_name):
+        return np.array(self.feats[self.index[clip_name]])
+
+
 class TALLReader(DataReader):
     """
     Data reader for TALL model, which was stored as features extracted by prior networks
@@ -55,9 +146,14 @@ class TALLReader(DataReader):
         self.sliding_clip_path = cfg[mode.upper()]['sliding_clip_path']
         self.clip_sentvec = cfg[mode.upper()]['clip_sentvec']
         self.semantic_size = cfg[mode.upper()]['semantic_size']
+        self.packed_clip_path = cfg[mode.upper()].get('packed_clip_path',
+                                                      None)
 
         self.batch_size = cfg[mode.upper()]['batch_size']
         self.init_data()
+        if self.mode != 'valid':
+            self.clip_feats = SlidingClipFeats(self.sliding_clip_path,
+                                               self.packed_clip_path)
 
     def get_context_window(self, clip_name):
         # compute left (pre) and right (post) context features based on read_unit_level_feats().
@@ -65,60 +161,33 @@ class TALLReader(DataReader):
         start = int(clip_name.split("_")[1])
         end = int(clip_name.split("_")[2].split(".")[0])
         clip_length = self.context_size
-        left_context_feats = np.zeros(
-            [self.context_num, self.feats_dimen], dtype=np.float32)
-        right_context_feats = np.zeros(
-            [self.context_num, self.feats_dimen], dtype=np.float32)
-        last_left_feat = np.load(
-            os.path.join(self.sliding_clip_path, clip_name))
-        last_right_feat = np.load(
-            os.path.join(self.sliding_clip_path, clip_name))
-        for k in range(self.context_num):
-            left_context_start = start - clip_length * (k + 1)
-            left_context_end = start - clip_length * k
-            right_context_start = end + clip_length * k
-            right_context_end = end + clip_length * (k + 1)
-            left_context_name = movie_name + "_" + str(
-                left_context_start) + "_" + str(left_context_end) + ".npy"
-            right_context_name = movie_name + "_" + str(
-                right_context_start) + "_" + str(right_context_end) + ".npy"
-            if os.path.exists(
-                    os.path.join(self.sliding_clip_path, left_context_name)):
-                left_context_feat = np.load(
-                    os.path.join(self.sliding_clip_path, left_context_name))
-                last_left_feat = left_context_feat
-            else:
-                left_context_feat = last_left_feat
-            if os.path.exists(
-                    os.path.join(self.sliding_clip_path, right_context_name)):
-                right_context_feat = np.load(
-                    os.path.join(self.sliding_clip_path, right_context_name))
-                last_right_feat = right_context_feat
-            else:
-                right_context_feat = last_right_feat
-            left_context_feats[k] = left_context_feat
-            right_context_feats[k] = right_context_feat
-        return np.mean(
-            left_context_feats, axis=0), np.mean(
-                right_context_feats, axis=0)
+        clip_row = self.clip_feats.row(clip_name)
+        assert clip_row >= 0, "sliding clip {} is not in the packed " \
+            "features of {}".format(clip_name, self.sliding_clip_path)
+        ks = range(self.context_num)
+        left_rows = [
+            self.clip_feats.row(movie_name + "_" + str(start - clip_length * (
+                k + 1)) + "_" + str(start - clip_length * k) + ".npy")
+            for k in ks
+        ]
+        right_rows = [
+            self.clip_feats.row(movie_name + "_" + str(end + clip_length * k)
+                                + "_" + str(end + clip_length * (k + 1)) +
+                                ".npy") for k in ks
+        ]
 
-    def init_data(self):
-        def calculate_IoU(i0, i1):
-            # calculate temporal intersection over union
-            union = (min(i0[0], i1[0]), max(i0[1], i1[1]))
-            inter = (max(i0[0], i1[0]), min(i0[1], i1[1]))
-            iou = 1.0 * (inter[1] - inter[0]) / (union[1] - union[0])
-            return iou
-
-        def calculate_nIoL(base, sliding_clip):
-            # calculate the non Intersection part over Length ratia, make sure the input IoU is larger than 0
-            inter = (max(base[0], sliding_clip[0]), min(base[1],
-                                                        sliding_clip[1]))
-            inter_l = inter[1] - inter[0]
-            length = sliding_clip[1] - sliding_clip[0]
-            nIoL = 1.0 * (length - inter_l) / length
-            return nIoL
+        def gather(rows):
+            # a missing context clip takes the feature of the last existing
+            # one, starting from the clip itself
+            rows = np.array([clip_row] + rows)
+            pos = np.where(rows >= 0, np.arange(len(rows)), 0)
+            rows = rows[np.maximum.accumulate(pos)][1:]
+            feats = self.clip_feats.feats[rows].astype(np.float32)
+            return np.mean(feats, axis=0)
 
+        return gather(left_rows), gather(right_rows)
+
+    def init_data(self):
         # load file
         if (self.mode == 'train') or (self.mode == 'valid'):
             if python_ver < (3, 0):
@@ -167,36 +236,61 @@ class TALLReader(DataReader):
             # TALL model doesn't take validation during training, it will test after all the training epochs finish.
             return
         if self.mode == 'train':
-            num_sliding_clips = len(sliding_clips_tmp)
-            count = 0
-            for clip_name in sliding_clips_tmp:
-                count += 1
-                logger.info('processing data ............' + str(count) + '/' +
-                            str(num_sliding_clips))
+            # match the sliding clips and the groundtruths of each movie at
+            # once, by the temporal IoU and the non Intersection part over
+            # Length ratio of the sliding clip
+            def clip_bounds(clip_names):
+                bounds = [(int(name.split("_")[1]),
+                           int(name.split("_")[2].split(".")[0]))
+                          for name in clip_names]
+                return np.array(bounds, dtype=np.int64).reshape([-1, 2])
+
+            movie_sliding_clips = {}
+            for i, clip_name in enumerate(sliding_clips_tmp):
                 if clip_name.split(".")[2] == "npy":
                     movie_name = clip_name.split("_")[0]
-                    for clip_sentence in self.clip_sentence_pairs:
-                        original_clip_name = clip_sentence[0]
-                        original_movie_name = original_clip_name.split("_")[0]
-                        if original_movie_name == movie_name:
-                            start = int(clip_name.split("_")[1])
-                            end = int(clip_name.split("_")[2].split(".")[0])
-                            o_start = int(original_clip_name.split("_")[1])
-                            o_end = int(
-                                original_clip_name.split("_")[2].split(".")[0])
-                            iou = calculate_IoU((start, end), (o_start, o_end))
-                            if iou > 0.5:
-                                nIoL = calculate_nIoL((o_start, o_end),
-                                                      (start, end))
-                                if nIoL < 0.15:
-                                    movie_length = movie_length_info[
-                                        movie_name.split(".")[0].encode(
-                                            'utf-8')]  #str to byte
-                                    start_offset = o_start - start
-                                    end_offset = o_end - end
-                                    self.clip_sentence_pairs_iou.append(
-                                        (clip_sentence[0], clip_sentence[1],
-                                         clip_name, start_offset, end_offset))
+                    movie_sliding_clips.setdefault(movie_name, []).append(i)
+
+            matches = []
+            for movie_name, clip_idxs in movie_sliding_clips.items():
+                if movie_name not in movie_clip_names:
+                    continue
+                pair_idxs = np.array(movie_clip_names[movie_name])
+                clip_idxs = np.array(clip_idxs)
+                sliding = clip_bounds([sliding_clips_tmp[i] for i in clip_idxs])
+                original = clip_bounds(
+                    [self.clip_sentence_pairs[k][0] for k in pair_idxs])
+                start, end = sliding[:, 0:1], sliding[:, 1:2]
+                o_start, o_end = original[:, 0], original[:, 1]
+                inter = np.minimum(end, o_end) - np.maximum(start, o_start)
+                union = np.maximum(end, o_end) - np.minimum(start, o_start)
+                iou = 1.0 * inter / union
+                nIoL = 1.0 * ((end - start) - inter) / (end - start)
+                rows, cols = np.nonzero((iou > 0.5) & (nIoL < 0.15))
+                if len(rows) == 0:
+                    continue
+                assert movie_name.split(".")[0].encode('utf-8') in \
+                    movie_length_info, "no length info of movie {}".format(
+                        movie_name)
+                matches.append(
+                    np.stack(
+                        [
+                            clip_idxs[rows], pair_idxs[cols],
+                            (o_start[cols] - start[rows, 0]),
+                            (o_end[cols] - end[rows, 0])
+                        ],
+                        axis=1))
+
+            # keep the order of the sliding clips and then the groundtruths
+            if len(matches) > 0:
+                matches = np.concatenate(matches)
+                matches = matches[np.lexsort((matches[:, 1], matches[:, 0]))]
+            for clip_idx, k, start_offset, end_offset in matches:
+                clip_sentence = self.clip_sentence_pairs[k]
+                self.clip_sentence_pairs_iou.append(
+                    (clip_sentence[0], clip_sentence[1],
+                     sliding_clips_tmp[clip_idx], int(start_offset),
+                     int(end_offset)))
             logger.info('TRAIN:' + str(len(self.clip_sentence_pairs_iou)) +
                         " iou clip-sentence pairs are read")
 
@@ -224,11 +318,10 @@ class TALLReader(DataReader):
                      clip_sentence_pairs[k][1][:self.semantic_size]))
         for k in range(len(clip_sentence_pairs_iou)):
             if movie_name in clip_sentence_pairs_iou[k]:
-                visual_feature_path = os.path.join(
-                    self.sliding_clip_path, clip_sentence_pairs_iou[k] + ".npy")
                 left_context_feat, right_context_feat = self.get_context_window(
                     clip_sentence_pairs_iou[k] + ".npy")
-                feature_data = np.load(visual_feature_path)
+                feature_data = self.clip_feats[clip_sentence_pairs_iou[k] +
+                                               ".npy"]
                 comb_feat = np.hstack(
                     (left_context_feat, feature_data, right_context_feat))
                 movie_clip_featmap.append(
@@ -283,9 +376,7 @@ class TALLReader(DataReader):
                 for clip_sentence_pair in self.clip_sentence_pairs_iou:
                     offset = np.zeros(2, dtype=np.float32)
                     clip_name = clip_sentence_pair[0]
-                    feat_path = os.path.join(self.sliding_clip_path,
-                                             clip_sentence_pair[2])
-                    featmap = np.load(feat_path)
+                    featmap = self.clip_feats[clip_sentence_pair[2]]
                     left_context_feat, right_context_feat = self.get_context_window(
                         clip_sentence_pair[2])
                     image = np.hstack(
@@ -0,0 +1,98 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Compare the full and the reduced image decode of reader.py: images/s of the
+train and val preprocessing of both decode modes, and how far the reduced
+decode inputs are from the full decode ones. The top-1 accuracy of a model
+with each decode mode is given by eval.py --decode_mode full/reduced.
+
+    python decode_benchmark.py --data_dir ./data/ILSVRC2012/ --num_images 500
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import functools
+import os
+import time
+
+import numpy as np
+
+import reader
+from utils import add_arguments, print_arguments
+
+parser = argparse.ArgumentParser(description=__doc__)
+add_arg = functools.partial(add_arguments, argparser=parser)
+# yapf: disable
+add_arg('data_dir',          str,   "./data/ILSVRC2012/", "The ImageNet dataset root directory.")
+add_arg('file_list',         str,   "val_list.txt",       "The file list of the images, relative to data_dir.")
+add_arg('num_images',        int,   500,                  "The number of images to decode.")
+add_arg('crop_size',         int,   224,                  "The value of crop size")
+add_arg('resize_short_size', int,   256,                  "The value of resize_short_size")
+add_arg('lower_scale',       float, 0.08,                 "The value of lower_scale in ramdom_crop")
+add_arg('lower_ratio',       float, 3./4.,                "The value of lower_ratio in ramdom_crop")
+add_arg('upper_ratio',       float, 4./3.,                "The value of upper_ratio in ramdom_crop")
+add_arg('interpolation',     int,   None,                 "The interpolation mode")
+parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
+parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
+# yapf: enable
+
+
+def preprocess(samples, settings, mode, decode_mode):
+    """process_image of all the samples, the random state is reset for every
+    sample so that both decode modes draw the same crops"""
+    images = []
+    start = time.time()
+    for idx, sample in enumerate(samples):
+        np.random.seed(idx)
+        images.append(
+            reader.process_image(
+                sample,
+                settings,
+                mode,
+                color_jitter=False,
+                rotate=False,
+                decode_mode=decode_mode)[0])
+    return images, len(samples) / (time.time() - start)
+
+
+def benchmark(args):
+    samples = reader.read_image_list(
+        os.path.join(args.data_dir, args.file_list),
+        args.data_dir)[:args.num_images]
+    assert len(samples) > 0, "no image found in {}".format(args.file_list)
+    for mode in ['train', 'val']:
+        full, full_speed = preprocess(samples, args, mode, 'full')
+        reduced, reduced_speed = preprocess(samples, args, mode, 'reduced')
+        # the inputs are normalized by image_std, report the errors in pixels
+        std = np.array(args.image_std).reshape((3, 1, 1)) * 255
+        errors = [np.abs(a - b) * std for a, b in zip(full, reduced)]
+        print("{}: full {:.1f} images/s, reduced {:.1f} images/s, "
+              "speedup {:.2f}x, mean abs diff {:.2f}, max mean abs diff of "
+              "an image {:.2f} (0-255 pixel scale)".format(
+                  mode, full_speed, reduced_speed, reduced_speed / full_speed,
+                  np.mean([e.mean() for e in errors]),
+                  np.max([e.mean() for e in errors])))
+
+
+def main():
+    args = parser.parse_args()
+    print_arguments(args)
+    benchmark(args)
+
+
+if __name__ == '__main__':
+    main()
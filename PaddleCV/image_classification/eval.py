@@ -47,6 +47,8 @@ parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456
 parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
 add_arg('crop_size',        int,  224,                  "The value of crop size")
 add_arg('interpolation',    int,  None,                 "The interpolation mode")
+add_arg('decode_mode',      str,  "full",               "The image decode mode: full or reduced")
+add_arg('val_cache_dir',    str,  "",                   "The directory of the uint8 cache of the val images, no cache if empty")
 add_arg('padding_type',     str,  "SAME",               "Padding type of convolution")
 add_arg('use_se',           bool, True,                 "Whether to use Squeeze-and-Excitation module for EfficientNet.")
 # yapf: enable
@@ -106,7 +108,10 @@ def eval(args):
 
     fluid.io.load_persistables(exe, args.pretrained_model)
     imagenet_reader = reader.ImageNetReader()
-    val_reader = imagenet_reader.val(settings=args)
+    if args.val_cache_dir:
+        val_reader = imagenet_reader.cached_val(settings=args)
+    else:
+        val_reader = imagenet_reader.val(settings=args)
 
     feeder = fluid.DataFeeder(place=place, feed_list=[image, label])
 
@@ -114,18 +119,24 @@ def eval(args):
     cnt = 0
     for batch_id, data in enumerate(val_reader()):
         t1 = time.time()
+        if args.val_cache_dir:
+            feed = {image.name: data[0], label.name: data[1]}
+            batch_len = len(data[1])
+        else:
+            feed = feeder.feed(data)
+            batch_len = len(data)
         loss, acc1, acc5 = exe.run(test_program,
                                    fetch_list=fetch_list,
-                                   feed=feeder.feed(data))
+                                   feed=feed)
         t2 = time.time()
         period = t2 - t1
         loss = np.mean(loss)
         acc1 = np.mean(acc1)
         acc5 = np.mean(acc5)
-        test_info[0].append(loss * len(data))
-        test_info[1].append(acc1 * len(data))
-        test_info[2].append(acc5 * len(data))
-        cnt += len(data)
+        test_info[0].append(loss * batch_len)
+        test_info[1].append(acc1 * batch_len)
+        test_info[2].append(acc5 * batch_len)
+        cnt += batch_len
         if batch_id % 10 == 0:
             print("Testbatch {0},loss {1}, "
                   "acc1 {2},acc5 {3},time {4}".format(batch_id, \
@@ -18,7 +18,6 @@ from __future__ import print_function
 
 import os
 import numpy as np
-import math
 import random
 import pickle
 from tqdm import tqdm
@@ -32,80 +31,144 @@ FINISH_EVENT = "FINISH_EVENT"
 
 
 class PaddleDataLoader(object):
+    """
+    Multi-process image loader. The workers decode the images into the
+    slots of a shared memory ring buffer, and send only the slot id, the
+    shape and the label to the reader, which blocks on the queue of ready
+    slots and gives the slots back to the workers after copying the images.
+    Every worker owns 'prefetch' slots, so it blocks when it is that many
+    samples ahead of the reader.
+
+    concurrent: number of worker processes
+    prefetch: number of slots of every worker
+    slot_size: bytes of a slot, the images larger than a slot are sent
+        through the queue instead, but still hold a slot
+    ordered: whether to yield the samples in the order of indices, as the
+        aspect ratio grouped batches of the rectangular validation need,
+        the samples waiting for their turn keep their slots
+    """
+
     def __init__(self,
                  dataset,
                  indices=None,
                  concurrent=24,
-                 queue_size=3072,
+                 prefetch=4,
                  shuffle=True,
-                 shuffle_seed=0):
+                 shuffle_seed=0,
+                 slot_size=3 * 224 * 224,
+                 ordered=False):
         self.dataset = dataset
         self.indices = indices
         self.concurrent = concurrent
+        self.prefetch = prefetch
         self.shuffle = shuffle
         self.shuffle_seed = shuffle_seed
-        self.queue_size = queue_size // self.concurrent
+        self.slot_size = slot_size
+        self.ordered = ordered
 
-    def _worker_loop(self, queue, worker_indices, worker_id):
+    def _worker_loop(self, buffer, free_slots, ready_slots, worker_indices,
+                     worker_id):
+        slots = np.frombuffer(buffer, dtype='uint8').reshape(
+            (self.concurrent * self.prefetch, self.slot_size))
         cnt = 0
-        for idx in worker_indices:
+        for pos, idx in worker_indices:
             cnt += 1
             img, label = self.dataset[idx]
             img = np.array(img).astype('uint8').transpose((2, 0, 1))
-            queue.put((img, label))
+            # blocks until the reader gives a slot back
+            slot = free_slots.get()
+            if img.nbytes > self.slot_size:
+                ready_slots.put((pos, slot, img, label))
+                continue
+            slots[slot, :img.nbytes].reshape(img.shape)[...] = img
+            ready_slots.put((pos, slot, img.shape, label))
         print("worker: [%d] read [%d] samples. " % (worker_id, cnt))
-        queue.put(FINISH_EVENT)
+        ready_slots.put((FINISH_EVENT, None, None, None))
 
     def reader(self):
         def _reader_creator():
-            worker_processes = []
-            index_queues = []
             total_img = len(self.dataset)
             print("total image: ", total_img)
             if self.shuffle:
-                self.indices = [i for i in xrange(total_img)]
+                self.indices = [i for i in range(total_img)]
                 random.seed(self.shuffle_seed)
                 random.shuffle(self.indices)
                 print("shuffle indices: %s ..." % self.indices[:10])
+            indices = self.indices if self.indices is not None else range(
+                total_img)
+            positions = list(enumerate(indices))
+
+            num_slots = self.concurrent * self.prefetch
+            buffer = multiprocessing.RawArray('B', num_slots * self.slot_size)
+            slots = np.frombuffer(buffer, dtype='uint8').reshape(
+                (num_slots, self.slot_size))
+            # the slots of worker i are [i * prefetch, (i + 1) * prefetch), so
+            # the worker of the next ordered sample always gets a free slot
+            free_slots = [
+                multiprocessing.Queue() for _ in range(self.concurrent)
+            ]
+            for slot in range(num_slots):
+                free_slots[slot // self.prefetch].put(slot)
+            ready_slots = multiprocessing.Queue()
+
+            def _take(slot, shape):
+                if isinstance(shape, np.ndarray):
+                    img = shape
+                else:
+                    size = int(np.prod(shape))
+                    img = slots[slot, :size].reshape(shape).copy()
+                free_slots[slot // self.prefetch].put(slot)
+                return img
 
-            imgs_per_worker = int(math.ceil(total_img / self.concurrent))
-            for i in xrange(self.concurrent):
-                start = i * imgs_per_worker
-                end = (i + 1
-                       ) * imgs_per_worker if i != self.concurrent - 1 else None
-                sliced_indices = self.indices[start:end]
-                index_queue = multiprocessing.Queue(self.queue_size)
+            worker_processes = []
+            for i in range(self.concurrent):
+                # strided, so that every worker is at about the same position
+                # of indices when the samples are ordered
                 w = multiprocessing.Process(
                     target=self._worker_loop,
-                    args=(index_queue, sliced_indices, i))
+                    args=(buffer, free_slots[i], ready_slots,
+                          positions[i::self.concurrent], i))
                 w.daemon = True
                 w.start()
                 worker_processes.append(w)
-                index_queues.append(index_queue)
-            finish_workers = 0
-            worker_cnt = len(worker_processes)
-            recv_index = 0
-            while finish_workers < worker_cnt:
-                while (index_queues[recv_index].empty()):
-                    recv_index = (recv_index + 1) % self.concurrent
-                sample = index_queues[recv_index].get()
-                recv_index = (recv_index + 1) % self.concurrent
-                if sample == FINISH_EVENT:
-                    finish_workers += 1
-                else:
-                    yield sample
+
+            try:
+                finish_workers = 0
+                next_pos = 0
+                pending = {}
+                while finish_workers < len(worker_processes):
+                    pos, slot, shape, label = ready_slots.get()
+                    if pos == FINISH_EVENT:
+                        finish_workers += 1
+                        continue
+                    if not self.ordered:
+                        yield _take(slot, shape), label
+                        continue
+                    pending[pos] = (slot, shape, label)
+                    while next_pos in pending:
+                        slot, shape, label = pending.pop(next_pos)
+                        yield _take(slot, shape), label
+                        next_pos += 1
+            finally:
+                for w in worker_processes:
+                    if w.is_alive():
+                        w.terminate()
 
         return _reader_creator
 
 
-def train(traindir, sz, min_scale=0.08, shuffle_seed=0):
+def train(traindir, sz, min_scale=0.08, shuffle_seed=0, concurrent=24):
     train_tfms = [
         transforms.RandomResizedCrop(
             sz, scale=(min_scale, 1.0)), transforms.RandomHorizontalFlip()
     ]
     train_dataset = datasets.ImageFolder(traindir,
                                          transforms.Compose(train_tfms))
-    return PaddleDataLoader(train_dataset, shuffle_seed=shuffle_seed).reader()
+    return PaddleDataLoader(
+        train_dataset,
+        concurrent=concurrent,
+        shuffle_seed=shuffle_seed,
+        slot_size=3 * sz * sz).reader()
 
 
 def test(valdir, bs, sz, rect_val=False):
@@ -116,14 +179,19 @@ def test(valdir, bs, sz, rect_val=False):
 
         ar_tfms = [transforms.Resize(int(sz * 1.14)), CropArTfm(idx2ar, sz)]
         val_dataset = ValDataset(valdir, transform=ar_tfms)
+        # the loader keeps the order of idx_sorted, so that the images of a
+        # batch have the same aspect ratio
         return PaddleDataLoader(
-            val_dataset, concurrent=1, indices=idx_sorted,
-            shuffle=False).reader()
+            val_dataset,
+            indices=idx_sorted,
+            shuffle=False,
+            slot_size=max_ar_bytes(idx2ar, sz),
+            ordered=True).reader()
 
     val_tfms = [transforms.Resize(int(sz * 1.14)), transforms.CenterCrop(sz)]
     val_dataset = datasets.ImageFolder(valdir, transforms.Compose(val_tfms))
 
-    return PaddleDataLoader(val_dataset).reader()
+    return PaddleDataLoader(val_dataset, slot_size=3 * sz * sz).reader()
 
 
 class ValDataset(datasets.ImageFolder):
@@ -160,6 +228,20 @@ class CropArTfm(object):
         return transforms.center_crop(img, size)
 
 
+def max_ar_bytes(idx2ar, target_size):
+    """
+    Bytes of the largest uint8 CHW image cropped by CropArTfm.
+    """
+    ars = list(idx2ar.values())
+    if not ars:
+        return 3 * target_size * target_size
+    sizes = [
+        int(target_size / ar) // 8 * 8 if ar < 1 else
+        int(target_size * ar) // 8 * 8 for ar in [min(ars), max(ars)]
+    ]
+    return 3 * target_size * max(sizes + [target_size])
+
+
 def sort_ar(valdir):
     idx2ar_file = valdir + '/../sorted_idxar.p'
     if os.path.isfile(idx2ar_file):
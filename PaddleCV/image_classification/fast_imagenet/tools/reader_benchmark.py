@@ -0,0 +1,110 @@
+#copyright (c) 2019 PaddlePaddle Authors. All Rights Reserve.
+#
+#Licensed under the Apache License, Version 2.0 (the "License");
+#you may not use this file except in compliance with the License.
+#You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#Unless required by applicable law or agreed to in writing, software
+#distributed under the License is distributed on an "AS IS" BASIS,
+#WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#See the License for the specific language governing permissions and
+#limitations under the License.
+"""
+Throughput of the train reader with different numbers of workers, and the
+CPU time used by the reading process itself.
+
+    python tools/reader_benchmark.py --data_dir /data/imagenet/160/train
+    # without data, on random JPEG images
+    python tools/reader_benchmark.py --fake_images 2000
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import reader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--data_dir', type=str, default=None, help='ImageFolder to read.')
+    parser.add_argument(
+        '--fake_images',
+        type=int,
+        default=2000,
+        help='Number of random JPEG images used without --data_dir.')
+    parser.add_argument(
+        '--workers',
+        type=int,
+        nargs='+',
+        default=[8, 24, 48],
+        help='Numbers of workers to benchmark.')
+    parser.add_argument('--sz', type=int, default=128, help='Image size.')
+    parser.add_argument(
+        '--num_samples',
+        type=int,
+        default=None,
+        help='Number of samples read in each run, all by default.')
+    return parser.parse_args()
+
+
+def make_fake_images(root, num):
+    for i in range(num):
+        class_dir = os.path.join(root, 'n%03d' % (i % 10))
+        if not os.path.isdir(class_dir):
+            os.makedirs(class_dir)
+        w, h = np.random.randint(200, 500, 2)
+        img = np.random.randint(0, 256, (h, w, 3)).astype('uint8')
+        Image.fromarray(img).save(os.path.join(class_dir, '%d.jpg' % i))
+
+
+# CPU time of the current process only, the workers are not counted
+process_time = time.process_time if hasattr(time,
+                                              'process_time') else time.clock
+
+
+def benchmark(data_dir, concurrent, sz, num_samples):
+    read = reader.train(data_dir, sz, concurrent=concurrent)
+    start, cpu_start = time.time(), process_time()
+    cnt = 0
+    for img, label in read():
+        cnt += 1
+        if num_samples is not None and cnt >= num_samples:
+            break
+    cpu_end = process_time()
+    elapsed = time.time() - start
+    print("workers: %d, samples: %d, %.1f samples/s, reader CPU: %.1f%%" %
+          (concurrent, cnt, cnt / elapsed,
+           100.0 * (cpu_end - cpu_start) / elapsed))
+
+
+def main():
+    args = parse_args()
+    fake_dir = None
+    data_dir = args.data_dir
+    if data_dir is None:
+        fake_dir = tempfile.mkdtemp()
+        make_fake_images(fake_dir, args.fake_images)
+        data_dir = fake_dir
+    try:
+        for concurrent in args.workers:
+            benchmark(data_dir, concurrent, args.sz, args.num_samples)
+    finally:
+        if fake_dir is not None:
+            shutil.rmtree(fake_dir)
+
+
+if __name__ == '__main__':
+    main()
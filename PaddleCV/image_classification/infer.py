@@ -49,6 +49,7 @@ add_arg('crop_size',        int,  224,                  "The value of crop size"
 add_arg('topk',             int,  1,                    "topk")
 add_arg('label_path',       str,  "./utils/tools/readable_label.txt", "readable label filepath")
 add_arg('interpolation',    int,  None,                 "The interpolation mode")
+add_arg('decode_mode',      str,  "full",               "The image decode mode: full or reduced")
 add_arg('padding_type',     str,  "SAME",               "Padding type of convolution")
 add_arg('use_se',           bool, True,                 "Whether to use Squeeze-and-Excitation module for EfficientNet.")
 # yapf: enable
@@ -14,6 +14,7 @@
 
 import os
 import math
+import json
 import random
 import functools
 import numpy as np
@@ -47,19 +48,18 @@ def rotate_image(img):
     return rotated
 
 
-def random_crop(img, size, settings, scale=None, ratio=None,
-                interpolation=None):
-    """random crop image
-        
+def random_crop_box(height, width, settings, scale=None, ratio=None):
+    """random crop box of an image
+
     Args:
-        img: image data
-        size: crop size
+        height: image height
+        width: image width
         settings: arguments
         scale: scale parameter
         ratio: ratio parameter
 
     Returns:
-        random cropped image data
+        top, left, height and width of the box
     """
     lower_scale = settings.lower_scale
     lower_ratio = settings.lower_ratio
@@ -71,20 +71,37 @@ def random_crop(img, size, settings, scale=None, ratio=None,
     w = 1. * aspect_ratio
     h = 1. / aspect_ratio
 
-    bound = min((float(img.shape[0]) / img.shape[1]) / (h**2),
-                (float(img.shape[1]) / img.shape[0]) / (w**2))
+    bound = min((float(height) / width) / (h**2),
+                (float(width) / height) / (w**2))
 
     scale_max = min(scale[1], bound)
     scale_min = min(scale[0], bound)
 
-    target_area = img.shape[0] * img.shape[1] * np.random.uniform(scale_min,
-                                                                  scale_max)
+    target_area = height * width * np.random.uniform(scale_min, scale_max)
     target_size = math.sqrt(target_area)
     w = int(target_size * w)
     h = int(target_size * h)
-    i = np.random.randint(0, img.shape[0] - h + 1)
-    j = np.random.randint(0, img.shape[1] - w + 1)
+    i = np.random.randint(0, height - h + 1)
+    j = np.random.randint(0, width - w + 1)
+    return i, j, h, w
+
+
+def random_crop(img, size, settings, scale=None, ratio=None,
+                interpolation=None):
+    """random crop image
+        
+    Args:
+        img: image data
+        size: crop size
+        settings: arguments
+        scale: scale parameter
+        ratio: ratio parameter
 
+    Returns:
+        random cropped image data
+    """
+    i, j, h, w = random_crop_box(img.shape[0], img.shape[1], settings, scale,
+                                 ratio)
     img = img[i:i + h, j:j + w, :]
 
     if interpolation:
@@ -154,6 +171,104 @@ def crop_image(img, target_size, center):
     return img
 
 
+REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8),
+                 (4, cv2.IMREAD_REDUCED_COLOR_4),
+                 (2, cv2.IMREAD_REDUCED_COLOR_2)]
+
+
+def jpeg_size(img_path):
+    """read the size of a JPEG image from its header
+
+    Args:
+        img_path: image path
+
+    Returns:
+        height and width of the image, None if it is not a JPEG image
+    """
+    try:
+        with open(img_path, 'rb') as f:
+            img = Image.open(f)
+            if img.format != 'JPEG':
+                return None
+            return img.size[1], img.size[0]
+    except IOError:
+        return None
+
+
+def reduced_imread(img_path, short_size, min_size):
+    """decode an image with the JPEG DCT scaling of IMREAD_REDUCED_*, at the
+    largest reduction that keeps short_size pixels at least min_size
+
+    Args:
+        img_path: image path
+        short_size: the pixels of the original image which must be kept
+        min_size: the least number of pixels they are reduced to
+
+    Returns:
+        img: image data
+        factor: the reduction factor, 1 for a full decode
+    """
+    for factor, flag in REDUCED_FLAGS:
+        if float(short_size) / factor >= min_size:
+            return cv2.imread(img_path, flag), factor
+    return cv2.imread(img_path), 1
+
+
+def decode_random_crop(img_path, size, settings, interpolation=None):
+    """random_crop of a JPEG image which only decodes it at the resolution
+    the crop needs, the crop box is drawn from the size in the header
+
+    Args:
+        img_path: image path
+        size: crop size
+        settings: arguments
+        interpolation: interpolation mode
+
+    Returns:
+        random cropped image data
+    """
+    shape = jpeg_size(img_path)
+    if shape is None:
+        return random_crop(
+            cv2.imread(img_path), size, settings, interpolation=interpolation)
+    height, width = shape
+    i, j, h, w = random_crop_box(height, width, settings)
+    img, factor = reduced_imread(img_path, min(h, w), size)
+    if (img.shape[0] > img.shape[1]) != (height > width):
+        # cv2 applied the EXIF orientation, transpose the box
+        height, width, i, j, h, w = width, height, j, i, w, h
+    scale_h = float(img.shape[0]) / height
+    scale_w = float(img.shape[1]) / width
+    img = img[int(i * scale_h):int(math.ceil((i + h) * scale_h)),
+              int(j * scale_w):int(math.ceil((j + w) * scale_w)), :]
+
+    if interpolation:
+        resized = cv2.resize(img, (size, size), interpolation=interpolation)
+    else:
+        resized = cv2.resize(img, (size, size))
+    return resized
+
+
+def decode_resize_short(img_path, target_size, interpolation=None):
+    """resize_short of a JPEG image which decodes it at the smallest
+    resolution whose short side is still at least target_size
+
+    Args:
+        img_path: image path
+        target_size: resize short target size
+        interpolation: interpolation mode
+
+    Returns:
+        resized image data
+    """
+    shape = jpeg_size(img_path)
+    if shape is None:
+        img = cv2.imread(img_path)
+    else:
+        img, _ = reduced_imread(img_path, min(shape), target_size)
+    return resize_short(img, target_size, interpolation=interpolation)
+
+
 def create_mixup_reader(settings, rd):
     """
     """
@@ -195,7 +310,12 @@ def create_mixup_reader(settings, rd):
 
     return mixup_reader
 
-def process_image(sample, settings, mode, color_jitter, rotate):
+def process_image(sample,
+                  settings,
+                  mode,
+                  color_jitter,
+                  rotate,
+                  decode_mode='full'):
     """ process_image """
 
     mean = settings.image_mean
@@ -203,12 +323,21 @@ def process_image(sample, settings, mode, color_jitter, rotate):
     crop_size = settings.crop_size
 
     img_path = sample[0]
-    img = cv2.imread(img_path)
+    # the reduced decode needs to crop or resize before anything else
+    reduced = decode_mode == 'reduced' and crop_size > 0 and not rotate
+    if not reduced:
+        img = cv2.imread(img_path)
 
     if mode == 'train':
         if rotate:
             img = rotate_image(img)
-        if crop_size > 0:
+        if reduced:
+            img = decode_random_crop(
+                img_path,
+                crop_size,
+                settings,
+                interpolation=settings.interpolation)
+        elif crop_size > 0:
             img = random_crop(img, crop_size, settings, interpolation=settings.interpolation)
         if color_jitter:
             img = distort_color(img)
@@ -217,7 +346,13 @@ def process_image(sample, settings, mode, color_jitter, rotate):
     else:
         if crop_size > 0:
             target_size = settings.resize_short_size
-            img = resize_short(img, target_size, interpolation=settings.interpolation)
+            if reduced:
+                img = decode_resize_short(
+                    img_path,
+                    target_size,
+                    interpolation=settings.interpolation)
+            else:
+                img = resize_short(img, target_size, interpolation=settings.interpolation)
             img = crop_image(img, target_size=crop_size, center=True)
 
     img = img[:, :, ::-1]
@@ -239,16 +374,85 @@ def process_image(sample, settings, mode, color_jitter, rotate):
     elif mode == 'test':
         return (img, )
 
-def process_batch_data(input_data, settings, mode, color_jitter, rotate):
+def process_batch_data(input_data,
+                       settings,
+                       mode,
+                       color_jitter,
+                       rotate,
+                       decode_mode='full'):
     batch_data = []
     for sample in input_data:
-        if os.path.isfile(sample[0]):
-            batch_data.append(
-                process_image(sample, settings, mode, color_jitter, rotate))
-        else:
-            print("File not exist : %s" % sample[0])
+        batch_data.append(
+            process_image(sample, settings, mode, color_jitter, rotate,
+                          decode_mode))
     return batch_data
 
+
+def read_image_list(file_list, data_dir):
+    """read the image paths and labels of a file list, the images which do
+    not exist are dropped
+
+    Args:
+        file_list: file list path
+        data_dir: directory the image paths are relative to
+
+    Returns:
+        list of [image path, label]
+    """
+    samples = []
+    with open(file_list) as flist:
+        for line in flist:
+            img_path, label = line.split()
+            img_path = os.path.join(data_dir, img_path)
+            if os.path.isfile(img_path):
+                samples.append([img_path, int(label)])
+            else:
+                print("File not exist : %s" % img_path)
+    return samples
+
+def process_cache_image(sample, settings, decode_mode='full'):
+    """the deterministic part of process_image in val mode, resize_short and
+    center crop, the image is kept as uint8
+
+    Args:
+        sample: index, image path and label
+        settings: arguments
+        decode_mode: image decode mode
+
+    Returns:
+        index, HWC RGB uint8 image data and label
+    """
+    idx, img_path, label = sample
+    target_size = settings.resize_short_size
+    if decode_mode == 'reduced':
+        img = decode_resize_short(
+            img_path, target_size, interpolation=settings.interpolation)
+    else:
+        img = resize_short(
+            cv2.imread(img_path),
+            target_size,
+            interpolation=settings.interpolation)
+    img = crop_image(img, target_size=settings.crop_size, center=True)
+    return idx, img[:, :, ::-1], label
+
+
+def normalize_batch(images, mean, std):
+    """normalize a batch of images as process_image does for one image
+
+    Args:
+        images: NHWC RGB uint8 images
+        mean: the mean of every channel
+        std: the std of every channel
+
+    Returns:
+        NCHW float32 image data
+    """
+    img = images.transpose((0, 3, 1, 2)).astype('float32') / 255
+    img -= np.array(mean).reshape((1, 3, 1, 1))
+    img /= np.array(std).reshape((1, 3, 1, 1))
+    return img
+
+
 class ImageNetReader:
     def __init__(self, seed=None):
         self.shuffle_seed = seed
@@ -269,26 +473,28 @@ class ImageNetReader:
             batch_size = 1
         else:
             batch_size = settings.batch_size / paddle.fluid.core.get_cuda_device_count()
+        decode_mode = settings.decode_mode if 'decode_mode' in settings else 'full'
+        assert decode_mode in ['full', 'reduced'], \
+            "decode_mode must be full or reduced, but got {}".format(decode_mode)
+        # the files are only checked once, not for every sample of every epoch
+        samples = read_image_list(file_list, data_dir)
         def reader():
             def read_file_list():
-                with open(file_list) as flist:
-                    full_lines = [line.strip() for line in flist]
-                    if mode != "test" and len(full_lines) < settings.batch_size:
-                        print(
-                            "Warning: The number of the whole data ({}) is smaller than the batch_size ({}), and drop_last is turnning on, so nothing  will feed in program, Terminated now. Please reset batch_size to a smaller number or feed more data!"
-                            .format(len(full_lines), settings.batch_size))
-                        os._exit(1)
-                    if num_trainers > 1 and mode == "train":
-                        assert self.shuffle_seed is not None, "multiprocess train, shuffle seed must be set!"
-                        np.random.RandomState(self.shuffle_seed).shuffle(full_lines)
-                    elif shuffle:
-                        np.random.shuffle(full_lines)
+                full_lines = list(samples)
+                if mode != "test" and len(full_lines) < settings.batch_size:
+                    print(
+                        "Warning: The number of the whole data ({}) is smaller than the batch_size ({}), and drop_last is turnning on, so nothing  will feed in program, Terminated now. Please reset batch_size to a smaller number or feed more data!"
+                        .format(len(full_lines), settings.batch_size))
+                    os._exit(1)
+                if num_trainers > 1 and mode == "train":
+                    assert self.shuffle_seed is not None, "multiprocess train, shuffle seed must be set!"
+                    np.random.RandomState(self.shuffle_seed).shuffle(full_lines)
+                elif shuffle:
+                    np.random.shuffle(full_lines)
 
                 batch_data = []
-                for line in full_lines:
-                    img_path, label = line.split()
-                    img_path = os.path.join(data_dir, img_path)
-                    batch_data.append([img_path, int(label)])
+                for sample in full_lines:
+                    batch_data.append(sample)
                     if len(batch_data) == batch_size:
                         if mode == 'train' or mode == 'val' or mode == 'test':
                             yield batch_data
@@ -310,7 +516,8 @@ class ImageNetReader:
             settings=settings,
             mode=mode,
             color_jitter=color_jitter,
-            rotate=rotate)
+            rotate=rotate,
+            decode_mode=decode_mode)
 
         return fluid.io.xmap_readers(
             mapper,
@@ -375,6 +582,119 @@ class ImageNetReader:
             settings, file_list, 'val', shuffle=False, data_dir=settings.data_dir)
 
 
+    def _build_val_cache(self, settings, file_list, cache_dir, meta,
+                         decode_mode):
+        """decode, resize and crop all the images of file_list once and store
+        them in cache_dir as a NHWC uint8 array with a label array
+        """
+        samples = read_image_list(file_list, settings.data_dir)
+        crop_size = settings.crop_size
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError:
+                if not os.path.isdir(cache_dir):
+                    raise
+        meta_path = os.path.join(cache_dir, 'meta.json')
+        if os.path.isfile(meta_path):
+            os.remove(meta_path)
+        # every file is written under a per-process name and renamed into
+        # place, so that processes building the same cache don't mix files
+        suffix = '.tmp.{}'.format(os.getpid())
+        images_path = os.path.join(cache_dir, 'images.npy')
+        images = np.lib.format.open_memmap(
+            images_path + suffix,
+            mode='w+',
+            dtype='uint8',
+            shape=(len(samples), crop_size, crop_size, 3))
+        labels = np.zeros([len(samples)], dtype='int64')
+
+        def sample_reader():
+            for idx, (img_path, label) in enumerate(samples):
+                yield idx, img_path, label
+
+        mapper = functools.partial(
+            process_cache_image, settings=settings, decode_mode=decode_mode)
+        cache_reader = fluid.io.xmap_readers(
+            mapper,
+            sample_reader,
+            settings.reader_thread,
+            settings.reader_buf_size,
+            order=False)
+        for idx, img, label in cache_reader():
+            images[idx] = img
+            labels[idx] = label
+        images.flush()
+        del images
+        os.rename(images_path + suffix, images_path)
+        labels_path = os.path.join(cache_dir, 'labels.npy')
+        with open(labels_path + suffix, 'wb') as f:
+            np.save(f, labels)
+        os.rename(labels_path + suffix, labels_path)
+        # the meta file is written last, the cache is only used with it
+        meta['num_images'] = len(samples)
+        with open(meta_path + suffix, 'w') as f:
+            json.dump(meta, f)
+        os.rename(meta_path + suffix, meta_path)
+
+    def cached_val(self, settings):
+        """Create a batch reader for eval which reads the resized and center
+        cropped images from a uint8 cache in settings.val_cache_dir, the
+        cache is built by the first call. Use it with set_batch_generator.
+
+        Args:
+            settings: arguments
+
+        Returns:
+            eval batch reader yielding float32 images and int64 labels
+        """
+        file_list = os.path.join(settings.data_dir, 'val_list.txt')
+        assert os.path.isfile(
+            file_list), "{} doesn't exist, please check data list path".format(
+                file_list)
+        assert settings.crop_size > 0, "the val cache needs crop_size > 0"
+        decode_mode = settings.decode_mode if 'decode_mode' in settings else 'full'
+
+        cache_dir = settings.val_cache_dir
+        meta = {
+            'file_list': os.path.abspath(file_list),
+            'file_list_mtime': os.path.getmtime(file_list),
+            'crop_size': settings.crop_size,
+            'resize_short_size': settings.resize_short_size,
+            'interpolation': settings.interpolation,
+            'decode_mode': decode_mode,
+        }
+        meta_path = os.path.join(cache_dir, 'meta.json')
+        cached_meta = None
+        if os.path.isfile(meta_path):
+            with open(meta_path) as f:
+                cached_meta = json.load(f)
+            cached_meta.pop('num_images', None)
+        if cached_meta != meta:
+            print("Building the val cache in {}".format(cache_dir))
+            self._build_val_cache(settings, file_list, cache_dir, meta,
+                                  decode_mode)
+
+        batch_size = int(settings.batch_size /
+                         paddle.fluid.core.get_cuda_device_count())
+        mean = settings.image_mean
+        std = settings.image_std
+
+        def reader():
+            images = np.load(
+                os.path.join(cache_dir, 'images.npy'), mmap_mode='r')
+            labels = np.load(os.path.join(cache_dir, 'labels.npy'))
+            # the last incomplete batch is dropped as by val()
+            for begin in range(0, len(labels) - batch_size + 1, batch_size):
+                end = begin + batch_size
+                yield [
+                    normalize_batch(images[begin:end], mean, std),
+                    labels[begin:end].reshape([-1, 1])
+                ]
+
+        return reader
+
+
     def test(self, settings):
         """Create a reader for testing
 
@@ -181,14 +181,18 @@ def train(args):
     num_trainers = int(os.environ.get('PADDLE_TRAINERS_NUM', 1))
     imagenet_reader = reader.ImageNetReader(0 if num_trainers > 1 else None)
     train_reader = imagenet_reader.train(settings=args)
-    test_reader = imagenet_reader.val(settings=args)
-
     train_data_loader.set_sample_list_generator(train_reader, place)
-    test_data_loader.set_sample_list_generator(test_reader, place)
+    trainer_id = int(os.getenv("PADDLE_TRAINER_ID", 0))
+    # only trainer 0 validates, the others don't build the val cache
+    if args.val_cache_dir and trainer_id == 0 and args.validate:
+        test_reader = imagenet_reader.cached_val(settings=args)
+        test_data_loader.set_batch_generator(test_reader, place)
+    else:
+        test_reader = imagenet_reader.val(settings=args)
+        test_data_loader.set_sample_list_generator(test_reader, place)
 
     compiled_train_prog = best_strategy_compiled(args, train_prog,
                                                  train_fetch_vars[0], exe)
-    trainer_id = int(os.getenv("PADDLE_TRAINER_ID", 0))
     total_batch_num = 0  #this is for benchmark
     for pass_id in range(args.num_epochs):
         if num_trainers > 1:
@@ -124,6 +124,8 @@ def parse_args():
     add_arg('reader_thread',            int,    8,                      "The number of multi thread reader")
     add_arg('reader_buf_size',          int,    2048,                   "The buf size of multi thread reader")
     add_arg('interpolation',            int,    None,                   "The interpolation mode")
+    add_arg('decode_mode',              str,    "full",                 "The image decode mode: full or reduced, reduced decodes JPEG images at the lowest resolution the crop needs")
+    add_arg('val_cache_dir',            str,    "",                     "The directory of the uint8 cache of the resized and cropped val images, no cache if empty")
     add_arg('use_aa',                   bool,   False,                  "Whether to use auto augment")
     parser.add_argument('--image_mean', nargs='+', type=float, default=[0.485, 0.456, 0.406], help="The mean of input image data")
     parser.add_argument('--image_std', nargs='+', type=float, default=[0.229, 0.224, 0.225], help="The std of input image data")
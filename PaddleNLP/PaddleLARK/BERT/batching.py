@@ -74,6 +74,126 @@ def mask(batch_tokens, total_token_num, vocab_size, CLS=1, SEP=2, MASK=3):
     return batch_tokens, mask_label, mask_pos
 
 
+def mask_flat_batch(token_ids,
+                    seq_lens,
+                    max_len,
+                    vocab_size,
+                    CLS=1,
+                    SEP=2,
+                    MASK=3):
+    """
+    Same as mask() but vectorized over the concatenated tokens of a batch,
+    the random numbers are drawn as in mask() so both give the same output
+    for the same random state. Return the masked tokens (a copy),
+    mask_label and mask_pos.
+    """
+    token_ids = np.asarray(token_ids)
+    seq_lens = np.asarray(seq_lens, dtype="int64")
+    total_token_num = len(token_ids)
+    prob_mask = np.random.rand(total_token_num)
+    # Note: the first token is [CLS], so [low=1]
+    replace_ids = np.random.randint(1, high=vocab_size, size=total_token_num)
+
+    starts = np.cumsum(seq_lens) - seq_lens
+    sent_index = np.repeat(np.arange(len(seq_lens)), seq_lens)
+    token_index = np.arange(total_token_num) - np.repeat(starts, seq_lens)
+    special = (token_ids == SEP) | (token_ids == CLS)
+    # (0.03, 0.15]: mask, (0.015, 0.03]: random replace, else keep
+    selected = (prob_mask <= 0.15) & ~special
+    replaced = selected & (prob_mask > 0.015) & (prob_mask <= 0.03)
+    masked = selected & (prob_mask > 0.03)
+
+    out = token_ids.copy()
+    out[masked] = MASK
+    out[replaced] = replace_ids[replaced]
+    label = token_ids[selected]
+    sent = sent_index[selected]
+    pos = token_index[selected]
+    # mask() appends the forced mask of a sentence after its other labels
+    order_key = sent * (max_len + 1) + pos
+
+    # ensure at least mask one word in a sentence
+    mask_flag = np.bincount(
+        sent_index[masked | replaced], minlength=len(seq_lens)) > 0
+    forced_label, forced_sent, forced_pos = [], [], []
+    for sent_idx in np.nonzero(~mask_flag)[0]:
+        start, sent_len = starts[sent_idx], seq_lens[sent_idx]
+        if special[start + 1:start + sent_len - 1].all():
+            # nothing can be masked, mask() would never end
+            continue
+        while True:
+            token_idx = int(
+                np.random.randint(
+                    1, high=sent_len - 1, size=1)[0])
+            if not special[start + token_idx]:
+                break
+        forced_label.append(out[start + token_idx])
+        forced_sent.append(sent_idx)
+        forced_pos.append(token_idx)
+        out[start + token_idx] = MASK
+
+    if forced_sent:
+        forced_sent = np.array(forced_sent, dtype="int64")
+        forced_pos = np.array(forced_pos, dtype="int64")
+        label = np.concatenate([label, forced_label])
+        pos = np.concatenate([pos, forced_pos])
+        sent = np.concatenate([sent, forced_sent])
+        order_key = np.concatenate(
+            [order_key, forced_sent * (max_len + 1) + max_len])
+        order = np.argsort(order_key, kind="mergesort")
+        label, sent, pos = label[order], sent[order], pos[order]
+
+    mask_label = label.astype("int64").reshape([-1, 1])
+    mask_pos = (sent * max_len + pos).astype("int64").reshape([-1, 1])
+    return out, mask_label, mask_pos
+
+
+def prepare_flat_batch_data(token_ids,
+                            sent_ids,
+                            pos_ids,
+                            seq_lens,
+                            labels,
+                            voc_size=0,
+                            pad_id=None,
+                            cls_id=None,
+                            sep_id=None,
+                            mask_id=None):
+    """
+    prepare_batch_data of the pretraining samples given as the concatenated
+    token_ids, sent_ids and pos_ids of the batch with the length of every
+    sample, the masking and the padding are vectorized. Return
+    [src_id, pos_id, sent_id, self_input_mask, mask_label, mask_pos, labels].
+    """
+    seq_lens = np.asarray(seq_lens, dtype="int64")
+    batch_size, max_len = len(seq_lens), int(seq_lens.max())
+    out, mask_label, mask_pos = mask_flat_batch(
+        token_ids,
+        seq_lens,
+        max_len,
+        vocab_size=voc_size,
+        CLS=cls_id,
+        SEP=sep_id,
+        MASK=mask_id)
+
+    # the rows and columns of the tokens in the padded batch
+    starts = np.cumsum(seq_lens) - seq_lens
+    rows = np.repeat(np.arange(batch_size), seq_lens)
+    cols = np.arange(len(out)) - np.repeat(starts, seq_lens)
+
+    def pad(ids):
+        padded = np.full([batch_size, max_len], pad_id, dtype="int64")
+        padded[rows, cols] = ids
+        return padded
+
+    self_input_mask = (np.arange(max_len)[None, :] < seq_lens[:, None])
+    self_input_mask = np.expand_dims(self_input_mask, axis=-1)
+    labels = np.asarray(labels).astype("int64").reshape([-1, 1])
+    return [
+        pad(out), pad(pos_ids), pad(sent_ids),
+        self_input_mask.astype("float32"), mask_label, mask_pos, labels
+    ]
+
+
 def prepare_batch_data(insts,
                        total_token_num,
                        voc_size=0,
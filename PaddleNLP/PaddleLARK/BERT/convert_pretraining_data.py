@@ -0,0 +1,83 @@
+#   Copyright (c) 2019 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Convert the gzipped text pretraining data to binary shards.
+
+Every "<name>.gz" file of input_dir is written to output_dir as the binary
+shard "<name>.ids.npy" and "<name>.index.npz", which DataReader memory maps
+instead of parsing the text lines when data_dir contains shards.
+"""
+
+from __future__ import print_function
+
+import argparse
+import gzip
+import multiprocessing
+import os
+import time
+
+from reader.pretraining import parse_line, write_shard
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(__doc__)
+    parser.add_argument(
+        "--input_dir",
+        type=str,
+        required=True,
+        help="Directory of the gzipped text pretraining data.")
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        required=True,
+        help="Directory to write the binary shards to.")
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of files converted in parallel.")
+    return parser.parse_args()
+
+
+def convert_file(paths):
+    input_path, prefix = paths
+    with gzip.open(input_path, "rb") as f:
+        num_samples = write_shard(prefix, (parse_line(line) for line in f))
+    return input_path, num_samples
+
+
+def main(args):
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    jobs = [(os.path.join(args.input_dir, name),
+             os.path.join(args.output_dir, name[:-len(".gz")]))
+            for name in sorted(os.listdir(args.input_dir))
+            if name.endswith(".gz")]
+    assert len(jobs) > 0, "[Error] no gzip file in %s" % args.input_dir
+
+    start = time.time()
+    if args.num_workers > 1:
+        pool = multiprocessing.Pool(args.num_workers)
+        results = pool.imap_unordered(convert_file, jobs)
+    else:
+        results = (convert_file(job) for job in jobs)
+    for input_path, num_samples in results:
+        print("converted %s: %d samples" % (input_path, num_samples))
+    if args.num_workers > 1:
+        pool.close()
+        pool.join()
+    print("converted %d files in %.2fs" % (len(jobs), time.time() - start))
+
+
+if __name__ == "__main__":
+    main(parse_args())
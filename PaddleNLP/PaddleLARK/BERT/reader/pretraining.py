@@ -29,7 +29,60 @@ import tokenization
 import paddle
 import paddle.fluid as fluid
 
-from batching import prepare_batch_data
+from batching import prepare_flat_batch_data
+
+# a binary shard is made of a "<name>.ids.npy" file holding the token, sentence
+# and position ids of all the samples as an int32 array of shape
+# [3, total_token_num], and a "<name>.index.npz" file with their offsets in it
+# and their labels
+SHARD_IDS_SUFFIX = ".ids.npy"
+SHARD_INDEX_SUFFIX = ".index.npz"
+
+
+def write_shard(prefix, samples):
+    """ write parsed samples [token_ids, sent_ids, pos_ids, label] to the
+    binary shard prefix + SHARD_IDS_SUFFIX and prefix + SHARD_INDEX_SUFFIX,
+    returns the number of samples
+    """
+    seq_lens, labels = [], []
+    ids = [[], [], []]
+    for token_ids, sent_ids, pos_ids, label in samples:
+        ids[0].extend(token_ids)
+        ids[1].extend(sent_ids)
+        ids[2].extend(pos_ids)
+        seq_lens.append(len(token_ids))
+        labels.append(label)
+    offsets = np.zeros([len(seq_lens) + 1], dtype="int64")
+    np.cumsum(seq_lens, out=offsets[1:])
+    np.save(prefix + SHARD_IDS_SUFFIX, np.array(ids, dtype="int32"))
+    np.savez(
+        prefix + SHARD_INDEX_SUFFIX,
+        offsets=offsets,
+        labels=np.array(labels, dtype="int32"))
+    return len(seq_lens)
+
+
+def parse_line(line):
+    """ parse one line to token_ids, sentence_ids, pos_ids, label
+    """
+    line = line.strip().decode().split(";")
+    assert len(line) == 4, "One sample must have 4 fields!"
+    (token_ids, sent_ids, pos_ids, label) = line
+    token_ids = [int(token) for token in token_ids.split(" ")]
+    sent_ids = [int(token) for token in sent_ids.split(" ")]
+    pos_ids = [int(token) for token in pos_ids.split(" ")]
+    assert len(token_ids) == len(sent_ids) == len(
+        pos_ids
+    ), "[Must be true]len(token_ids) == len(sent_ids) == len(pos_ids)"
+    return [token_ids, sent_ids, pos_ids, int(label)]
+
+
+def load_shard(prefix):
+    """ memory map the ids of a binary shard, returns ids, offsets, labels
+    """
+    ids = np.load(prefix + SHARD_IDS_SUFFIX, mmap_mode="r")
+    index = np.load(prefix + SHARD_INDEX_SUFFIX)
+    return ids, index["offsets"], index["labels"]
 
 
 class DataReader(object):
@@ -77,23 +130,37 @@ class DataReader(object):
         return self.current_epoch, self.current_file_index, self.total_file, self.current_file
 
     def parse_line(self, line, max_seq_len=512):
-        """ parse one line to token_ids, sentence_ids, pos_ids, label
+        """ parse one line to token_ids, sentence_ids, pos_ids, label, None
+        if the sample is longer than max_seq_len
         """
-        line = line.strip().decode().split(";")
-        assert len(line) == 4, "One sample must have 4 fields!"
-        (token_ids, sent_ids, pos_ids, label) = line
-        token_ids = [int(token) for token in token_ids.split(" ")]
-        sent_ids = [int(token) for token in sent_ids.split(" ")]
-        pos_ids = [int(token) for token in pos_ids.split(" ")]
-        assert len(token_ids) == len(sent_ids) == len(
-            pos_ids
-        ), "[Must be true]len(token_ids) == len(sent_ids) == len(pos_ids)"
-        label = int(label)
-        if len(token_ids) > max_seq_len:
+        sample = parse_line(line)
+        if len(sample[0]) > max_seq_len:
             return None
-        return [token_ids, sent_ids, pos_ids, label]
+        return sample
+
+    def read_shard(self, file, as_list=False):
+        """ read the samples of a binary shard, the ids of a sample are views
+        of the memory mapped shard, or lists if as_list
+        """
+        prefix = os.path.join(self.data_dir, file[:-len(SHARD_IDS_SUFFIX)])
+        ids, offsets, labels = load_shard(prefix)
+        seq_lens = offsets[1:] - offsets[:-1]
+        for index in np.nonzero(seq_lens <= self.max_seq_len)[0]:
+            sample_ids = ids[:, offsets[index]:offsets[index + 1]]
+            if as_list:
+                sample_ids = sample_ids.tolist()
+            yield [
+                sample_ids[0], sample_ids[1], sample_ids[2],
+                int(labels[index])
+            ]
 
     def read_file(self, file):
+        if file.endswith(SHARD_IDS_SUFFIX):
+            for sample in self.read_shard(
+                    file,
+                    as_list=not self.is_test and self.generate_neg_sample):
+                yield sample
+            return
         assert file.endswith('.gz'), "[ERROR] %s is not a gzip file" % file
         file_path = self.data_dir + "/" + file
         with gzip.open(file_path, "rb") as f:
@@ -228,6 +295,20 @@ class DataReader(object):
         data_generator
         """
         files = os.listdir(self.data_dir)
+        shards = [f for f in files if f.endswith(SHARD_IDS_SUFFIX)]
+        if len(shards) > 0:
+            shard_names = set(f[:-len(SHARD_IDS_SUFFIX)] for f in shards)
+            missing = [
+                f for f in files
+                if f.endswith(".gz") and f[:-len(".gz")] not in shard_names
+            ]
+            assert len(missing) == 0, "[Error] no binary shard of %s in " \
+                "%s, run convert_pretraining_data.py again" % (
+                    missing, self.data_dir)
+            files = shards
+        print("read %d %s files of %s" %
+              (len(files), "binary shard" if len(shards) > 0 else "gzip",
+               self.data_dir))
         self.total_file = len(files)
         assert self.total_file > 0, "[Error] data_dir is empty"
 
@@ -271,17 +352,17 @@ class DataReader(object):
 
             for batch_data, total_token_num in batch_reader(
                     reader, self.batch_size, self.in_tokens):
-                yield prepare_batch_data(
-                    batch_data,
-                    total_token_num,
+                yield prepare_flat_batch_data(
+                    np.concatenate([inst[0] for inst in batch_data]),
+                    np.concatenate([inst[1] for inst in batch_data]),
+                    np.concatenate([inst[2] for inst in batch_data]),
+                    [len(inst[0]) for inst in batch_data],
+                    [inst[3] for inst in batch_data],
                     voc_size=self.voc_size,
                     pad_id=self.pad_id,
                     cls_id=self.cls_id,
                     sep_id=self.sep_id,
-                    mask_id=self.mask_id,
-                    return_input_mask=True,
-                    return_max_len=False,
-                    return_num_token=False)
+                    mask_id=self.mask_id)
 
         return wrapper
 
@@ -19,6 +19,7 @@ from __future__ import division
 from __future__ import print_function
 
 import collections
+import multiprocessing
 import unicodedata
 import six
 import io
@@ -107,23 +108,80 @@ def whitespace_tokenize(text):
     return tokens
 
 
+class LRUCache(object):
+    """A dict of limited size which drops the least recently used items."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = collections.OrderedDict()
+
+    def get(self, key):
+        """Returns the value of `key` or None if it is not cached."""
+        value = self._items.get(key)
+        if value is not None:
+            if six.PY3:
+                self._items.move_to_end(key)
+            else:
+                self._items[key] = self._items.pop(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        self._items[key] = value
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+_pool_tokenizer = None
+
+
+def _init_tokenize_worker(tokenizer):
+    global _pool_tokenizer
+    _pool_tokenizer = tokenizer
+
+
+def _tokenize_in_worker(text):
+    return _pool_tokenizer.tokenize(text)
+
+
+def tokenize_many(tokenizer, texts, num_workers=0, chunksize=256):
+    """Tokenizes a list of texts, in a pool of `num_workers` processes if it
+    is more than 1. Returns the tokens of every text in the same order."""
+    if num_workers <= 1:
+        return [tokenizer.tokenize(text) for text in texts]
+    pool = multiprocessing.Pool(
+        num_workers,
+        initializer=_init_tokenize_worker,
+        initargs=(tokenizer, ))
+    try:
+        return pool.map(_tokenize_in_worker, texts, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
 class FullTokenizer(object):
     """Runs end-to-end tokenziation."""
 
-    def __init__(self, vocab_file, do_lower_case=True):
+    def __init__(self, vocab_file, do_lower_case=True, cache_size=100000):
         self.vocab = load_vocab(vocab_file)
         self.inv_vocab = {v: k for k, v in self.vocab.items()}
-        self.basic_tokenizer = BasicTokenizer(do_lower_case=do_lower_case)
-        self.wordpiece_tokenizer = WordpieceTokenizer(vocab=self.vocab)
+        self.basic_tokenizer = BasicTokenizer(
+            do_lower_case=do_lower_case, cache_size=cache_size)
+        self.wordpiece_tokenizer = WordpieceTokenizer(
+            vocab=self.vocab, cache_size=cache_size)
 
     def tokenize(self, text):
         split_tokens = []
         for token in self.basic_tokenizer.tokenize(text):
-            for sub_token in self.wordpiece_tokenizer.tokenize(token):
-                split_tokens.append(sub_token)
+            split_tokens.extend(self.wordpiece_tokenizer.tokenize_token(token))
 
         return split_tokens
 
+    def tokenize_many(self, texts, num_workers=0, chunksize=256):
+        return tokenize_many(self, texts, num_workers, chunksize)
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -134,10 +192,11 @@ class FullTokenizer(object):
 class CharTokenizer(object):
     """Runs end-to-end tokenziation."""
 
-    def __init__(self, vocab_file, do_lower_case=True):
+    def __init__(self, vocab_file, do_lower_case=True, cache_size=100000):
         self.vocab = load_vocab(vocab_file)
         self.inv_vocab = {v: k for k, v in self.vocab.items()}
-        self.wordpiece_tokenizer = WordpieceTokenizer(vocab=self.vocab)
+        self.wordpiece_tokenizer = WordpieceTokenizer(
+            vocab=self.vocab, cache_size=cache_size)
 
     def tokenize(self, text):
         split_tokens = []
@@ -147,6 +206,9 @@ class CharTokenizer(object):
 
         return split_tokens
 
+    def tokenize_many(self, texts, num_workers=0, chunksize=256):
+        return tokenize_many(self, texts, num_workers, chunksize)
+
     def convert_tokens_to_ids(self, tokens):
         return convert_by_vocab(self.vocab, tokens)
 
@@ -154,71 +216,113 @@ class CharTokenizer(object):
         return convert_by_vocab(self.inv_vocab, ids)
 
 
+class _CharMap(dict):
+    """`translate` table doing `_clean_text` and `_tokenize_chinese_chars` at
+    once, the mapping of a character is computed the first time it is seen."""
+
+    def __missing__(self, cp):
+        char = six.unichr(cp)
+        if cp == 0 or cp == 0xfffd or _is_control(char):
+            value = u""
+        elif _is_whitespace(char):
+            value = u" "
+        elif _is_chinese_char(cp):
+            value = u" " + char + u" "
+        else:
+            value = char
+        self[cp] = value
+        return value
+
+
+_char_map = _CharMap()
+
+
+class _AccentMap(dict):
+    """`translate` table removing the non spacing marks."""
+
+    def __missing__(self, cp):
+        char = six.unichr(cp)
+        value = None if unicodedata.category(char) == "Mn" else char
+        self[cp] = value
+        return value
+
+
+_accent_map = _AccentMap()
+
+
+class _PunctuationMap(dict):
+    """Whether a character is a punctuation, cached for every character."""
+
+    def __missing__(self, char):
+        value = _is_punctuation(char)
+        self[char] = value
+        return value
+
+
+_punctuation_map = _PunctuationMap()
+
+
 class BasicTokenizer(object):
     """Runs basic tokenization (punctuation splitting, lower casing, etc.)."""
 
-    def __init__(self, do_lower_case=True):
+    def __init__(self, do_lower_case=True, cache_size=0):
         """Constructs a BasicTokenizer.
 
         Args:
             do_lower_case: Whether to lower case the input.
+            cache_size: Number of words whose tokens are cached.
         """
         self.do_lower_case = do_lower_case
+        self.cache = LRUCache(cache_size)
 
     def tokenize(self, text):
         """Tokenizes a piece of text."""
         text = convert_to_unicode(text)
-        text = self._clean_text(text)
 
-        # This was added on November 1st, 2018 for the multilingual and Chinese
-        # models. This is also applied to the English models now, but it doesn't
-        # matter since the English models were not trained on any Chinese data
-        # and generally don't have any Chinese data in them (there are Chinese
-        # characters in the vocabulary because Wikipedia does have some Chinese
-        # words in the English Wikipedia.).
-        text = self._tokenize_chinese_chars(text)
+        # This does _clean_text and _tokenize_chinese_chars. The Chinese
+        # characters were added on November 1st, 2018 for the multilingual and
+        # Chinese models. This is also applied to the English models now, but
+        # it doesn't matter since the English models were not trained on any
+        # Chinese data and generally don't have any Chinese data in them
+        # (there are Chinese characters in the vocabulary because Wikipedia
+        # does have some Chinese words in the English Wikipedia.).
+        text = text.translate(_char_map)
 
-        orig_tokens = whitespace_tokenize(text)
-        split_tokens = []
-        for token in orig_tokens:
-            if self.do_lower_case:
-                token = token.lower()
-                token = self._run_strip_accents(token)
-            split_tokens.extend(self._run_split_on_punc(token))
-
-        output_tokens = whitespace_tokenize(" ".join(split_tokens))
+        output_tokens = []
+        for token in whitespace_tokenize(text):
+            tokens = self.cache.get(token)
+            if tokens is None:
+                tokens = self._tokenize_word(token)
+                self.cache.put(token, tokens)
+            output_tokens.extend(tokens)
         return output_tokens
 
+    def _tokenize_word(self, token):
+        """Lower cases, strips accents and splits punctuation of a word."""
+        if self.do_lower_case:
+            token = token.lower()
+            token = self._run_strip_accents(token)
+        return whitespace_tokenize(" ".join(self._run_split_on_punc(token)))
+
     def _run_strip_accents(self, text):
         """Strips accents from a piece of text."""
         text = unicodedata.normalize("NFD", text)
-        output = []
-        for char in text:
-            cat = unicodedata.category(char)
-            if cat == "Mn":
-                continue
-            output.append(char)
-        return "".join(output)
+        return text.translate(_accent_map)
 
     def _run_split_on_punc(self, text):
         """Splits punctuation on a piece of text."""
-        chars = list(text)
-        i = 0
-        start_new_word = True
+        start = 0
         output = []
-        while i < len(chars):
-            char = chars[i]
-            if _is_punctuation(char):
-                output.append([char])
-                start_new_word = True
-            else:
-                if start_new_word:
-                    output.append([])
-                start_new_word = False
-                output[-1].append(char)
-            i += 1
+        for i, char in enumerate(text):
+            if _punctuation_map[char]:
+                if start < i:
+                    output.append(text[start:i])
+                output.append(char)
+                start = i + 1
+        if start < len(text):
+            output.append(text[start:])
 
-        return ["".join(x) for x in output]
+        return output
 
     def _tokenize_chinese_chars(self, text):
         """Adds whitespace around any CJK character."""
@@ -243,17 +347,7 @@ class BasicTokenizer(object):
         # as is Japanese Hiragana and Katakana. Those alphabets are used to write
         # space-separated words, so they are not treated specially and handled
         # like the all of the other languages.
-        if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
-            (cp >= 0x3400 and cp <= 0x4DBF) or  #
-            (cp >= 0x20000 and cp <= 0x2A6DF) or  #
-            (cp >= 0x2A700 and cp <= 0x2B73F) or  #
-            (cp >= 0x2B740 and cp <= 0x2B81F) or  #
-            (cp >= 0x2B820 and cp <= 0x2CEAF) or
-            (cp >= 0xF900 and cp <= 0xFAFF) or  #
-            (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
-            return True
-
-        return False
+        return _is_chinese_char(cp)
 
     def _clean_text(self, text):
         """Performs invalid character removal and whitespace cleanup on text."""
@@ -272,10 +366,67 @@ class BasicTokenizer(object):
 class WordpieceTokenizer(object):
     """Runs WordPiece tokenziation."""
 
-    def __init__(self, vocab, unk_token="[UNK]", max_input_chars_per_word=100):
+    def __init__(self,
+                 vocab,
+                 unk_token="[UNK]",
+                 max_input_chars_per_word=100,
+                 cache_size=0):
         self.vocab = vocab
         self.unk_token = unk_token
         self.max_input_chars_per_word = max_input_chars_per_word
+        self.cache = LRUCache(cache_size)
+
+        # A prefix trie of the vocab, stored as the set of the prefixes of its
+        # pieces: the pieces starting a word are matched against the tokens
+        # as they are, the following ones against the tokens without "##".
+        self.prefixes = set()
+        self.suffixes = set()
+        self.suffix_pieces = {}
+        for piece in vocab:
+            for end in range(1, len(piece) + 1):
+                self.prefixes.add(piece[:end])
+            if piece.startswith("##") and len(piece) > 2:
+                suffix = piece[2:]
+                self.suffix_pieces[suffix] = piece
+                for end in range(1, len(suffix) + 1):
+                    self.suffixes.add(suffix[:end])
+
+    def tokenize_token(self, token):
+        """Word pieces of a single token, without whitespace."""
+        sub_tokens = self.cache.get(token)
+        if sub_tokens is None:
+            sub_tokens = self._match(token)
+            self.cache.put(token, sub_tokens)
+        return sub_tokens
+
+    def _match(self, token):
+        """Greedy longest-match-first of the pieces of a token, by walking the
+        prefix trie instead of probing the vocab with every shorter piece."""
+        if len(token) > self.max_input_chars_per_word:
+            return [self.unk_token]
+
+        start = 0
+        sub_tokens = []
+        while start < len(token):
+            if start == 0:
+                prefixes, pieces = self.prefixes, self.vocab
+            else:
+                prefixes, pieces = self.suffixes, self.suffix_pieces
+            match_end = None
+            end = start + 1
+            while end <= len(token):
+                substr = token[start:end]
+                if substr not in prefixes:
+                    break
+                if substr in pieces:
+                    match_end = end
+                end += 1
+            if match_end is None:
+                return [self.unk_token]
+            substr = token[start:match_end]
+            sub_tokens.append(substr if start == 0 else pieces[substr])
+            start = match_end
+        return sub_tokens
 
     def tokenize(self, text):
         """Tokenizes a piece of text into its word pieces.
@@ -299,35 +450,7 @@ class WordpieceTokenizer(object):
 
         output_tokens = []
         for token in whitespace_tokenize(text):
-            chars = list(token)
-            if len(chars) > self.max_input_chars_per_word:
-                output_tokens.append(self.unk_token)
-                continue
-
-            is_bad = False
-            start = 0
-            sub_tokens = []
-            while start < len(chars):
-                end = len(chars)
-                cur_substr = None
-                while start < end:
-                    substr = "".join(chars[start:end])
-                    if start > 0:
-                        substr = "##" + substr
-                    if substr in self.vocab:
-                        cur_substr = substr
-                        break
-                    end -= 1
-                if cur_substr is None:
-                    is_bad = True
-                    break
-                sub_tokens.append(cur_substr)
-                start = end
-
-            if is_bad:
-                output_tokens.append(self.unk_token)
-            else:
-                output_tokens.extend(sub_tokens)
+            output_tokens.extend(self.tokenize_token(token))
         return output_tokens
 
 
@@ -355,6 +478,21 @@ def _is_control(char):
     return False
 
 
+def _is_chinese_char(cp):
+    """Checks whether CP is the codepoint of a CJK character."""
+    if ((cp >= 0x4E00 and cp <= 0x9FFF) or  #
+        (cp >= 0x3400 and cp <= 0x4DBF) or  #
+        (cp >= 0x20000 and cp <= 0x2A6DF) or  #
+        (cp >= 0x2A700 and cp <= 0x2B73F) or  #
+        (cp >= 0x2B740 and cp <= 0x2B81F) or  #
+        (cp >= 0x2B820 and cp <= 0x2CEAF) or
+        (cp >= 0xF900 and cp <= 0xFAFF) or  #
+        (cp >= 0x2F800 and cp <= 0x2FA1F)):  #
+        return True
+
+    return False
+
+
 def _is_punctuation(char):
     """Checks whether `chars` is a punctuation character."""
     cp = ord(char)
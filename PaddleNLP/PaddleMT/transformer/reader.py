@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import array
+import collections
 import glob
+import json
+import multiprocessing
 import six
 import os
 import tarfile
@@ -150,6 +154,69 @@ def prepare_infer_input(insts, src_pad_idx, bos_idx, n_head, place):
     return data_inputs
 
 
+def pad_flat_batch_data(src_ids, trg_ids, indices, src_pad_idx, trg_pad_idx):
+    """
+    Pad the sequences indices of SequenceIds all at once, returns the
+    inputs of prepare_train_input except that the attention biases are
+    [batch_size, max_len] masks, which are expanded by expand_attn_bias.
+    """
+    src_word, src_mask = src_ids.pad(indices, src_pad_idx)
+    src_pos = np.where(src_mask, np.arange(src_word.shape[1]), 0)
+    src_bias = np.where(src_mask, 0., -1e9).astype("float32")
+
+    # target input is trg[:-1] and label is trg[1:]
+    trg_word, trg_mask = trg_ids.pad(indices, trg_pad_idx, end=1)
+    trg_pos = np.where(trg_mask, np.arange(trg_word.shape[1]), 0)
+
+    lbl_word, lbl_mask = trg_ids.pad(indices, trg_pad_idx, begin=1)
+    lbl_word = lbl_word.reshape(-1, 1)
+    lbl_weight = lbl_mask.astype("float32").reshape(-1, 1)
+    return [src_word, src_pos, src_bias, trg_word, trg_pos, lbl_word,
+            lbl_weight]
+
+
+def expand_attn_bias(padded_inputs, n_head):
+    """
+    Expand the outputs of pad_flat_batch_data to the inputs of
+    prepare_train_input. The expanded biases are n_head * max_len times as
+    large as the masks, so this is done by the consumer of the batches.
+    """
+    src_word, src_pos, src_bias, trg_word, trg_pos, lbl_word, lbl_weight = \
+        padded_inputs
+    src_max_len = src_word.shape[1]
+    trg_max_len = trg_word.shape[1]
+    src_slf_attn_bias = np.tile(
+        src_bias.reshape([-1, 1, 1, src_max_len]),
+        [1, n_head, src_max_len, 1])
+    # This is used to avoid attention on paddings and subsequent words.
+    trg_bias = np.triu(np.ones((trg_max_len, trg_max_len)), 1) * [-1e9]
+    trg_slf_attn_bias = np.tile(
+        trg_bias.astype("float32").reshape([1, 1, trg_max_len, trg_max_len]),
+        [src_word.shape[0], n_head, 1, 1])
+    trg_src_attn_bias = np.tile(
+        src_bias.reshape([-1, 1, 1, src_max_len]),
+        [1, n_head, trg_max_len, 1])
+    return [
+        src_word, src_pos, src_slf_attn_bias, trg_word, trg_pos,
+        trg_slf_attn_bias, trg_src_attn_bias, lbl_word, lbl_weight
+    ]
+
+
+# the SequenceIds and padding indices of the worker processes
+_worker_args = None
+
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+
+def _pad_in_worker(indices):
+    src_ids, trg_ids, src_pad_idx, trg_pad_idx = _worker_args
+    return pad_flat_batch_data(src_ids, trg_ids, indices, src_pad_idx,
+                               trg_pad_idx)
+
+
 class SortType(object):
     GLOBAL = 'global'
     POOL = 'pool'
@@ -183,60 +250,36 @@ class ComposedConverter(object):
         ]
 
 
-class SentenceBatchCreator(object):
-    def __init__(self, batch_size):
-        self.batch = []
-        self._batch_size = batch_size
-
-    def append(self, info):
-        self.batch.append(info)
-        if len(self.batch) == self._batch_size:
-            tmp = self.batch
-            self.batch = []
-            return tmp
-
-
-class TokenBatchCreator(object):
-    def __init__(self, batch_size):
-        self.batch = []
-        self.max_len = -1
-        self._batch_size = batch_size
-
-    def append(self, info):
-        cur_len = info.max_len
-        max_len = max(self.max_len, cur_len)
-        if max_len * (len(self.batch) + 1) > self._batch_size:
-            result = self.batch
-            self.batch = [info]
-            self.max_len = cur_len
-            return result
-        else:
-            self.max_len = max_len
-            self.batch.append(info)
-
-
-class SampleInfo(object):
-    def __init__(self, i, max_len, min_len):
-        self.i = i
-        self.min_len = min_len
-        self.max_len = max_len
+class SequenceIds(object):
+    """
+    The token ids of many sequences in a flat int32 array, the ids of
+    sequence i are ids[offsets[i]:offsets[i + 1]].
+    """
 
+    def __init__(self, ids, offsets):
+        self.ids = ids
+        self.offsets = offsets
+        self.lens = np.diff(offsets)
 
-class MinMaxFilter(object):
-    def __init__(self, max_len, min_len, underlying_creator):
-        self._min_len = min_len
-        self._max_len = max_len
-        self._creator = underlying_creator
+    def __len__(self):
+        return len(self.lens)
 
-    def append(self, info):
-        if info.max_len > self._max_len or info.min_len < self._min_len:
-            return
-        else:
-            return self._creator.append(info)
+    def __getitem__(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]].tolist()
 
-    @property
-    def batch(self):
-        return self._creator.batch
+    def pad(self, indices, pad_idx, begin=0, end=0):
+        """
+        The int64 ids of the sequences indices without the first begin and
+        the last end ids, padded to [len(indices), max_len] by pad_idx, and
+        the mask of the non padding ids.
+        """
+        starts = self.offsets[indices] + begin
+        lens = self.lens[indices] - begin - end
+        pos = np.arange(lens.max())
+        mask = pos < lens[:, None]
+        data = np.full(mask.shape, pad_idx, dtype="int64")
+        data[mask] = self.ids[(starts[:, None] + pos)[mask]]
+        return data, mask
 
 
 class DataProcessor(object):
@@ -321,6 +364,17 @@ class DataProcessor(object):
     :type only_src: bool
     :param seed: The seed for random.
     :type seed: int
+    :param num_workers: The number of processes padding the training batches
+        in background, 0 to pad them in the reading thread. The attention
+        biases are expanded from the padding masks in the reading thread.
+    :type num_workers: int
+    :param prefetch_size: The maximum number of training batches padded
+        ahead by the workers.
+    :type prefetch_size: int
+    :param cache_path: The npz file to cache the token ids of the data
+        files, the token ids are loaded from it if it exists and was built
+        from the same fpattern and vocabularies.
+    :type cache_path: basestring
     """
 
     def __init__(self,
@@ -345,7 +399,10 @@ class DataProcessor(object):
                  end_mark="<e>",
                  unk_mark="<unk>",
                  only_src=False,
-                 seed=0):
+                 seed=0,
+                 num_workers=0,
+                 prefetch_size=16,
+                 cache_path=None):
         # convert str to bytes, and use byte data
         field_delimiter = field_delimiter.encode("utf8")
         token_delimiter = token_delimiter.encode("utf8")
@@ -371,7 +428,20 @@ class DataProcessor(object):
         self._max_length = max_length
         self._field_delimiter = field_delimiter
         self._token_delimiter = token_delimiter
-        self.load_src_trg_ids(fpattern, tar_fname)
+        self._num_workers = num_workers
+        self._prefetch_size = prefetch_size
+        self._cache_meta = json.dumps([
+            fpattern, tar_fname, src_vocab_fpath, trg_vocab_fpath, only_src,
+            field_delimiter.decode("utf8"), token_delimiter.decode("utf8"),
+            start_mark.decode("utf8"), end_mark.decode("utf8"),
+            unk_mark.decode("utf8")
+        ])
+        if cache_path is None or not os.path.exists(
+                cache_path) or not self.load_cache(cache_path):
+            self.load_src_trg_ids(fpattern, tar_fname)
+            if cache_path is not None:
+                self.save_cache(cache_path)
+        self._init_sample_order()
         self._random = np.random
         self._random.seed(seed)
 
@@ -397,18 +467,54 @@ class DataProcessor(object):
 
         converters = ComposedConverter(converters)
 
-        self._src_seq_ids = []
-        self._trg_seq_ids = None if self._only_src else []
-        self._sample_infos = []
-
-        for i, line in enumerate(self._load_lines(fpattern, tar_fname)):
+        src_ids, src_offsets = array.array("i"), [0]
+        trg_ids, trg_offsets = array.array("i"), [0]
+        for line in self._load_lines(fpattern, tar_fname):
             src_trg_ids = converters(line)
-            self._src_seq_ids.append(src_trg_ids[0])
-            lens = [len(src_trg_ids[0])]
+            src_ids.extend(src_trg_ids[0])
+            src_offsets.append(len(src_ids))
             if not self._only_src:
-                self._trg_seq_ids.append(src_trg_ids[1])
-                lens.append(len(src_trg_ids[1]))
-            self._sample_infos.append(SampleInfo(i, max(lens), min(lens)))
+                trg_ids.extend(src_trg_ids[1])
+                trg_offsets.append(len(trg_ids))
+
+        self._src_seq_ids = SequenceIds(
+            np.array(src_ids, dtype="int32"),
+            np.array(src_offsets, dtype="int64"))
+        self._trg_seq_ids = None if self._only_src else SequenceIds(
+            np.array(trg_ids, dtype="int32"),
+            np.array(trg_offsets, dtype="int64"))
+
+    def save_cache(self, cache_path):
+        arrays = {
+            "meta": np.array(self._cache_meta),
+            "src_ids": self._src_seq_ids.ids,
+            "src_offsets": self._src_seq_ids.offsets
+        }
+        if not self._only_src:
+            arrays["trg_ids"] = self._trg_seq_ids.ids
+            arrays["trg_offsets"] = self._trg_seq_ids.offsets
+        # np.savez appends .npz to names without it
+        with open(cache_path, "wb") as f:
+            np.savez(f, **arrays)
+
+    def load_cache(self, cache_path):
+        cache = np.load(cache_path)
+        if str(cache["meta"]) != self._cache_meta:
+            return False
+        self._src_seq_ids = SequenceIds(cache["src_ids"],
+                                        cache["src_offsets"])
+        self._trg_seq_ids = None if self._only_src else SequenceIds(
+            cache["trg_ids"], cache["trg_offsets"])
+        return True
+
+    def _init_sample_order(self):
+        lens = [self._src_seq_ids.lens]
+        if not self._only_src:
+            lens.append(self._trg_seq_ids.lens)
+        self._max_lens = np.max(lens, axis=0)
+        self._min_lens = np.min(lens, axis=0)
+        # sample order kept across epochs, shuffled and pool sorted in place
+        self._sample_order = np.arange(len(self._src_seq_ids))
 
     def _load_lines(self, fpattern, tar_fname):
         fpaths = glob.glob(fpattern)
@@ -447,50 +553,61 @@ class DataProcessor(object):
                     word_dict[line.strip(b"\n")] = idx
         return word_dict
 
-    def batch_generator(self, batch_size, use_token_batch):
-        def __impl__():
-            # global sort or global shuffle
-            if self._sort_type == SortType.GLOBAL:
-                infos = sorted(self._sample_infos, key=lambda x: x.max_len)
-            else:
-                if self._shuffle:
-                    infos = self._sample_infos
-                    self._random.shuffle(infos)
+    def batch_plans(self, batch_size, use_token_batch):
+        """
+        The sample indices of the batches of an epoch.
+        """
+        # global sort or global shuffle
+        if self._sort_type == SortType.GLOBAL:
+            order = np.argsort(self._max_lens, kind="mergesort")
+        else:
+            order = self._sample_order
+            if self._shuffle:
+                self._random.shuffle(order)
+
+            if self._sort_type == SortType.POOL:
+                reverse = True
+                for i in range(0, len(order), self._pool_size):
+                    # to avoid placing short next to long sentences
+                    reverse = not reverse
+                    pool = order[i:i + self._pool_size]
+                    lens = self._max_lens[pool]
+                    # stable in both directions, as sorted(reverse=True)
+                    order[i:i + self._pool_size] = pool[np.argsort(
+                        -lens if reverse else lens, kind="mergesort")]
+
+        lens = self._max_lens[order]
+        order = order[(lens <= self._max_length) &
+                      (self._min_lens[order] >= self._min_length)]
+
+        # concat batch
+        batches = []
+        if use_token_batch:
+            start, max_len = 0, -1
+            for i, cur_len in enumerate(self._max_lens[order].tolist()):
+                if max(max_len, cur_len) * (i - start + 1) > batch_size:
+                    batches.append(order[start:i])
+                    start, max_len = i, cur_len
                 else:
-                    infos = self._sample_infos
-
-                if self._sort_type == SortType.POOL:
-                    reverse = True
-                    for i in range(0, len(infos), self._pool_size):
-                        # to avoid placing short next to long sentences
-                        reverse = not reverse
-                        infos[i:i + self._pool_size] = sorted(
-                            infos[i:i + self._pool_size],
-                            key=lambda x: x.max_len,
-                            reverse=reverse)
-
-            # concat batch
-            batches = []
-            batch_creator = TokenBatchCreator(
-                batch_size) if use_token_batch else SentenceBatchCreator(
-                    batch_size)
-            batch_creator = MinMaxFilter(self._max_length, self._min_length,
-                                         batch_creator)
-
-            for info in infos:
-                batch = batch_creator.append(info)
-                if batch is not None:
-                    batches.append(batch)
-
-            if not self._clip_last_batch and len(batch_creator.batch) != 0:
-                batches.append(batch_creator.batch)
-
-            if self._shuffle_batch:
-                self._random.shuffle(batches)
-
-            for batch in batches:
-                batch_ids = [info.i for info in batch]
+                    max_len = max(max_len, cur_len)
+            last_batch = order[start:]
+        else:
+            num = len(order) // batch_size * batch_size
+            batches = [
+                order[i:i + batch_size] for i in range(0, num, batch_size)
+            ]
+            last_batch = order[num:]
+
+        if not self._clip_last_batch and len(last_batch) != 0:
+            batches.append(last_batch)
 
+        if self._shuffle_batch:
+            self._random.shuffle(batches)
+        return batches
+
+    def batch_generator(self, batch_size, use_token_batch):
+        def __impl__():
+            for batch_ids in self.batch_plans(batch_size, use_token_batch):
                 if self._only_src:
                     yield [[self._src_seq_ids[idx]] for idx in batch_ids]
                 else:
@@ -540,19 +657,41 @@ class DataProcessor(object):
         src_pad_idx = trg_pad_idx = self._eos_idx
         bos_idx = self._bos_idx
         n_head = self._n_head
-        data_reader = self.batch_generator(
-            self._batch_size *
-            (1 if self._use_token_batch else self._device_count),
-            self._use_token_batch)
+        batch_size = self._batch_size * (1 if self._use_token_batch else
+                                         self._device_count)
+        data_reader = self.batch_generator(batch_size, self._use_token_batch)
+        plan_reader = lambda: self.batch_plans(batch_size, self._use_token_batch)
         if not self._use_token_batch:
             # to make data on each device have similar token number
             data_reader = self.split(data_reader, self._device_count)
+            plan_reader = self.split(plan_reader, self._device_count)
 
         def __for_train__():
-            for data in data_reader():
-                data_inputs = prepare_train_input(data, src_pad_idx,
-                                                  trg_pad_idx, n_head)
-                yield data_inputs
+            if self._num_workers <= 0:
+                for batch_ids in plan_reader():
+                    yield expand_attn_bias(
+                        pad_flat_batch_data(self._src_seq_ids,
+                                            self._trg_seq_ids, batch_ids,
+                                            src_pad_idx, trg_pad_idx), n_head)
+                return
+
+            # the workers are forked after the token ids are loaded, and at
+            # most prefetch_size batches are padded ahead
+            pool = multiprocessing.Pool(
+                self._num_workers, _init_worker,
+                (self._src_seq_ids, self._trg_seq_ids, src_pad_idx,
+                 trg_pad_idx))
+            try:
+                pending = collections.deque()
+                for batch_ids in plan_reader():
+                    pending.append(
+                        pool.apply_async(_pad_in_worker, (batch_ids, )))
+                    if len(pending) >= self._prefetch_size:
+                        yield expand_attn_bias(pending.popleft().get(), n_head)
+                while pending:
+                    yield expand_attn_bias(pending.popleft().get(), n_head)
+            finally:
+                pool.terminate()
 
         def __for_predict__():
             for data in data_reader():
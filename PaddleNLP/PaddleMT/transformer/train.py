@@ -152,7 +152,10 @@ def do_train(args):
         end_mark=args.special_token[1],
         unk_mark=args.special_token[2],
         max_length=args.max_length,
-        n_head=args.n_head)
+        n_head=args.n_head,
+        num_workers=args.num_workers,
+        prefetch_size=args.prefetch_size,
+        cache_path=args.training_cache or None)
     batch_generator = processor.data_generator(phase="train")
     if num_trainers > 1:  # for multi-process gpu training
         batch_generator = fluid.contrib.reader.distributed_batch_reader(
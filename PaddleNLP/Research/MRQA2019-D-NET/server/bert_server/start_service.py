@@ -26,11 +26,19 @@ else:
     _, model_dir, port, mode = sys.argv
 
 max_batch_size = 5
+# batches of concurrent requests are merged up to merge_batch_size examples,
+# waiting at most merge_latency seconds, only in parallel mode
+merge_batch_size = 32
+merge_latency = 0.005
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 model = model_wrapper.BertModelWrapper(model_dir=model_dir)
-server = mrc_service.MRQAService('MRQA service', app.logger)
+scheduler = None
+if mode == 'parallel':
+    scheduler = mrc_service.MicroBatchScheduler(
+        model, merge_batch_size, merge_latency, app.logger)
+server = mrc_service.MRQAService('MRQA service', app.logger, scheduler=scheduler)
 
 @app.route('/', methods=['POST'])
 def mrqa_service():
@@ -38,6 +46,14 @@ def mrqa_service():
     return server(model, process_mode=mode, max_batch_size=max_batch_size)
 
 
+@app.route('/stats', methods=['GET'])
+def mrqa_stats():
+    """Histograms of the queue depth and the merged batch size"""
+    stats = scheduler.stats() if scheduler is not None else {}
+    return Response(json.dumps(stats), mimetype='application/json')
+
+
 if __name__ == '__main__':
-    app.run(port=port, debug=False, threaded=False, processes=1)
+    # the model is only called from the scheduler thread in parallel mode
+    app.run(port=port, debug=False, threaded=scheduler is not None, processes=1)
 
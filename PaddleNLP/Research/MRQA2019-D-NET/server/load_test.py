@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Load test of the main server with local stub model servers, reports the
+p50/p99 latency and throughput.
+
+    python load_test.py --requests 500 --concurrency 16 --delays 0.05 0.08 0.1
+    python load_test.py --delays 0.05 0.08 2.0 --timeout 0.5 --allow_partial
+"""
+import argparse
+import json
+import threading
+import time
+import numpy as np
+import requests
+from flask import Flask
+from flask import Response
+from flask import request
+from multiprocessing.dummy import Pool as ThreadPool
+from werkzeug.serving import make_server
+
+import main_server
+
+
+def make_stub_app(name, delay):
+    """A model server answering every question after 'delay' seconds"""
+    app = Flask(name)
+
+    @app.route('/', methods=['POST'])
+    def stub_service():
+        input_json = request.get_json(silent=True)
+        time.sleep(delay)
+        results = {}
+        for qa in input_json['qas']:
+            results[qa['qid']] = [
+                {'text': 'answer of {}'.format(name), 'probability': 0.6},
+                {'text': 'common answer', 'probability': 0.4}]
+        return Response(json.dumps({'results': results}), mimetype='application/json')
+
+    return app
+
+
+def serve(app, port):
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(args):
+    backends = []
+    for i, delay in enumerate(args.delays):
+        name = 'stub_{}'.format(i)
+        port = args.port + 1 + i
+        serve(make_stub_app(name, delay), port)
+        backends.append((name, 'http://127.0.0.1:{}'.format(port), args.timeout))
+    main_server.setup(backends, args.allow_partial, args.concurrency)
+    serve(main_server.app, args.port)
+    url = 'http://127.0.0.1:{}'.format(args.port)
+    local = threading.local()
+
+    def _query(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        example = {'context': 'stub context',
+                   'qas': [{'qid': 'q{}'.format(i), 'question': 'stub question'}]}
+        start = time.time()
+        pred = session.post(url, json=example).json()
+        return time.time() - start, 'error' not in pred
+
+    # warm up connections of all threads
+    pool = ThreadPool(args.concurrency)
+    pool.map(_query, range(args.concurrency))
+    start = time.time()
+    results = pool.map(_query, range(args.requests))
+    cost = time.time() - start
+    pool.close()
+    main_server.pool.close()
+    latencies = np.array([r[0] for r in results]) * 1000
+    errors = sum(1 for r in results if not r[1])
+    print('backend delays: {}, timeout: {}, allow_partial: {}'.format(
+        args.delays, args.timeout, args.allow_partial))
+    print('requests: {}, concurrency: {}, errors: {}'.format(
+        args.requests, args.concurrency, errors))
+    print('latency p50: {:.1f} ms, p99: {:.1f} ms, throughput: {:.1f} req/s'.format(
+        np.percentile(latencies, 50), np.percentile(latencies, 99), args.requests / cost))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser('load test of main server')
+    parser.add_argument('--requests', type=int, default=500, help="Number of requests")
+    parser.add_argument('--concurrency', type=int, default=16, help="Number of concurrent clients")
+    parser.add_argument('--delays', type=float, nargs='+', default=[0.05, 0.08, 0.1],
+                        help="Latency in seconds of each stub model server")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Timeout in seconds of each model server")
+    parser.add_argument('--allow_partial', action='store_true', default=False,
+                        help="Answer with the ensemble of the models that responded in time")
+    parser.add_argument('--port', type=int, default=6121, help="Port of the main server, stubs use the next ports")
+    main(parser.parse_args())
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 import json
 import sys
+import time
+import threading
 import logging
 logging.basicConfig(
     level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -12,6 +14,7 @@ from flask import Response
 from flask import request
 import numpy as np
 import argparse
+from multiprocessing import TimeoutError
 from multiprocessing.dummy import Pool as ThreadPool
 
 app = Flask(__name__)
@@ -40,25 +43,78 @@ def ensemble_example(answers, n_models=None):
     return ensemble_nbest_predictions
 
 
+# model servers as a list of (name, url, timeout in seconds)
+backends = []
+# answer with the ensemble of the models that responded in time
+allow_partial = False
+# threads shared by all requests to query the model servers
+pool = None
+_local = threading.local()
+
+
+def setup(model_backends, partial=False, max_concurrency=8):
+    """Set the model servers and create the shared thread pool"""
+    global backends, allow_partial, pool
+    backends = list(model_backends)
+    allow_partial = partial
+    if pool is not None:
+        pool.close()
+    pool = ThreadPool(len(backends) * max_concurrency)
+
+
+def _session():
+    """One keep-alive session per pool thread, sessions are not thread safe"""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+
+def _call_model(args):
+    name, url, timeout, input_json = args
+    try:
+        response = _session().post(url, json=input_json, timeout=timeout)
+        response.raise_for_status()
+        return name, response.json()['results']
+    except Exception as e:
+        logger.warning('model server {} failed - {}'.format(name, e))
+        return name, None
+
+
+def query_models(input_json):
+    """Query all model servers concurrently, and return the nbest predictions
+    of the models that responded before their timeouts"""
+    tasks = [(name, url, timeout, input_json) for name, url, timeout in backends]
+    deadline = time.time() + max(timeout for _, _, timeout in backends)
+    responses = {}
+    results = pool.imap_unordered(_call_model, tasks)
+    for _ in tasks:
+        try:
+            name, nbest = results.next(timeout=max(deadline - time.time(), 0))
+        except TimeoutError:
+            logger.warning('model servers timed out')
+            break
+        if nbest is not None:
+            responses[name] = nbest
+    # the ensemble depends on the order of the models, keep the configured
+    # one instead of the order the responses arrived in
+    return [responses[name] for name, _, _ in backends if name in responses]
+
+
 @app.route('/', methods=['POST'])
 def mrqa_main():
     """Description"""
     # parse input data
     pred = {}
-    def _call_model(url, input_json):
-        nbest = requests.post(url, json=input_json)
-        return nbest
     try:
         input_json = request.get_json(silent=True)
-        n_models = len(urls)
-        pool = ThreadPool(n_models)
-        results = []
-        for url in urls:
-            result = pool.apply_async(_call_model, (url, input_json))
-            results.append(result.get())
-        pool.close()
-        pool.join()
-        nbests = [nbest.json()['results'] for nbest in results]
+        nbests = query_models(input_json)
+        if len(nbests) == 0 or \
+                (len(nbests) < len(backends) and not allow_partial):
+            raise RuntimeError('{} of {} models responded'.format(
+                len(nbests), len(backends)))
+        n_models = len(nbests)
         qids = list(nbests[0].keys())
         for qid in qids:
             ensemble_nbest = ensemble_example([nbest[qid] for nbest in nbests], n_models=n_models)
@@ -78,17 +134,32 @@ if __name__ == '__main__':
     parser.add_argument('--ernie', action='store_true', default=False, help="Include ERNIE")
     parser.add_argument('--xlnet', action='store_true', default=False, help="Include XL-NET")
     parser.add_argument('--bert', action='store_true', default=False, help="Include BERT")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Timeout in seconds of each model server")
+    parser.add_argument('--ernie_timeout', type=float, default=None, help="Timeout of ERNIE, default to --timeout")
+    parser.add_argument('--xlnet_timeout', type=float, default=None, help="Timeout of XL-NET, default to --timeout")
+    parser.add_argument('--bert_timeout', type=float, default=None, help="Timeout of BERT, default to --timeout")
+    parser.add_argument('--allow_partial', action='store_true', default=False,
+                        help="Answer with the ensemble of the models that responded in time")
+    parser.add_argument('--max_concurrency', type=int, default=8,
+                        help="Max number of requests handled concurrently")
     args = parser.parse_args()
-    urls = []
+    for name in ['timeout', 'ernie_timeout', 'xlnet_timeout', 'bert_timeout']:
+        value = getattr(args, name)
+        if value is not None and value <= 0:
+            parser.error('--{} must be > 0, got {}'.format(name, value))
+    model_backends = []
     if args.ernie:
         print('Include ERNIE model')
-        urls.append(url_1)
+        timeout = args.timeout if args.ernie_timeout is None else args.ernie_timeout
+        model_backends.append(('ernie', url_1, timeout))
     if args.xlnet:
         print('Include XL-NET model')
-        urls.append(url_2)
+        timeout = args.timeout if args.xlnet_timeout is None else args.xlnet_timeout
+        model_backends.append(('xlnet', url_2, timeout))
     if args.bert:
         print('Include BERT model')
-        urls.append(url_3)
-    assert len(urls) > 0, "At lease one model is required"
-    app.run(host='127.0.0.1', port=5121, debug=False, threaded=False, processes=1)
-
+        timeout = args.timeout if args.bert_timeout is None else args.bert_timeout
+        model_backends.append(('bert', url_3, timeout))
+    assert len(model_backends) > 0, "At lease one model is required"
+    setup(model_backends, args.allow_partial, args.max_concurrency)
+    app.run(host='127.0.0.1', port=5121, debug=False, threaded=True, processes=1)
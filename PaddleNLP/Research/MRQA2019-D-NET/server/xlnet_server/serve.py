@@ -23,10 +23,19 @@ if len(sys.argv) == 3:
 else:
     _, model_dir, port, mode = sys.argv
 
+# batches of concurrent requests are merged up to merge_batch_size examples,
+# waiting at most merge_latency seconds, only in parallel mode
+merge_batch_size = 32
+merge_latency = 0.005
+
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
 bert_model = bert_wrapper.BertModelWrapper(model_dir=model_dir)
-server = server_utils.BasicMRCService('Short answer MRC service', app.logger)
+scheduler = None
+if mode == 'parallel':
+    scheduler = server_utils.MicroBatchScheduler(
+        bert_model, merge_batch_size, merge_latency, app.logger)
+server = server_utils.BasicMRCService('Short answer MRC service', app.logger, scheduler=scheduler)
 
 @app.route('/', methods=['POST'])
 def mrqa_service():
@@ -36,6 +45,14 @@ def mrqa_service():
     # return server(model)
 
 
+@app.route('/stats', methods=['GET'])
+def mrqa_stats():
+    """Histograms of the queue depth and the merged batch size"""
+    stats = scheduler.stats() if scheduler is not None else {}
+    return Response(json.dumps(stats), mimetype='application/json')
+
+
 if __name__ == '__main__':
-    app.run(port=port, debug=False, threaded=False, processes=1)
+    # the model is only called from the scheduler thread in parallel mode
+    app.run(port=port, debug=False, threaded=scheduler is not None, processes=1)
 
@@ -5,10 +5,16 @@ import json
 import sys
 import logging
 import time
+import threading
+import collections
 import numpy as np
 from flask import Response
 from flask import request
 from copy import deepcopy
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 verbose = False
 
@@ -48,11 +54,124 @@ def _split_input_json(input_json):
             rets.append(temp)
         return rets
             
+class _Task(object):
+    """A model batch of one request waiting for its results"""
+    def __init__(self, batch):
+        self.batch = batch
+        self.size = len(batch[0])
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatchScheduler(object):
+    """Merge the model batches of concurrent requests, and run them with
+    one 'call_mrc' of the model in a background thread.
+
+    The batches are collected until 'max_batch_size' examples are queued
+    or the first one has waited for 'max_latency' seconds. Batches are
+    only merged when all their arrays have the same shapes except for
+    the first dimension, which is true for the fixed length paddings.
+    """
+    def __init__(self, model, max_batch_size=32, max_latency=0.005, logger=None):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.logger = logger if logger is not None else logging.getLogger('flask')
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.queue_depth_hist = collections.Counter()
+        self.batch_size_hist = collections.Counter()
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def call_mrc(self, batches):
+        """Run the model batches of one request, and return the results
+        in the same format as 'model.call_mrc(b, return_list=True)'"""
+        tasks = [_Task(b) for b in batches]
+        for task in tasks:
+            self.queue.put(task)
+        mrc_results = []
+        for task in tasks:
+            task.done.wait()
+            if task.error is not None:
+                raise task.error
+            mrc_results.extend(task.results)
+        return mrc_results
+
+    def stats(self):
+        """Histograms of the queue depth and the size of the merged batches"""
+        with self.lock:
+            return {
+                'queue_depth': sorted(self.queue_depth_hist.items()),
+                'batch_size': sorted(self.batch_size_hist.items()),
+            }
+
+    def _collect(self, pending):
+        tasks = [pending if pending is not None else self.queue.get()]
+        size = tasks[0].size
+        deadline = time.time() + self.max_latency
+        while size < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                task = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if size + task.size > self.max_batch_size:
+                return tasks, task
+            tasks.append(task)
+            size += task.size
+        return tasks, None
+
+    def _run(self, tasks):
+        """Run tasks of the same shapes as one batch"""
+        try:
+            if len(tasks) == 1:
+                merged = tasks[0].batch
+            else:
+                merged = [np.concatenate([t.batch[i] for t in tasks])
+                          for i in range(len(tasks[0].batch))]
+            mrc_results = self.model.call_mrc(merged, return_list=True)
+            start = 0
+            for task in tasks:
+                task.results = mrc_results[start:start + task.size]
+                start += task.size
+        except Exception as e:
+            self.logger.exception(e)
+            for task in tasks:
+                task.error = e
+        for task in tasks:
+            task.done.set()
+
+    def _loop(self):
+        pending = None
+        while True:
+            tasks, pending = self._collect(pending)
+            groups = collections.OrderedDict()
+            for task in tasks:
+                shapes = tuple(np.shape(arr)[1:] for arr in task.batch)
+                groups.setdefault(shapes, []).append(task)
+            with self.lock:
+                self.queue_depth_hist[self.queue.qsize()] += 1
+                for group in groups.values():
+                    self.batch_size_hist[sum(t.size for t in group)] += 1
+            for group in groups.values():
+                self._run(group)
+
+
 class BasicMRCService(object):
     """Provide basic MRC service for flask"""
-    def __init__(self, name, logger=None, log_data=False):
-        """ """
+    def __init__(self, name, logger=None, log_data=False, scheduler=None):
+        """
+        Args:
+            scheduler: a MicroBatchScheduler merging the model batches of
+                concurrent requests in parallel mode, None for not merging
+        """
         self.name = name
+        self.scheduler = scheduler
         if logger is None:
             self.logger = logging.getLogger('flask')
         else:
@@ -67,13 +186,13 @@ class BasicMRCService(object):
         if timmer:
             start = time.time()
         """Call mrc model wrapper and handle expectations"""
-        self.input_json = request.get_json(silent=True)
+        input_json = request.get_json(silent=True)
         try:
             if timmer:
                 start_request_check = time.time()
 
-            request_status = _request_check(self.input_json)
-            jsons = _split_input_json(self.input_json)
+            request_status = _request_check(input_json)
+            jsons = _split_input_json(input_json)
 
             if timmer:
                 current_time = time.time()
@@ -81,11 +200,11 @@ class BasicMRCService(object):
             if self.log_data:
                 if self.logger is None:
                     logging.info(
-                        'Client input - {}'.format(json.dumps(self.input_json, ensure_ascii=False))
+                        'Client input - {}'.format(json.dumps(input_json, ensure_ascii=False))
                     )
                 else:
                     self.logger.info(
-                        'Client input - {}'.format(json.dumps(self.input_json, ensure_ascii=False))
+                        'Client input - {}'.format(json.dumps(input_json, ensure_ascii=False))
                     )
         except Exception as e:
             self.logger.error('server request checker error')
@@ -94,7 +213,7 @@ class BasicMRCService(object):
         if request_status != 'OK':
             return _abort(400, request_status)
 
-        self.results = {}
+        results = {}
         for single_sample in jsons:
         # call preprocessor
             try:
@@ -134,8 +253,11 @@ class BasicMRCService(object):
                     # only keep first max_batch_size features
                     # batches = batches[0]
 
-                    for b in batches:
-                        mrc_results.extend(model.call_mrc(b, return_list=True))
+                    if self.scheduler is not None:
+                        mrc_results.extend(self.scheduler.call_mrc(batches))
+                    else:
+                        for b in batches:
+                            mrc_results.extend(model.call_mrc(b, return_list=True))
                 else:
                     raise NotImplementedError()
                 # new_features = features[:max_batch_size]
@@ -156,13 +278,13 @@ class BasicMRCService(object):
             try:
                 if timmer:
                     start_post_precess = time.time()
-                results = model.postprocessor(example, features, mrc_results)
+                answers = model.postprocessor(example, features, mrc_results)
 
                 # only nbest results is POSTed back
-                self.results.update(results[1])
+                results.update(answers[1])
 
-                # self.results = results[1]
-                # # self.results = results[0]
+                # results = answers[1]
+                # # results = answers[0]
 
                 if timmer:
                     current_time = time.time()
@@ -173,14 +295,14 @@ class BasicMRCService(object):
                 return _abort(500, 'postprocessor error - {}'.format(e))
         
 
-        return self._response_constructor()
+        return self._response_constructor(results)
 
-    def _response_constructor(self):
+    def _response_constructor(self, results):
         """construct http response object"""
         try:
             response = {
-                # 'requestID': self.input_json['requestID'],
-                'results': self.results
+                # 'requestID': input_json['requestID'],
+                'results': results
             }
             if self.log_data:
                 self.logger.info(
@@ -1,4 +1,5 @@
 import sys
+import numpy as np
 import paddle.fluid.incubate.data_generator as dg
 try:
     import cPickle as pickle
@@ -9,6 +10,9 @@ import os
 
 
 class CriteoDataset(dg.MultiSlotDataGenerator):
+    # number of lines parsed at once by test() and generate_batch()
+    chunk_size_ = 1000
+
     def setup(self, feat_dict_name):
         self.cont_min_ = [0, -3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
         self.cont_max_ = [
@@ -22,6 +26,13 @@ class CriteoDataset(dg.MultiSlotDataGenerator):
         self.continuous_range_ = range(1, 14)
         self.categorical_range_ = range(14, 40)
         self.feat_dict_ = pickle.load(open(feat_dict_name, 'rb'))
+        # for the vectorized parsing of _process_lines, the categorical part
+        # of feat_dict_ is without '', which maps to 0
+        self.cont_ids_ = np.array(
+            [self.feat_dict_[idx] for idx in self.continuous_range_])
+        self.cat_dict_ = dict((k, v) for k, v in self.feat_dict_.items()
+                              if not isinstance(k, int) and k != '')
+        self.set_batch(self.chunk_size_)
 
     def _process_line(self, line):
         features = line.rstrip('\n').split('\t')
@@ -46,24 +57,75 @@ class CriteoDataset(dg.MultiSlotDataGenerator):
         label = [int(features[0])]
         return feat_idx, feat_value, label
 
+    def _process_lines(self, lines):
+        """
+        Vectorized _process_line of many lines, returns the lists of
+        feat_idx, feat_value and label of all lines.
+        """
+        num = len(lines)
+        fields = '\t'.join(line.rstrip('\n') for line in lines).split('\t')
+        width = len(fields) // num
+        # the dense columns are parsed at once, empty values as nan
+        dense = [
+            x or 'nan' for idx in self.continuous_range_
+            for x in fields[idx::width]
+        ]
+        dense_value = np.fromstring(
+            ' '.join(dense), dtype='float64', sep=' ').reshape([13, num]).T
+        present = ~np.isnan(dense_value)
+        dense_value = np.where(
+            present, (dense_value - self.cont_min_) / self.cont_diff_, 0.0)
+        dense_idx = np.where(present, self.cont_ids_, 0)
+        # feature ids start from 1, 0 means empty or out of vocabulary
+        get = self.cat_dict_.get
+        zeros = [0] * num
+        cat_idx = np.array([
+            list(map(get, fields[idx::width], zeros))
+            for idx in self.categorical_range_
+        ]).T
+        feat_idx = np.hstack([dense_idx, cat_idx]).tolist()
+        feat_value = np.hstack([dense_value, cat_idx != 0]).astype(
+            'float64').tolist()
+        label = np.array(
+            fields[0::width], dtype='int64').reshape([-1, 1]).tolist()
+        return feat_idx, feat_value, label
+
+    def _chunks(self, lines):
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == self.chunk_size_:
+                yield self._process_lines(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            yield self._process_lines(chunk)
+
     def test(self, filelist):
         def local_iter():
             for fname in filelist:
                 with open(fname.strip(), 'r') as fin:
-                    for line in fin:
-                        feat_idx, feat_value, label = self._process_line(line)
-                        yield [feat_idx, feat_value, label]
+                    for feat_idx, feat_value, label in self._chunks(fin):
+                        for sample in zip(feat_idx, feat_value, label):
+                            yield list(sample)
 
         return local_iter
 
     def generate_sample(self, line):
         def data_iter():
-            feat_idx, feat_value, label = self._process_line(line)
-            yield [('feat_idx', feat_idx), ('feat_value', feat_value), ('label',
-                                                                        label)]
+            # the lines are parsed by batches in generate_batch
+            yield line
 
         return data_iter
 
+    def generate_batch(self, samples):
+        def local_iter():
+            feat_idx, feat_value, label = self._process_lines(samples)
+            for sample in zip(feat_idx, feat_value, label):
+                yield [('feat_idx', sample[0]), ('feat_value', sample[1]),
+                       ('label', sample[2])]
+
+        return local_iter
+
 
 if __name__ == '__main__':
     criteo_dataset = CriteoDataset()
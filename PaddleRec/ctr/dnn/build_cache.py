@@ -0,0 +1,42 @@
+"""
+Convert the raw Criteo train.txt into a binary columnar cache, the cache
+directory can be used as --train_data_path and --test_data_path of train.py
+and --data_path of infer.py.
+
+    python build_cache.py --data_path data/raw/train.txt --cache_dir data/cache
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import reader
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build Criteo binary cache")
+    parser.add_argument(
+        '--data_path',
+        type=str,
+        default='./data/raw/train.txt',
+        help="The path of the raw dataset")
+    parser.add_argument(
+        '--cache_dir',
+        type=str,
+        default='./data/cache',
+        help="The directory of the cache to build")
+    parser.add_argument(
+        '--sparse_feature_dim',
+        type=int,
+        default=1000001,
+        help='sparse feature hashing space for index processing')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    start = time.time()
+    dataset = reader.CriteoDataset(args.sparse_feature_dim)
+    num = dataset.build_cache(args.data_path, args.cache_dir)
+    print("cached %d lines of %s to %s in %.1fs" %
+          (num, args.data_path, args.cache_dir, time.time() - start))
@@ -1,10 +1,48 @@
+import json
+import os
+
+import numpy as np
+
+# 64 bits FNV-1a, used to hash the categorical features so that the feature
+# ids are the same in every process, unlike the randomized built-in hash
+FNV_OFFSET = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+CACHE_META = 'meta.json'
+
+
+def stable_hash(values, prefixes):
+    """
+    FNV-1a hash of prefixes[j] + values[i, j] for a [N, M] array of byte
+    strings and M prefixes, vectorized over all the values.
+    """
+    values = np.ascontiguousarray(values)
+    if values.dtype.kind != 'S':
+        values = np.char.encode(values, 'utf-8')
+    num, width = values.shape[0], values.dtype.itemsize
+
+    hashes = np.empty(values.shape, dtype=np.uint64)
+    for j, prefix in enumerate(prefixes):
+        h = FNV_OFFSET
+        for b in bytearray(prefix.encode('utf-8')):
+            h = np.uint64((int(h) ^ b) * int(FNV_PRIME) % (1 << 64))
+        hashes[:, j] = h
+    if width > 0:
+        # byte strings are padded by zeros
+        data = values.view(np.uint8).reshape(num, -1, width)
+        for k in range(width):
+            byte = data[:, :, k]
+            hashes = np.where(byte != 0, (hashes ^ byte) * FNV_PRIME, hashes)
+    return hashes
+
+
 class Dataset:
     def __init__(self):
         pass
 
 
 class CriteoDataset(Dataset):
-    def __init__(self, sparse_feature_dim):
+    def __init__(self, sparse_feature_dim, chunk_size=10000):
         self.cont_min_ = [0, -3, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
         self.cont_max_ = [
             20, 600, 100, 50, 64000, 500, 100, 50, 500, 10, 10, 10, 50
@@ -17,40 +55,137 @@ class CriteoDataset(Dataset):
         self.train_idx_ = 41256555
         self.continuous_range_ = range(1, 14)
         self.categorical_range_ = range(14, 40)
+        # number of lines parsed at once
+        self.chunk_size_ = chunk_size
+
+    def parse_lines(self, lines):
+        """
+        Parse a list of lines to dense features in float32 [N, 13], hashed
+        sparse features in int64 [N, 26] and labels in int64 [N, 1].
+        """
+        fields = '\t'.join(line.rstrip('\n') for line in lines).split('\t')
+        try:
+            cols = np.array(fields, dtype=np.bytes_)
+        except UnicodeEncodeError:
+            cols = np.char.encode(np.array(fields), 'utf-8')
+        cols = cols.reshape([len(lines), -1])
+
+        dense = cols[:, 1:14]
+        empty = dense == b''
+        dense = np.where(empty, b'0', dense).astype(np.float64)
+        dense = (dense - np.array(self.cont_min_)) / np.array(self.cont_diff_)
+        dense[empty] = 0.0
+
+        prefixes = [str(idx) for idx in self.categorical_range_]
+        sparse = stable_hash(cols[:, 14:40], prefixes) % np.uint64(
+            self.hash_dim_)
+
+        label = cols[:, 0:1].astype(np.int64)
+        return dense.astype(np.float32), sparse.astype(np.int64), label
+
+    def _samples(self, dense, sparse, label):
+        for d, s, l in zip(dense.tolist(), sparse.tolist(), label.tolist()):
+            yield [d] + [[i] for i in s] + [l]
+
+    def _raw_reader(self, file, is_train, trainer_num, trainer_id):
+        with open(file, 'r') as f:
+            line_idx = 0
+            lines = []
+            for line in f:
+                line_idx += 1
+                if is_train and line_idx > self.train_idx_:
+                    break
+                elif not is_train and line_idx <= self.train_idx_:
+                    continue
+                if line_idx % trainer_num != trainer_id:
+                    continue
+                lines.append(line)
+                if len(lines) == self.chunk_size_:
+                    for sample in self._samples(*self.parse_lines(lines)):
+                        yield sample
+                    lines = []
+            if len(lines) > 0:
+                for sample in self._samples(*self.parse_lines(lines)):
+                    yield sample
+
+    def _cache_reader(self, cache_dir, is_train, trainer_num, trainer_id):
+        with open(os.path.join(cache_dir, CACHE_META)) as f:
+            meta = json.load(f)
+        assert meta['sparse_feature_dim'] == self.hash_dim_, \
+            'cache {} was built with sparse_feature_dim {}'.format(
+                cache_dir, meta['sparse_feature_dim'])
+        arrays = [
+            np.load(
+                os.path.join(cache_dir, name + '.npy'), mmap_mode='r')
+            for name in ['dense', 'sparse', 'label']
+        ]
+        # row i is the line i + 1 of the raw file
+        num = arrays[0].shape[0]
+        if is_train:
+            begin, end = 0, min(num, self.train_idx_)
+        else:
+            begin, end = min(num, self.train_idx_), num
+        begin += (trainer_id - begin - 1) % trainer_num
+        step = trainer_num * self.chunk_size_
+        for start in range(begin, end, step):
+            stop = min(start + step, end)
+            chunk = [arr[start:stop:trainer_num] for arr in arrays]
+            for sample in self._samples(*chunk):
+                yield sample
 
     def _reader_creator(self, file_list, is_train, trainer_num, trainer_id):
         def reader():
             for file in file_list:
-                with open(file, 'r') as f:
-                    line_idx = 0
-                    for line in f:
-                        line_idx += 1
-                        if is_train and line_idx > self.train_idx_:
-                            break
-                        elif not is_train and line_idx <= self.train_idx_:
-                            continue
-                        if line_idx % trainer_num != trainer_id:
-                            continue
-                        features = line.rstrip('\n').split('\t')
-                        dense_feature = []
-                        sparse_feature = []
-                        for idx in self.continuous_range_:
-                            if features[idx] == '':
-                                dense_feature.append(0.0)
-                            else:
-                                dense_feature.append((float(features[idx]) -
-                                                      self.cont_min_[idx - 1]) /
-                                                     self.cont_diff_[idx - 1])
-                        for idx in self.categorical_range_:
-                            sparse_feature.append([
-                                hash(str(idx) + features[idx]) % self.hash_dim_
-                            ])
-
-                        label = [int(features[0])]
-                        yield [dense_feature] + sparse_feature + [label]
+                if os.path.isdir(file):
+                    samples = self._cache_reader(file, is_train, trainer_num,
+                                                 trainer_id)
+                else:
+                    samples = self._raw_reader(file, is_train, trainer_num,
+                                               trainer_id)
+                for sample in samples:
+                    yield sample
 
         return reader
 
+    def build_cache(self, file, cache_dir):
+        """
+        Convert a raw Criteo file to a columnar cache directory of
+        dense.npy, sparse.npy and label.npy, which can be used instead of
+        the raw file in file_list.
+        """
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(file, 'r') as f:
+            num = sum(1 for _ in f)
+        shapes = {'dense': 13, 'sparse': 26, 'label': 1}
+        dtypes = {'dense': np.float32, 'sparse': np.int64, 'label': np.int64}
+        arrays = [
+            np.lib.format.open_memmap(
+                os.path.join(cache_dir, name + '.npy'),
+                mode='w+',
+                dtype=dtypes[name],
+                shape=(num, shapes[name]))
+            for name in ['dense', 'sparse', 'label']
+        ]
+        with open(file, 'r') as f:
+            start = 0
+            lines = []
+            for line in f:
+                lines.append(line)
+                if len(lines) == self.chunk_size_:
+                    for arr, chunk in zip(arrays, self.parse_lines(lines)):
+                        arr[start:start + len(lines)] = chunk
+                    start += len(lines)
+                    lines = []
+            if len(lines) > 0:
+                for arr, chunk in zip(arrays, self.parse_lines(lines)):
+                    arr[start:start + len(lines)] = chunk
+        for arr in arrays:
+            arr.flush()
+        with open(os.path.join(cache_dir, CACHE_META), 'w') as f:
+            json.dump({'sparse_feature_dim': self.hash_dim_, 'num': num}, f)
+        return num
+
     def train(self, file_list, trainer_num, trainer_id):
         return self._reader_creator(file_list, True, trainer_num, trainer_id)
 
@@ -0,0 +1,112 @@
+"""
+Benchmark of the vectorized parsing of criteo_reader.CriteoDataset, compares
+lines/s of parsing line by line and by chunks, for both the test() iterator
+and run_from_stdin(), and checks that the outputs are the same.
+
+    python benchmark_reader.py --data_file data/test_data/ev --num_lines 100000
+"""
+from __future__ import print_function
+
+import argparse
+import io
+import itertools
+import os
+import sys
+import time
+
+import paddle.fluid.incubate.data_generator as dg
+from criteo_reader import CriteoDataset
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '--data_file',
+        type=str,
+        default='data/test_data/ev',
+        help='Criteo file to parse')
+    parser.add_argument(
+        '--num_lines',
+        type=int,
+        default=100000,
+        help='Number of lines to parse')
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        default=1000,
+        help='Number of lines parsed at once')
+    return parser.parse_args()
+
+
+class LineDataset(CriteoDataset):
+    """CriteoDataset parsing every line in generate_sample"""
+
+    def generate_sample(self, line):
+        def data_iter():
+            feat_idx, feat_value, label = self._process_line(line)
+            yield [('feat_idx', feat_idx), ('feat_value', feat_value), ('label',
+                                                                        label)]
+
+        return data_iter
+
+    def generate_batch(self, samples):
+        return dg.MultiSlotDataGenerator.generate_batch(self, samples)
+
+
+def per_line_test(dataset, filename):
+    with open(filename, 'r') as fin:
+        for line in fin:
+            feat_idx, feat_value, label = dataset._process_line(line)
+            yield [feat_idx, feat_value, label]
+
+
+def run_stdin(run, lines):
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = io.StringIO(u''.join(lines)), io.StringIO()
+    try:
+        run()
+        return sys.stdout.getvalue()
+    finally:
+        sys.stdin, sys.stdout = stdin, stdout
+
+
+def timeit(func, num_lines):
+    start = time.time()
+    out = func()
+    return out, num_lines / (time.time() - start)
+
+
+def main(args):
+    with open(args.data_file, 'r') as fin:
+        lines = list(itertools.islice(fin, args.num_lines))
+    tmp_file = args.data_file + '.benchmark'
+    with open(tmp_file, 'w') as fout:
+        fout.write(''.join(lines))
+
+    dataset = CriteoDataset()
+    dataset.chunk_size_ = args.chunk_size
+    dataset.set_batch(args.chunk_size)
+
+    line_out, line_speed = timeit(
+        lambda: list(per_line_test(dataset, tmp_file)), len(lines))
+    chunk_out, chunk_speed = timeit(lambda: list(dataset.test([tmp_file])()),
+                                    len(lines))
+    os.remove(tmp_file)
+    assert line_out == chunk_out, 'test() outputs mismatch'
+    print('test():          line by line {:.0f} lines/s, chunked {:.0f} '
+          'lines/s, speedup {:.2f}x'.format(line_speed, chunk_speed,
+                                            chunk_speed / line_speed))
+
+    line_dataset = LineDataset()
+    line_out, line_speed = timeit(
+        lambda: run_stdin(line_dataset.run_from_stdin, lines), len(lines))
+    chunk_out, chunk_speed = timeit(
+        lambda: run_stdin(dataset.run_from_stdin, lines), len(lines))
+    assert line_out == chunk_out, 'run_from_stdin() outputs mismatch'
+    print('run_from_stdin(): line by line {:.0f} lines/s, chunked {:.0f} '
+          'lines/s, speedup {:.2f}x'.format(line_speed, chunk_speed,
+                                            chunk_speed / line_speed))
+
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -1,4 +1,5 @@
 import sys
+import numpy as np
 import paddle.fluid.incubate.data_generator as dg
 import pickle
 from collections import Counter
@@ -6,6 +7,13 @@ import os
 
 
 class CriteoDataset(dg.MultiSlotDataGenerator):
+    # number of lines parsed at once by test() and generate_batch()
+    chunk_size_ = 1000
+
+    def __init__(self):
+        super(CriteoDataset, self).__init__()
+        self.set_batch(self.chunk_size_)
+
     def _process_line(self, line):
         features = line.strip('\n').split('\t')
         feat_idx = []
@@ -16,25 +24,55 @@ class CriteoDataset(dg.MultiSlotDataGenerator):
         label = [int(features[0])]
         return feat_idx, feat_value, label
 
+    def _process_lines(self, lines):
+        """
+        Vectorized _process_line of many lines, returns the lists of
+        feat_idx, feat_value and label of all lines.
+        """
+        # all the fields are integers, parsed at once
+        ids = np.fromstring(
+            ''.join(lines), dtype='int64', sep=' ').reshape([len(lines), -1])
+        feat_idx = ids[:, 1:40].tolist()
+        feat_value = [[1.0] * 39 for _ in range(len(lines))]
+        label = ids[:, :1].tolist()
+        return feat_idx, feat_value, label
+
+    def _chunks(self, lines):
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == self.chunk_size_:
+                yield self._process_lines(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            yield self._process_lines(chunk)
+
     def test(self, filelist):
         def local_iter():
             for fname in filelist:
                 with open(fname.strip(), 'r') as fin:
-                    for line in fin:
-                        feat_idx, feat_value, label = self._process_line(line)
-                        yield [feat_idx, feat_value, label]
+                    for feat_idx, feat_value, label in self._chunks(fin):
+                        for sample in zip(feat_idx, feat_value, label):
+                            yield list(sample)
 
         return local_iter
 
     def generate_sample(self, line):
         def data_iter():
-            feat_idx, feat_value, label = self._process_line(line)
-            feature_name = ['feat_idx', 'feat_value', 'label']
-            yield [('feat_idx', feat_idx), ('feat_value', feat_value), ('label',
-                                                                        label)]
+            # the lines are parsed by batches in generate_batch
+            yield line
 
         return data_iter
 
+    def generate_batch(self, samples):
+        def local_iter():
+            feat_idx, feat_value, label = self._process_lines(samples)
+            for sample in zip(feat_idx, feat_value, label):
+                yield [('feat_idx', sample[0]), ('feat_value', sample[1]),
+                       ('label', sample[2])]
+
+        return local_iter
+
 
 if __name__ == '__main__':
     criteo_dataset = CriteoDataset()
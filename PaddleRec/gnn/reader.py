@@ -13,9 +13,9 @@
 #limitations under the License.
 
 import numpy as np
-import copy
 import random
 import pickle
+import paddle
 
 
 class Data():
@@ -26,72 +26,69 @@ class Data():
         self.input = list(zip(data[0], data[1]))
 
     def make_data(self, cur_batch, batch_size):
-        cur_batch = [list(e) for e in cur_batch]
-        max_seq_len = 0
-        for e in cur_batch:
-            max_seq_len = max(max_seq_len, len(e[0]))
-        last_id = []
-        for e in cur_batch:
-            last_id.append(len(e[0]) - 1)
-            e[0] += [0] * (max_seq_len - len(e[0]))
-
-        max_uniq_len = 0
-        for e in cur_batch:
-            max_uniq_len = max(max_uniq_len, len(np.unique(e[0])))
-
-        items, adj_in, adj_out, seq_index, last_index = [], [], [], [], []
-        mask, label = [], []
-
-        id = 0
-        for e in cur_batch:
-            node = np.unique(e[0])
-            items.append(node.tolist() + (max_uniq_len - len(node)) * [0])
-            adj = np.zeros((max_uniq_len, max_uniq_len))
-
-            for i in np.arange(len(e[0]) - 1):
-                if e[0][i + 1] == 0:
-                    break
-                u = np.where(node == e[0][i])[0][0]
-                v = np.where(node == e[0][i + 1])[0][0]
-                adj[u][v] = 1
-
-            u_deg_in = np.sum(adj, 0)
-            u_deg_in[np.where(u_deg_in == 0)] = 1
-            adj_in.append(np.divide(adj, u_deg_in).transpose())
-
-            u_deg_out = np.sum(adj, 1)
-            u_deg_out[np.where(u_deg_out == 0)] = 1
-            adj_out.append(np.divide(adj.transpose(), u_deg_out).transpose())
-
-            seq_index.append(
-                [np.where(node == i)[0][0] + id * max_uniq_len for i in e[0]])
-            last_index.append(
-                np.where(node == e[0][last_id[id]])[0][0] + id * max_uniq_len)
-            label.append(e[1] - 1)
-            mask.append([[1] * (last_id[id] + 1) + [0] *
-                         (max_seq_len - last_id[id] - 1)])
-            id += 1
-
-        items = np.array(items).astype("int64").reshape((batch_size, -1, 1))
-        seq_index = np.array(seq_index).astype("int32").reshape(
-            (batch_size, -1))
-        last_index = np.array(last_index).astype("int32").reshape(
-            (batch_size))
-        adj_in = np.array(adj_in).astype("float32").reshape(
+        num = len(cur_batch)
+        seq_len = np.array([len(e[0]) for e in cur_batch])
+        max_seq_len = seq_len.max()
+        seq_mask = np.arange(max_seq_len) < seq_len[:, None]
+        seqs = np.zeros((num, max_seq_len), dtype="int64")
+        seqs[seq_mask] = np.concatenate([e[0] for e in cur_batch])
+
+        # unique items of every padded session at once, by offsetting the
+        # items of session i by i * width
+        row = np.arange(num)[:, None]
+        width = seqs.max() + 1
+        uniq, inverse = np.unique(row * width + seqs, return_inverse=True)
+        uniq_row = uniq // width
+        row_start = np.searchsorted(uniq_row, np.arange(num))
+        uniq_pos = np.arange(len(uniq)) - row_start[uniq_row]
+        max_uniq_len = uniq_pos.max() + 1
+        items = np.zeros((num, max_uniq_len), dtype="int64")
+        items[uniq_row, uniq_pos] = uniq % width
+        node_index = uniq_pos[inverse].reshape((num, max_seq_len))
+
+        # edges between consecutive items until the first padding item
+        edge_mask = np.cumprod(seqs[:, 1:] != 0, axis=1).astype(bool)
+        adj = np.zeros((num, max_uniq_len, max_uniq_len))
+        edge_row = np.broadcast_to(row, edge_mask.shape)[edge_mask]
+        u = node_index[:, :-1][edge_mask]
+        v = node_index[:, 1:][edge_mask]
+        adj[edge_row, u, v] = 1
+
+        u_deg_in = np.sum(adj, 1)
+        u_deg_in[u_deg_in == 0] = 1
+        adj_in = np.divide(adj, u_deg_in[:, None, :]).transpose((0, 2, 1))
+
+        u_deg_out = np.sum(adj, 2)
+        u_deg_out[u_deg_out == 0] = 1
+        adj_out = np.divide(adj, u_deg_out[:, :, None])
+
+        seq_index = node_index + row * max_uniq_len
+        last_index = seq_index[np.arange(num), seq_len - 1]
+        label = [e[1] - 1 for e in cur_batch]
+
+        items = items.reshape((batch_size, -1, 1))
+        seq_index = seq_index.astype("int32").reshape((batch_size, -1))
+        last_index = last_index.astype("int32").reshape((batch_size))
+        adj_in = adj_in.astype("float32").reshape(
             (batch_size, max_uniq_len, max_uniq_len))
-        adj_out = np.array(adj_out).astype("float32").reshape(
+        adj_out = adj_out.astype("float32").reshape(
             (batch_size, max_uniq_len, max_uniq_len))
-        mask = np.array(mask).astype("float32").reshape((batch_size, -1, 1))
+        mask = seq_mask.astype("float32").reshape((batch_size, -1, 1))
         label = np.array(label).astype("int64").reshape((batch_size, 1))
         return zip(items, seq_index, last_index, adj_in, adj_out, mask, label)
 
-    def reader(self, batch_size, batch_group_size, train=True):
+    def reader(self, batch_size, batch_group_size, train=True, buf_size=0):
+        """
+        buf_size: number of batches built ahead in a background thread,
+            0 to build them in the reading thread
+        """
+
         def _reader():
             if self.shuffle:
                 random.shuffle(self.input)
             group_remain = self.length % batch_group_size
             for bg_id in range(0, self.length - group_remain, batch_group_size):
-                cur_bg = copy.deepcopy(self.input[bg_id:bg_id + batch_group_size])
+                cur_bg = self.input[bg_id:bg_id + batch_group_size]
                 if train:
                     cur_bg = sorted(cur_bg, key=lambda x: len(x[0]), reverse=True)
                 for i in range(0, batch_group_size, batch_size):
@@ -101,7 +98,7 @@ class Data():
             #deal with the last batch group
             if group_remain == 0:
                 return
-            remain_data = copy.deepcopy(self.input[-group_remain:])
+            remain_data = self.input[-group_remain:]
             if train:
                 remain_data = sorted(
                     remain_data, key=lambda x: len(x[0]), reverse=True)
@@ -112,6 +109,9 @@ class Data():
                 else:
                     cur_batch = remain_data[i:]
                     yield self.make_data(cur_batch, group_remain % batch_size)
+
+        if buf_size > 0:
+            return paddle.reader.buffered(_reader, buf_size)
         return _reader
 
 
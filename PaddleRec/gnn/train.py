@@ -56,6 +56,8 @@ def parse_args():
         '--use_cuda', type=int, default=0, help='whether to use gpu')
     parser.add_argument(
         '--use_parallel', type=int, default=1, help='whether to use parallel executor')
+    parser.add_argument(
+        '--buf_size', type=int, default=0, help='number of batches built ahead in a background thread, 0 to disable')
     parser.add_argument(
         '--enable_ce', action='store_true', help='If set, run the task with continuous evaluation logs.')
     return parser.parse_args()
@@ -117,7 +119,7 @@ def train():
     acc_sum = 0.0
     global_step = 0
     PRINT_STEP = 500
-    py_reader.decorate_paddle_reader(data_reader.reader(batch_size, batch_size * 20, True))
+    py_reader.decorate_paddle_reader(data_reader.reader(batch_size, batch_size * 20, True, args.buf_size))
     for i in range(args.epoch_num):
         epoch_sum = []
         py_reader.start()
@@ -0,0 +1,101 @@
+"""
+blocked top-k index over a word embedding table for offline evaluation
+"""
+from __future__ import print_function
+from multiprocessing.pool import ThreadPool
+import numpy as np
+
+
+class EmbeddingIndex(object):
+    """
+    Cosine top-k search over the rows of an embedding table.
+    emb: [vocab_size, emb_size] embedding table
+    query_block: number of queries scored at once
+    vocab_block: number of vocabulary rows scored at once, the memory used
+        by every worker is about query_block * vocab_block floats
+    num_threads: number of query blocks searched in parallel
+    """
+
+    def __init__(self, emb, query_block=1024, vocab_block=65536,
+                 num_threads=4):
+        self.emb = np.asarray(emb, dtype=np.float32)
+        norm = np.linalg.norm(self.emb, axis=1, keepdims=True)
+        self.emb_l2 = self.emb / np.maximum(norm, 1e-12)
+        self.query_block = query_block
+        self.vocab_block = vocab_block
+        self.num_threads = num_threads
+
+    def _search_block(self, queries, k):
+        top_val = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        top_idx = np.zeros((len(queries), 0), dtype=np.int64)
+        rows = np.arange(len(queries))[:, None]
+        for begin in range(0, len(self.emb_l2), self.vocab_block):
+            block = self.emb_l2[begin:begin + self.vocab_block]
+            dist = np.dot(queries, block.T)
+            if dist.shape[1] > k:
+                part = np.argpartition(-dist, k - 1, axis=1)[:, :k]
+                dist = dist[rows, part]
+            else:
+                part = np.broadcast_to(
+                    np.arange(dist.shape[1]), dist.shape)
+            top_val = np.concatenate([top_val, dist], axis=1)
+            top_idx = np.concatenate([top_idx, part + begin], axis=1)
+            if top_val.shape[1] > k:
+                part = np.argpartition(-top_val, k - 1, axis=1)[:, :k]
+                top_val, top_idx = top_val[rows, part], top_idx[rows, part]
+        order = np.argsort(-top_val, axis=1, kind='mergesort')
+        return top_val[rows, order], top_idx[rows, order]
+
+    def search(self, queries, k):
+        """
+        Top-k rows of the normalized table by inner product with queries,
+        returns values and ids of shape [num_queries, k] sorted by value.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, len(self.emb_l2))
+        blocks = [
+            queries[begin:begin + self.query_block]
+            for begin in range(0, len(queries), self.query_block)
+        ]
+        if len(blocks) == 0:
+            return (np.zeros((0, k), dtype=np.float32),
+                    np.zeros((0, k), dtype=np.int64))
+        if self.num_threads > 1 and len(blocks) > 1:
+            # numpy releases the GIL in np.dot and argpartition
+            pool = ThreadPool(min(self.num_threads, len(blocks)))
+            results = pool.map(lambda q: self._search_block(q, k), blocks)
+            pool.close()
+            pool.join()
+        else:
+            results = [self._search_block(q, k) for q in blocks]
+        return (np.concatenate([r[0] for r in results]),
+                np.concatenate([r[1] for r in results]))
+
+    def analogy(self, a, b, c, k=4):
+        """
+        Top-k words of emb[b] - emb[a] + emb[c], as net.infer_network.
+        """
+        target = self.emb[b] - self.emb[a] + self.emb[c]
+        return self.search(target, k)
+
+    def similar(self, ids, k=10):
+        """
+        Top-k most cosine similar words of the words ids.
+        """
+        return self.search(self.emb_l2[ids], k)
+
+
+def analogy_accuracy(pred, label, input_words):
+    """
+    Number of analogies whose first predicted word not in the question is
+    the label, same metric as infer.py.
+    pred: [N, k] predicted ids, label: [N] ids, input_words: [N, 3] ids
+    """
+    pred = np.asarray(pred)
+    in_input = (pred[:, :, None] == np.asarray(input_words)[:, None, :]).any(
+        axis=2)
+    first = np.argmax(~in_input, axis=1)
+    found = (~in_input).any(axis=1)
+    correct = found & (
+        pred[np.arange(len(pred)), first] == np.asarray(label).reshape(-1))
+    return int(correct.sum())
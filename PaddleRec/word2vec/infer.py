@@ -10,6 +10,7 @@ import paddle.fluid as fluid
 import paddle
 import net
 import utils
+from embedding_index import EmbeddingIndex, analogy_accuracy
 
 
 def parse_args():
@@ -31,6 +32,27 @@ def parse_args():
         required=False,
         default=False,
         help='infer by step')
+    parser.add_argument(
+        '--infer_index',
+        action='store_true',
+        required=False,
+        default=False,
+        help='infer by epoch with the offline embedding index')
+    parser.add_argument(
+        '--num_threads',
+        type=int,
+        default=4,
+        help='number of query blocks searched in parallel by the index')
+    parser.add_argument(
+        '--query_block',
+        type=int,
+        default=1024,
+        help='number of queries scored at once by the index')
+    parser.add_argument(
+        '--vocab_block',
+        type=int,
+        default=65536,
+        help='number of words scored at once by the index')
     parser.add_argument(
         '--test_dir', type=str, default='test_data', help='test file address')
     parser.add_argument(
@@ -117,6 +139,54 @@ def infer_epoch(args, vocab_size, test_reader, use_cuda, i2w):
                       (epoch, 1.0 * accum_num / accum_num_sum))
 
 
+def load_analogies(test_reader):
+    """ all the analogy questions of test_reader as int64 arrays """
+    questions, label, input_word = [], [], []
+    for data in test_reader():
+        for dat in data:
+            questions.append([dat[0][0], dat[1][0], dat[2][0]])
+            label.append(dat[3][0])
+            input_word.append(dat[4])
+    return (np.array(questions, dtype="int64").reshape(-1, 3),
+            np.array(label, dtype="int64"),
+            np.array(input_word, dtype="int64").reshape(-1, 3))
+
+
+def infer_index(args, vocab_size, test_reader, use_cuda, i2w):
+    """ inference function, loads only the embedding table of every pass
+    and answers all the analogies with EmbeddingIndex """
+    place = fluid.CUDAPlace(0) if use_cuda else fluid.CPUPlace()
+    exe = fluid.Executor(place)
+    emb_size = args.emb_size
+    questions, label, input_word = load_analogies(test_reader)
+    main_program = fluid.Program()
+    with fluid.program_guard(main_program):
+        net.infer_network(vocab_size, emb_size)
+    emb_var = main_program.global_block().var("emb")
+    for epoch in range(start_index, last_index + 1):
+        model_path = model_dir + "/pass-" + str(epoch)
+        t0 = time.time()
+        scope = fluid.Scope()
+        with fluid.scope_guard(scope):
+            fluid.io.load_vars(
+                executor=exe,
+                dirname=model_path,
+                main_program=main_program,
+                vars=[emb_var])
+            emb = np.array(scope.find_var("emb").get_tensor())
+        index = EmbeddingIndex(
+            emb,
+            query_block=args.query_block,
+            vocab_block=args.vocab_block,
+            num_threads=args.num_threads)
+        _, pred = index.analogy(questions[:, 0], questions[:, 1],
+                                questions[:, 2], 4)
+        accum_num = analogy_accuracy(pred, label, input_word)
+        print("epoch:%d \t acc:%.3f \t time:%.2fs" %
+              (epoch, 1.0 * accum_num / max(len(label), 1),
+               time.time() - t0))
+
+
 def infer_step(args, vocab_size, test_reader, use_cuda, i2w):
     """ inference function """
     place = fluid.CUDAPlace(0) if use_cuda else fluid.CPUPlace()
@@ -197,7 +267,14 @@ if __name__ == "__main__":
     vocab_size, test_reader, id2word = utils.prepare_data(
         test_dir, dict_path, batch_size=batch_size)
     print("vocab_size:", vocab_size)
-    if args.infer_step:
+    if args.infer_index:
+        infer_index(
+            args,
+            vocab_size,
+            test_reader=test_reader,
+            use_cuda=use_cuda,
+            i2w=id2word)
+    elif args.infer_step:
         infer_step(
             args,
             vocab_size,
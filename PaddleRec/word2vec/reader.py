@@ -30,6 +30,39 @@ class NumpyRandomInt(object):
         return result
 
 
+class AliasTable(object):
+    """
+    Alias table of a discrete distribution, samples in O(1) per sample.
+    weights: unnormalized probabilities of the ids 0 .. len(weights) - 1
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        size = len(weights)
+        prob = weights * size / weights.sum()
+        alias = np.zeros(size, dtype=np.int64)
+        small = [i for i in range(size) if prob[i] < 1.0]
+        large = [i for i in range(size) if prob[i] >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            alias[s] = l
+            prob[l] -= 1.0 - prob[s]
+            if prob[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # the remaining ones are 1.0 up to rounding errors
+        for i in small + large:
+            prob[i] = 1.0
+        self.prob = prob
+        self.alias = alias
+
+    def sample(self, shape):
+        idx = np.random.randint(0, len(self.prob), shape)
+        keep = np.random.random_sample(shape) < self.prob[idx]
+        return np.where(keep, idx, self.alias[idx])
+
+
 class Word2VecReader(object):
     def __init__(self,
                  dict_path,
@@ -37,8 +70,12 @@ class Word2VecReader(object):
                  filelist,
                  trainer_id,
                  trainer_num,
-                 window_size=5):
+                 window_size=5,
+                 subsample=0.0,
+                 chunk_size=10000):
         self.window_size_ = window_size
+        # number of target words turned into pairs at once by train_batches
+        self.chunk_size_ = chunk_size
         self.data_path_ = data_path
         self.filelist = filelist
         self.trainer_id = trainer_id
@@ -69,6 +106,18 @@ class Word2VecReader(object):
 
         self.random_generator = NumpyRandomInt(1, self.window_size_ + 1)
 
+        # probability to keep each word when subsampling the frequent words,
+        # same formula as the --downsample of preprocess.py
+        self.keep_probs_ = None
+        if subsample > 0:
+            freqs = np.array(self.id_frequencys)
+            self.keep_probs_ = np.minimum(
+                (np.sqrt(freqs / subsample) + 1) * subsample / freqs, 1.0)
+        # context offsets of the largest window, the window sizes drawn by
+        # NumpyRandomInt are in [1, window_size + 1]
+        offsets = np.arange(1, self.window_size_ + 2)
+        self.offsets_ = np.concatenate([-offsets[::-1], offsets])
+
     def get_context_words(self, words, idx):
         """
         Get the context word list of target word.
@@ -104,3 +153,63 @@ class Word2VecReader(object):
                         count += 1
 
         return nce_reader
+
+    def skip_gram_pairs(self, word_ids):
+        """
+        Vectorized get_context_words of all the words of a line, yields the
+        arrays of (target, context) ids chunk by chunk, in the same order
+        as train().
+        word_ids: int64 array of the word ids of a line
+        """
+        if self.keep_probs_ is not None:
+            keep = np.random.random_sample(
+                len(word_ids)) < self.keep_probs_[word_ids]
+            word_ids = word_ids[keep]
+        num = len(word_ids)
+        for begin in range(0, num, self.chunk_size_):
+            end = min(begin + self.chunk_size_, num)
+            windows = np.random.randint(1, self.window_size_ + 2, end - begin)
+            context = np.arange(begin, end)[:, None] + self.offsets_
+            valid = (np.abs(self.offsets_) <= windows[:, None]) & (
+                context >= 0) & (context < num)
+            rows, cols = np.nonzero(valid)
+            yield word_ids[begin + rows], word_ids[context[rows, cols]]
+
+    def train_batches(self, batch_size, neg_num, neg_weights):
+        """
+        Batched train(), yields [input_word, true_label, neg_label] int64
+        arrays of shape [batch_size, 1], [batch_size, 1] and
+        [batch_size, neg_num], negative words are drawn for every pair from
+        an alias table of neg_weights. The last incomplete batch is dropped.
+        """
+        alias_table = AliasTable(neg_weights)
+
+        def nce_reader():
+            targets = np.zeros(0, dtype=np.int64)
+            contexts = np.zeros(0, dtype=np.int64)
+            for file in self.filelist:
+                with io.open(
+                        self.data_path_ + "/" + file, 'r',
+                        encoding='utf-8') as f:
+                    logger.info("running data in {}".format(self.data_path_ +
+                                                            "/" + file))
+                    count = 1
+                    for line in f:
+                        if self.trainer_id == count % self.trainer_num:
+                            word_ids = np.array(line.split(), dtype=np.int64)
+                            for t, c in self.skip_gram_pairs(word_ids):
+                                targets = np.concatenate([targets, t])
+                                contexts = np.concatenate([contexts, c])
+                                num = len(targets) // batch_size * batch_size
+                                for i in range(0, num, batch_size):
+                                    yield [
+                                        targets[i:i + batch_size, None],
+                                        contexts[i:i + batch_size, None],
+                                        alias_table.sample(
+                                            (batch_size, neg_num))
+                                    ]
+                                targets = targets[num:]
+                                contexts = contexts[num:]
+                        count += 1
+
+        return nce_reader
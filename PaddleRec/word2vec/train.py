@@ -61,6 +61,13 @@ def parse_args():
         default='models',
         help='The path for model to store (default: models)')
     parser.add_argument('--nce_num', type=int, default=5, help='nce_num')
+    parser.add_argument(
+        '--subsample',
+        type=float,
+        default=0.0,
+        help="threshold of the online subsampling of frequent words, "
+        "0 to disable it when the corpus is downsampled by preprocess.py "
+        "(default: 0)")
     parser.add_argument(
         '--embedding_size',
         type=int,
@@ -81,33 +88,15 @@ def parse_args():
     return parser.parse_args()
 
 
-def convert_python_to_tensor(weight, batch_size, sample_reader):
+def convert_python_to_tensor(batch_reader):
     def __reader__():
-        cs = np.array(weight).cumsum()
-        result = [[], []]
-        for sample in sample_reader():
-            for i, fea in enumerate(sample):
-                result[i].append(fea)
-            if len(result[0]) == batch_size:
-                tensor_result = []
-                for tensor in result:
-                    t = fluid.Tensor()
-                    dat = np.array(tensor, dtype='int64')
-                    if len(dat.shape) > 2:
-                        dat = dat.reshape((dat.shape[0], dat.shape[2]))
-                    elif len(dat.shape) == 1:
-                        dat = dat.reshape((-1, 1))
-                    t.set(dat, fluid.CPUPlace())
-                    tensor_result.append(t)
-                tt = fluid.Tensor()
-                neg_array = cs.searchsorted(np.random.sample(args.nce_num))
-                neg_array = np.tile(neg_array, batch_size)
-                tt.set(
-                    neg_array.reshape((batch_size, args.nce_num)),
-                    fluid.CPUPlace())
-                tensor_result.append(tt)
-                yield tensor_result
-                result = [[], []]
+        for batch in batch_reader():
+            tensor_result = []
+            for dat in batch:
+                t = fluid.Tensor()
+                t.set(dat, fluid.CPUPlace())
+                tensor_result.append(t)
+            yield tensor_result
 
     return __reader__
 
@@ -116,7 +105,8 @@ def train_loop(args, train_program, reader, py_reader, loss, trainer_id,
                weight):
 
     py_reader.decorate_tensor_provider(
-        convert_python_to_tensor(weight, args.batch_size, reader.train()))
+        convert_python_to_tensor(
+            reader.train_batches(args.batch_size, args.nce_num, weight)))
 
     place = fluid.CPUPlace()
     exe = fluid.Executor(place)
@@ -195,7 +185,8 @@ def train(args):
 
     filelist = GetFileList(args.train_data_dir)
     word2vec_reader = reader.Word2VecReader(args.dict_path, args.train_data_dir,
-                                            filelist, 0, 1)
+                                            filelist, 0, 1,
+                                            subsample=args.subsample)
 
     logger.info("dict_size: {}".format(word2vec_reader.dict_size))
     np_power = np.power(np.array(word2vec_reader.id_frequencys), 0.75)